@@ -2,7 +2,7 @@
 Configuració de l'Agent OCR
 """
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional, Union
 
 
 class Settings(BaseSettings):
@@ -17,18 +17,107 @@ class Settings(BaseSettings):
     google_cloud_vision_enabled: bool = True
     google_cloud_credentials_json: Optional[str] = None
     google_cloud_project_id: Optional[str] = None
+    google_cloud_vision_fake: bool = False  # client fals local (tests / dev sense credencials)
+    vision_async_enabled: bool = True       # ImageAnnotatorAsyncClient (fallback: threadpool)
+
+    # Micro-batching Vision (batch_annotate_images)
+    vision_batch_enabled: bool = False
+    vision_batch_window_ms: float = 10
+    vision_batch_max_size: int = 16               # límit de Vision
+    vision_batch_max_bytes: int = 10 * 1024 * 1024  # mida màxima de la petició agrupada
+
+    # Hedging de crides Vision (retalla la cua de latència; gasta crèdits extra)
+    vision_hedge_enabled: bool = False
+    vision_hedge_percentile: float = 95       # espera = percentil de latència observat
+    vision_hedge_min_delay_ms: float = 300
+    vision_hedge_max_delay_ms: float = 5000
+    vision_hedge_budget_ratio: float = 0.05   # màxim de crides extra (5% de les primàries)
+
+    # Circuit breaker de Vision
+    vision_breaker_enabled: bool = True
+    vision_breaker_failure_rate: float = 0.5  # sobre les últimes 50 crides
+    vision_breaker_min_requests: int = 20
+    vision_breaker_open_seconds: float = 30
+    vision_breaker_fallback_tesseract: bool = True  # amb el circuit obert; si no, 503
 
     # Tesseract
     tesseract_enabled: bool = True
     tesseract_lang: str = "spa+cat+eng"
+    tesseract_concurrency: int = 2            # OCR locals alhora (CPU)
+    tesseract_timeout_seconds: float = 10     # temps màxim del nivell Tesseract abans d'escalar
+
+    # Escala de motors: Tesseract local primer; Vision (1 crèdit) només si el
+    # resultat no supera Phase 2 (camps mínims, cap error crític, confiança)
+    ocr_tesseract_first: bool = True
+    ocr_tesseract_first_types: List[str] = ["dni", "permis", "nif"]
+    ocr_tesseract_min_confidence: float = 70  # confianza_global mínima per acceptar Tesseract
 
     # API Security
     api_key_enabled: bool = True
     api_key: Optional[str] = None
+    # Diverses claus (JSON): ["clau", {"name", "key" | "key_sha256", "rate_per_minute",
+    #                                  "burst", "daily_vision_quota", "max_in_flight"}]
+    api_keys: List[Union[str, dict]] = []
+    api_keys_usage_path: Optional[str] = "data/api_keys_usage.json"  # snapshot de l'ús diari
+    api_keys_snapshot_seconds: int = 60
 
     # Limits
     max_file_size_mb: int = 10
-    rate_limit_per_minute: int = 60
+    rate_limit_per_minute: int = 60  # per client (API key autenticada o IP); 0 = sense límit
+
+    # Control d'admissió (load shedding)
+    admission_enabled: bool = True
+    admission_max_in_flight: int = 32           # peticions OCR processant-se alhora
+    admission_max_queue: int = 64               # peticions esperant slot
+    admission_queue_timeout_seconds: float = 5  # espera màxima a la cua abans de 503
+
+    # Orientació 0/90/180/270 del pre-processament: "local" (Tesseract OSD o
+    # geometria, 0 crèdits), "vision" (sonda de 4 crides Vision) o "off"
+    preprocess_orientation: str = "local"
+    # Pipelines d'etapes per tipus de document (app.services.preprocess_pipeline):
+    # {"permis": ["resize", "deskew", "clahe"], "dni:aggressive": [...]}
+    preprocess_pipelines: dict[str, List[str]] = {}
+    # Etapa denoise (mode aggressive): "lite" (bilateral a la luminància, ~0,1 s)
+    # o "full" (fastNlMeansDenoisingColored, segons a 2000 px)
+    preprocess_denoise: str = "lite"
+    # Pool propi del pre-processament (fora de l'event loop): "thread" o "process"
+    preprocess_executor: str = "thread"
+    preprocess_workers: int = 2
+    # Tasques de pre-processament pendents (cua + en curs) abans de respondre 503
+    preprocess_max_pending: int = 8
+    # Pressupost de píxels per imatge (amplada x alçada de la capçalera): per
+    # sobre, 413 abans de descodificar (bombes de descompressió)
+    max_image_pixels: int = 64_000_000
+
+    # Escalfament abans d'acceptar trànsit (/ready): canal gRPC de Vision, parsers, cv2
+    warmup_enabled: bool = True
+    warmup_timeout_seconds: float = 10
+
+    # Mètriques (format Prometheus a /metrics)
+    metrics_enabled: bool = False
+
+    # Lots (/ocr/batch)
+    batch_max_items: int = 50
+    batch_concurrency: int = 8  # documents processant-se alhora (global, tots els lots)
+
+    # Treballs asíncrons (/ocr/jobs): cua SQLite + workers en procés
+    jobs_enabled: bool = False
+    jobs_db_path: str = "data/jobs.sqlite3"
+    jobs_workers: int = 4
+    jobs_max_pending: int = 1000
+    jobs_retention_hours: int = 24            # resultats consultables després d'acabar
+    jobs_encryption_key: Optional[str] = None  # Fernet; xifra les imatges pendents
+
+    # Cache de resultats (per hash de contingut, en procés)
+    cache_enabled: bool = False
+    cache_ttl_seconds: int = 3600
+    cache_max_entries: int = 256
+
+    # Magatzem persistent de text OCR (re-parseig sense nous crèdits Vision)
+    ocr_store_enabled: bool = False
+    ocr_store_path: str = "data/ocr_store.sqlite3"
+    ocr_store_encryption_key: Optional[str] = None  # clau Fernet (base64, 32 bytes)
+    ocr_store_retention_days: int = 90               # 0 = sense caducitat
 
     class Config:
         env_file = ".env"
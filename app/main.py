@@ -3,14 +3,32 @@ OCR Agent - API FastAPI
 
 Agent independent per OCR de documents (DNI, Permís de Circulació, etc.)
 """
+import asyncio
 import time
 import logging
 import json
+from contextlib import asynccontextmanager
+
+_IMPORT_T0 = time.perf_counter()
+
 from fastapi import FastAPI, Request, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.config import settings
-from app.routes import dni, permis, nif
+from app.routes import dni, permis, nif, auto, batch, jobs
+from app.services.admission import admission_controller, Overloaded, request_client
+from app.services.api_keys import api_key_registry, current_api_client
+from app.services.document_pipeline import max_request_bytes
+from app.services.job_queue import job_queue
+from app.services.google_vision_service import google_vision_service
+from app.services.tesseract_service import tesseract_service
+from app.services.preprocess_executor import preprocess_executor
+from app.services.startup import startup
+from app.services.warmup import warm_image_processing, warm_parsers
+
+
+def _import_image_processor() -> None:
+    from app.services import image_processor  # noqa: F401  (cv2, numpy, PIL)
 
 
 class _JsonFormatter(logging.Formatter):
@@ -42,13 +60,49 @@ _configure_logging()
 log = logging.getLogger("ocr.request")
 # from app.routes import compare  # TODO: Implementar més endavant
 
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicialització dels motors, ús diari de les API keys i workers de la cua de treballs."""
+    async def warm_vision() -> None:
+        await google_vision_service.warm_up(timeout=settings.warmup_timeout_seconds)
+
+    startup.start(
+        {
+            "google_vision": google_vision_service.initialize,
+            "tesseract": tesseract_service.initialize,
+            "image_processor": _import_image_processor,
+        },
+        warmup={
+            "vision_channel": warm_vision,
+            "parsers": warm_parsers,
+            "opencv": warm_image_processing,
+        } if settings.warmup_enabled else None,
+    )
+    api_key_registry.load_snapshot()
+    snapshots = asyncio.create_task(
+        api_key_registry.run_snapshots(settings.api_keys_snapshot_seconds)
+    ) if api_key_registry.snapshot_path and api_key_registry.clients else None
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await startup.stop()
+    tesseract_service.close()
+    preprocess_executor.close()
+    if snapshots:
+        snapshots.cancel()
+        api_key_registry.save_snapshot()
+
+
 # Crear app
 app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     description="Agent OCR per documents espanyols (DNI, Permís de Circulació)",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # CORS
@@ -61,6 +115,53 @@ app.add_middleware(
 )
 
 
+# Middleware d'admissió: rebutja ràpid (429/503 + Retry-After) quan el servei està saturat
+@app.middleware("http")
+async def admission(request: Request, call_next):
+    """Limita les peticions OCR en vol i aplica el rate limit per client."""
+    if request.method != "POST" or not request.url.path.startswith("/ocr/"):
+        return await call_next(request)
+    # /ocr/batch s'admet a la ruta: un token i un slot per document, no per lot
+    if request.url.path == "/ocr/batch":
+        return await call_next(request)
+
+    # Client autenticat: el seu token bucket; si no, límit global per API key o IP
+    client_id, rate_check = request_client(request, current_api_client.get())
+    try:
+        async with admission_controller.admit(client_id, rate_check):
+            return await call_next(request)
+    except Overloaded as e:
+        return JSONResponse(
+            status_code=e.status_code,
+            content={"detail": e.detail},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+# Middleware de mida: rebutja uploads massa grans abans de llegir (i guardar) el cos
+@app.middleware("http")
+async def limit_body_size(request: Request, call_next):
+    """
+    413 immediat si el Content-Length supera el màxim de la ruta. Sense
+    Content-Length (cos chunked) el límit no es pot comprovar abans que
+    Starlette guardi els fitxers: 411.
+    """
+    if request.method == "POST" and request.url.path.startswith("/ocr/"):
+        max_files = {"/ocr/batch": settings.batch_max_items, "/ocr/dni/complet": 2}.get(request.url.path, 1)
+        length = request.headers.get("content-length")
+        if not (length and length.isdigit()):
+            return JSONResponse(
+                status_code=411,
+                content={"detail": "Cal la capçalera Content-Length."},
+            )
+        if int(length) > max_request_bytes(max_files):
+            return JSONResponse(
+                status_code=413,
+                content={"detail": "Petició massa gran."},
+            )
+    return await call_next(request)
+
+
 # Middleware de latència i logging de peticions
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -87,7 +188,7 @@ async def validate_api_key(request: Request, call_next):
     Valida l'API key en cada petició (excepte endpoints públics)
     """
     # Endpoints públics (sense autenticació)
-    public_paths = ["/", "/health"]
+    public_paths = ["/", "/health", "/ready", "/metrics"]
 
     # Si l'endpoint és públic, permetre accés
     if request.url.path in public_paths:
@@ -97,32 +198,46 @@ async def validate_api_key(request: Request, call_next):
     if not settings.api_key_enabled:
         return await call_next(request)
 
-    # Comprovar que hi ha API key configurada
-    if not settings.api_key:
+    # Comprovar que hi ha API keys configurades (API_KEY o API_KEYS)
+    if not api_key_registry.clients:
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"detail": "API key no configurada al servidor"}
         )
 
-    # Obtenir API key del header
-    api_key = request.headers.get("X-API-Key")
-
-    # Validar API key
-    if not api_key or api_key != settings.api_key:
+    # Validar API key del header
+    api_client = api_key_registry.authenticate(request.headers.get("X-API-Key"))
+    if api_client is None:
         return JSONResponse(
             status_code=status.HTTP_401_UNAUTHORIZED,
             content={"detail": "API key invàlida o no proporcionada"},
             headers={"WWW-Authenticate": "ApiKey"}
         )
 
-    # API key vàlida, continuar amb la petició
-    return await call_next(request)
+    # Límit de peticions simultànies del client
+    if not api_client.try_enter():
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": "Massa peticions simultànies per aquesta API key."},
+            headers={"Retry-After": "1"},
+        )
+
+    # API key vàlida, continuar amb la petició (client disponible per admissió i quotes)
+    token = current_api_client.set(api_client)
+    try:
+        return await call_next(request)
+    finally:
+        current_api_client.reset(token)
+        api_client.leave()
 
 
 # Routes
 app.include_router(dni.router, prefix="/ocr", tags=["DNI"])
 app.include_router(permis.router, prefix="/ocr", tags=["Permís"])
 app.include_router(nif.router, prefix="/ocr", tags=["NIF"])
+app.include_router(auto.router, prefix="/ocr", tags=["Auto"])
+app.include_router(batch.router, prefix="/ocr", tags=["Lots"])
+app.include_router(jobs.router, prefix="/ocr", tags=["Treballs"])
 # app.include_router(compare.router, prefix="/ocr", tags=["Comparació"])  # TODO: Implementar més endavant
 
 
@@ -132,16 +247,85 @@ async def root():
     return {"status": "ok"}
 
 
+def _engines_available() -> dict:
+    """
+    Disponibilitat dels motors segons l'estat ja inicialitzat: mai no dispara
+    initialize() (bloquejant, sota lock) des de l'event loop. Un motor encara
+    no inicialitzat compta com a no disponible.
+    """
+    return {
+        "tesseract": tesseract_service.initialized and tesseract_service.is_available(),
+        "google_vision": google_vision_service.initialized and google_vision_service.is_available(),
+    }
+
+
 @app.get("/health")
 async def health():
     """Endpoint de health check"""
-    from app.services.tesseract_service import tesseract_service
-    from app.services.google_vision_service import google_vision_service
+    from app.services.result_cache import result_cache
 
     return {
         "status": "healthy",
-        "services": {
-            "tesseract": tesseract_service.is_available(),
-            "google_vision": google_vision_service.is_available()
-        }
+        "services": _engines_available(),
+        "tesseract": tesseract_service.stats(),
+        "preprocess": preprocess_executor.stats(),
+        "cache": result_cache.stats(),
+        "vision_batch": google_vision_service.batcher.stats() if google_vision_service.batcher else None,
+        "vision": {
+            "hedge": google_vision_service.hedger.stats(),
+            "breaker": google_vision_service.breaker.stats(),
+        },
+        "admission": admission_controller.stats(),
+        "jobs": job_queue.stats(),
+        "startup": startup.stats(),
     }
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 només quan els motors s'han inicialitzat i els camins
+    de petició s'han escalfat (canal gRPC, parsers, OpenCV). /health és el liveness.
+    """
+    if not startup.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "startup": startup.stats()})
+    if not any(_engines_available().values()):
+        return JSONResponse(status_code=503, content={"status": "unavailable", "startup": startup.stats()})
+    return {"status": "ready", "startup": startup.stats()}
+
+
+if settings.metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Indicadors en format Prometheus (autoscaler / scraping)."""
+        from fastapi.responses import PlainTextResponse
+        from app.services.result_cache import result_cache
+
+        adm = admission_controller.stats()
+        cache = result_cache.stats()
+        lines = [
+            "# TYPE ocr_in_flight gauge",
+            f"ocr_in_flight {adm['in_flight']}",
+            "# TYPE ocr_queue_depth gauge",
+            f"ocr_queue_depth {adm['queued']}",
+            "# TYPE ocr_capacity gauge",
+            f"ocr_capacity {adm['max_in_flight']}",
+            "# TYPE ocr_utilization gauge",
+            f"ocr_utilization {adm['utilization']}",
+            "# TYPE ocr_admitted_total counter",
+            f"ocr_admitted_total {adm['admitted_total']}",
+            "# TYPE ocr_rejected_total counter",
+            *(f'ocr_rejected_total{{reason="{reason}"}} {count}'
+              for reason, count in adm["rejected_total"].items()),
+            "# TYPE ocr_cache_hits_total counter",
+            f"ocr_cache_hits_total {cache['hits']}",
+            "# TYPE ocr_cache_misses_total counter",
+            f"ocr_cache_misses_total {cache['misses']}",
+            "# TYPE ocr_vision_credits_today gauge",
+            *(f'ocr_vision_credits_today{{client="{c.name}"}} {c.usage()["vision_credits"]}'
+              for c in api_key_registry.clients),
+        ]
+        return PlainTextResponse("\n".join(lines) + "\n")
+
+
+startup.record_import(time.perf_counter() - _IMPORT_T0)
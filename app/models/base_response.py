@@ -46,6 +46,9 @@ class MetaInfo(BaseModel):
     """Informació de transport (backward-compat amb success/message anterior)."""
     success: bool
     message: Optional[str] = None
+    cached: bool = False  # True si la resposta ve del cache de resultats
+    classification_confidence: Optional[float] = None  # 0-100, només /ocr/auto
+    preprocessing: Optional[dict] = None  # {"pipeline", "stages": {etapa: ms}, "total_ms"} si preprocess=true
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,32 @@
+"""
+Model de resposta per /ocr/batch — un resultat v1 per ítem
+"""
+from pydantic import BaseModel, Field
+from typing import Optional, List, Union, Annotated
+from app.models.dni_response import DNIValidationResponse
+from app.models.permis_response import PermisValidationResponse
+from app.models.nif_response import NIFValidationResponse
+
+DocumentResult = Annotated[
+    Union[DNIValidationResponse, PermisValidationResponse, NIFValidationResponse],
+    Field(discriminator="tipo_documento"),
+]
+
+
+class BatchItemResult(BaseModel):
+    """Resultat d'un document del lot (resposta v1 o error HTTP equivalent)."""
+    index: int                                   # posició dins el lot (ordre d'entrada)
+    filename: Optional[str] = None
+    doc_type: str                                # dni | permis | nif (tal com s'ha demanat)
+    status_code: int                             # 200 o codi HTTP que hauria retornat la ruta individual
+    result: Optional[DocumentResult] = None
+    error: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    """Resposta de l'endpoint /ocr/batch."""
+    total: int
+    ok: int
+    failed: int
+    durada_ms: int
+    items: List[BatchItemResult] = []
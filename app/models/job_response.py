@@ -0,0 +1,22 @@
+"""
+Model de resposta per /ocr/jobs — treballs OCR asíncrons
+"""
+from pydantic import BaseModel
+from typing import Optional, Literal
+from app.models.batch_response import DocumentResult
+
+JobStatus = Literal["queued", "running", "done", "failed"]
+
+
+class JobResponse(BaseModel):
+    """Estat d'un treball. `result` (contracte v1) només quan status = done."""
+    job_id: str
+    doc_type: str
+    status: JobStatus
+    attempts: int = 0
+    created_at: float                     # timestamp UNIX
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    status_code: Optional[int] = None     # 200 o codi HTTP que hauria retornat la ruta síncrona
+    result: Optional[DocumentResult] = None
+    error: Optional[str] = None
@@ -0,0 +1,68 @@
+"""
+Classificació del tipus de document a partir del text OCR (Python pur, 0 crèdits)
+
+Puntua el text contra les paraules clau i patrons que ja fan servir els
+parsers (capçaleres, MRZ, codis de camp DGT, CIF...) i retorna el tipus amb
+més punts. Permet /ocr/auto: una sola passada OCR per document encara que el
+client no sàpiga de quin tipus és.
+"""
+import re
+from typing import Optional
+
+# (patró, pes) per tipus. Pes 3 = identifica el document; 1 = indici feble.
+_SIGNALS: dict[str, list[tuple[re.Pattern, int]]] = {
+    "dni": [
+        (re.compile(r"DOCUMENTO\s+NACIONAL|DOCUMENT\s+NACIONAL"), 3),
+        (re.compile(r"^ID[A-Z<]{3}", re.MULTILINE), 3),                  # MRZ línia 1 (IDESP...)
+        (re.compile(r"^[A-Z<]+<<[A-Z<]+$", re.MULTILINE), 2),            # MRZ línia 3 (COGNOMS<<NOM)
+        (re.compile(r"\bAPELLIDOS\b|\bCOGNOMS\b"), 2),
+        (re.compile(r"\bSEXO\b|\bSEXE\b"), 1),
+        (re.compile(r"\bNACIONALIDAD\b|\bNACIONALITAT\b"), 1),
+        (re.compile(r"\bVALIDEZ\b|\bVALIDESA\b"), 1),
+        (re.compile(r"HIJO/A\s+DE|FILL/A\s+DE|LUGAR\s+DE\s+NACIMIENTO|LLOC\s+DE\s+NAIXEMENT"), 2),
+        (re.compile(r"\b\d{8}[A-Z]\b|\b[XYZ]\d{7}[A-Z]\b"), 1),          # DNI/NIE
+    ],
+    "permis": [
+        (re.compile(r"PERMISO\s+DE\s+CIRCULACI|PERM[IÍ]S\s+DE\s+CIRCULACI"), 3),
+        (re.compile(r"\bD\.\s*[123]\b"), 2),                             # marca / variant / model
+        (re.compile(r"\bC\.\s*1\.\s*[123]\b"), 2),                       # titular
+        (re.compile(r"\bP\.\s*[1-5]\b"), 1),                             # cilindrada, potència...
+        (re.compile(r"\bBASTIDOR\b|\bCILINDRADA\b"), 2),
+        (re.compile(r"JEFATURA|TR[AÁ]FICO|\bDGT\b"), 2),
+        (re.compile(r"\b[A-HJ-NPR-Z0-9]{17}\b"), 1),                     # VIN
+        (re.compile(r"\b\d{4}[BCDFGHJKLMNPRSTVWXYZ]{3}\b"), 1),          # matrícula
+    ],
+    "nif": [
+        (re.compile(r"IDENTIFICACI[OÓ]N\s+FISCAL|IDENTIFICACI[OÓ]\s+FISCAL"), 3),
+        (re.compile(r"AGENCIA\s+TRIBUTARIA|\bAEAT\b"), 3),
+        (re.compile(r"DENOMINACI[OÓ]N|RAZ[OÓ]N\s+SOCIAL"), 2),
+        (re.compile(r"ANAGRAMA\s+COMERCIAL"), 2),
+        (re.compile(r"DOMICILIO\s+(FISCAL|SOCIAL)"), 2),
+        (re.compile(r"\b[ABCDEFGHJKLMNPQRSUVW]\d{7}[A-J0-9]\b"), 1),     # CIF
+    ],
+}
+
+
+def score_document(text: str) -> dict[str, int]:
+    """Punts per tipus de document (cada senyal compta una vegada)."""
+    upper = text.upper()
+    return {
+        doc_type: sum(weight for pattern, weight in signals if pattern.search(upper))
+        for doc_type, signals in _SIGNALS.items()
+    }
+
+
+def classify_document(text: str) -> tuple[Optional[str], float, dict[str, int]]:
+    """
+    Tipus de document més probable.
+
+    Returns:
+        (doc_type o None si no hi ha cap senyal, confiança 0-100, punts per tipus)
+        La confiança és la part dels punts totals que té el guanyador.
+    """
+    scores = score_document(text)
+    doc_type = max(scores, key=scores.get)
+    total = sum(scores.values())
+    if total == 0:
+        return None, 0.0, scores
+    return doc_type, round(100 * scores[doc_type] / total, 1), scores
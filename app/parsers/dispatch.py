@@ -0,0 +1,61 @@
+"""
+Dispatch per tipus de document: text OCR → Phase 1 + Phase 2 → resposta v1
+
+Punt únic per re-executar els parsers sobre text ja llegit (0 crèdits),
+p.ex. des del magatzem de text OCR o de rutes que processen diversos tipus.
+"""
+from typing import Literal, Union
+from app.models.dni_response import DNIValidationResponse
+from app.models.permis_response import PermisValidationResponse
+from app.models.nif_response import NIFValidationResponse
+from app.parsers.dni_parser import dni_parser
+from app.parsers.permis_parser import permis_parser
+from app.parsers.nif_parser import nif_parser
+
+DocType = Literal["dni", "permis", "nif"]
+DOC_TYPES: tuple[str, ...] = ("dni", "permis", "nif")
+
+ValidationResponse = Union[DNIValidationResponse, PermisValidationResponse, NIFValidationResponse]
+
+
+def parse_document(doc_type: str, text: str, ocr_engine: str, ocr_confidence: float) -> ValidationResponse:
+    """
+    Executa Phase 1 (extracció) i Phase 2 (validació) del parser corresponent.
+
+    Raises:
+        ValueError: si el tipus de document no és conegut
+    """
+    if doc_type == "dni":
+        data, raw_mrz = dni_parser.parse(text)
+        return dni_parser.validate_and_build_response(data, raw_mrz, ocr_engine, ocr_confidence)
+    if doc_type == "permis":
+        data = permis_parser.parse(text)
+        return permis_parser.validate_and_build_response(data, ocr_engine, ocr_confidence)
+    if doc_type == "nif":
+        data = nif_parser.parse(text)
+        return nif_parser.validate_and_build_response(data, ocr_engine, ocr_confidence)
+    raise ValueError(f"Tipus de document desconegut: {doc_type}")
+
+
+def should_escalate_to_vision(
+    doc_type: str, result: ValidationResponse, text: str, ocr_confidence: float, min_confidence: float,
+) -> tuple[bool, str]:
+    """
+    Decideix si un resultat de Tesseract no és prou bo i cal Google Vision.
+
+    Phase 2 (tots els tipus): camps mínims + cap error crític (valido) i
+    confianza_global >= min_confidence. Després, les heurístiques Phase 1 de
+    cada parser (should_fallback_to_vision), si en té.
+
+    Returns:
+        (escalar, motiu)
+    """
+    if not result.valido:
+        return True, "phase2_invalid"
+    if result.confianza_global < min_confidence:
+        return True, f"confianza_global_baixa:{result.confianza_global}"
+    if doc_type == "dni":
+        return dni_parser.should_fallback_to_vision(result.datos, ocr_confidence, text)
+    if doc_type == "permis":
+        return permis_parser.should_fallback_to_vision(result.datos, ocr_confidence)
+    return False, "tesseract_acceptat"
@@ -9,6 +9,7 @@ TODO (futur): si confianza_global < 85 → Claude text-only per refinament
 """
 import re
 import logging
+import unicodedata
 from datetime import date
 from typing import Optional
 from app.models.dni_response import DNIDatos, MRZData, DNIValidationResponse
@@ -468,15 +469,22 @@ class DNIParser:
         raw_mrz: Optional[str],
         ocr_engine: str,
         ocr_confidence: float,
+        extra_items: Optional[list[ValidationItem]] = None,
     ) -> DNIValidationResponse:
         """
         Phase 2: valida tots els camps, genera ValidationItems normalitzats.
         0 crèdits addicionals — Python pur.
+
+        `extra_items`: ítems de validacions externes (p.ex. coherència anvers/revers),
+        repartits a alertes o errors segons la severitat.
         """
         errors: list[ValidationItem] = []
         alerts: list[ValidationItem] = []
         today = date.today()
 
+        for item in extra_items or []:
+            (alerts if item.severity == "warning" else errors).append(item)
+
         # --- Netejar noms ---
         for attr in ("nombre", "apellidos", "nombre_completo", "lugar_nacimiento",
                      "nombre_padre", "nombre_madre"):
@@ -614,6 +622,84 @@ class DNIParser:
             meta=MetaInfo(success=valido, message=f"[{ocr_engine}] {message}"),
         )
 
+    # ------------------------------------------------------------------
+    # Anvers + revers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def merge_sides(front: DNIDatos, back: DNIDatos) -> DNIDatos:
+        """
+        Combina les dades de les dues cares en un sol DNIDatos.
+
+        L'anvers mana per a les dades personals (noms amb accents, dates amb
+        l'any complet); el revers aporta MRZ, domicili i filiació. Qualsevol
+        camp absent en una cara es completa amb l'altra.
+        """
+        merged = front.model_copy(deep=True)
+        back_first = ("mrz", "domicilio", "calle", "numero", "piso_puerta", "municipio",
+                      "provincia", "codigo_postal", "lugar_nacimiento", "nombre_padre",
+                      "nombre_madre", "soporte_numero")
+        for attr in DNIDatos.model_fields:
+            back_val = getattr(back, attr)
+            if back_val and (attr in back_first or not getattr(merged, attr)):
+                setattr(merged, attr, back_val)
+
+        if merged.nombre and merged.apellidos:
+            merged.nombre_completo = f"{merged.nombre} {merged.apellidos}"
+        return merged
+
+    @staticmethod
+    def cross_check_sides(front: DNIDatos, back: DNIDatos) -> list[ValidationItem]:
+        """Coherència entre anvers i revers (el revers sol portar les dades de l'MRZ)."""
+        items: list[ValidationItem] = []
+
+        if front.numero_documento and back.numero_documento \
+                and front.numero_documento.upper() != back.numero_documento.upper():
+            items.append(ValidationItem(
+                code="DNI_SIDES_NUMBER_MISMATCH",
+                severity="critical",
+                field="numero_documento",
+                message="El número de document no coincideix entre anvers i revers.",
+                evidence=f"Anvers: '{front.numero_documento}', revers: '{back.numero_documento}'",
+                suggested_fix="Comprovar que les dues imatges són del mateix document.",
+            ))
+
+        for attr, label in (("fecha_nacimiento", "naixement"), ("fecha_caducidad", "caducitat")):
+            f_val, b_val = getattr(front, attr), getattr(back, attr)
+            if f_val and b_val and f_val != b_val:
+                items.append(ValidationItem(
+                    code="DNI_SIDES_DATE_MISMATCH",
+                    severity="error",
+                    field=attr,
+                    message=f"La data de {label} no coincideix entre anvers i revers.",
+                    evidence=f"Anvers: '{f_val}', revers: '{b_val}'",
+                    suggested_fix="Possible error OCR en una de les dates. Verificar manualment.",
+                ))
+
+        for attr in ("apellidos", "nombre"):
+            f_val, b_val = _name_key(getattr(front, attr)), _name_key(getattr(back, attr))
+            # L'MRZ pot truncar noms llargs: només és discrepància si cap és prefix de l'altre
+            if f_val and b_val and not (f_val.startswith(b_val) or b_val.startswith(f_val)):
+                items.append(ValidationItem(
+                    code="DNI_SIDES_NAME_MISMATCH",
+                    severity="warning",
+                    field=attr,
+                    message=f"El camp '{attr}' no coincideix entre anvers i revers.",
+                    evidence=f"Anvers: '{getattr(front, attr)}', revers: '{getattr(back, attr)}'",
+                    suggested_fix="Verificar manualment el nom del titular.",
+                ))
+
+        # Cares intercanviades: l'MRZ només és al revers
+        if front.mrz and not back.mrz:
+            items.append(ValidationItem(
+                code="DNI_SIDES_SWAPPED",
+                severity="warning",
+                message="La zona MRZ s'ha trobat a la imatge de l'anvers: les cares semblen intercanviades.",
+                suggested_fix="Enviar l'anvers com a 'front' i el revers com a 'back'.",
+            ))
+
+        return items
+
     # ------------------------------------------------------------------
     # Decisió Tesseract → Vision
     # ------------------------------------------------------------------
@@ -662,6 +748,14 @@ class DNIParser:
 # Helper intern
 # ---------------------------------------------------------------------------
 
+def _name_key(value: Optional[str]) -> Optional[str]:
+    """Nom normalitzat per comparar (sense accents ni separadors, com a l'MRZ)."""
+    if not value:
+        return None
+    ascii_value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Z]", "", ascii_value.upper()) or None
+
+
 def _expected_letter(doc: str) -> str:
     doc = doc.upper()
     if doc[0] in "XYZ":
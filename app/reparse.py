@@ -0,0 +1,68 @@
+"""
+Re-parseig en bloc de l'històric OCR (0 crèdits Vision)
+
+Llegeix el text guardat al magatzem OCR i torna a executar Phase 1 + Phase 2
+amb la versió actual dels parsers. Sortida JSONL (una resposta v1 per línia).
+
+Ús:
+    python -m app.reparse --doc-type dni --output dni_reparsed.jsonl
+    python -m app.reparse --since-days 30
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Iterator, Optional
+from app.parsers.dispatch import DOC_TYPES, parse_document
+from app.services.ocr_store import OCRStore, ocr_store
+
+
+def reparse(store: OCRStore, doc_type: Optional[str] = None,
+            since: Optional[float] = None) -> Iterator[dict]:
+    """Genera {image_hash, doc_type, engine, preprocess_mode, response} per cada entrada."""
+    for record in store.iter_records(doc_type=doc_type, since=since):
+        response = parse_document(
+            record["doc_type"], record["text"], record["engine"], record["confidence"]
+        )
+        yield {
+            "image_hash": record["image_hash"],
+            "doc_type": record["doc_type"],
+            "engine": record["engine"],
+            "preprocess_mode": record["preprocess_mode"],
+            "response": response.model_dump(),
+        }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-parseja el text OCR guardat")
+    parser.add_argument("--doc-type", choices=DOC_TYPES, default=None)
+    parser.add_argument("--since-days", type=float, default=None,
+                        help="Només entrades dels últims N dies")
+    parser.add_argument("--output", default="-", help="Fitxer JSONL de sortida (- = stdout)")
+    args = parser.parse_args(argv)
+
+    if not ocr_store.enabled:
+        print("❌ Magatzem OCR desactivat (OCR_STORE_ENABLED=false)", file=sys.stderr)
+        return 1
+
+    since = time.time() - args.since_days * 86400 if args.since_days else None
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    total = valids = 0
+    t0 = time.monotonic()
+    try:
+        for item in reparse(ocr_store, args.doc_type, since):
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            total += 1
+            valids += int(item["response"]["valido"])
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.monotonic() - t0
+    print(f"✅ {total} documents re-parsejats ({valids} vàlids) en {elapsed:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
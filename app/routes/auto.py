@@ -0,0 +1,27 @@
+"""
+Ruta per processar documents de tipus desconegut — Contracte unificat v1
+"""
+from fastapi import APIRouter, File, UploadFile, Query
+from app.models.batch_response import DocumentResult
+from app.services.document_pipeline import read_upload, process_auto
+
+router = APIRouter()
+
+
+@router.post("/auto", response_model=DocumentResult)
+async def process_auto_document(
+    file: UploadFile = File(...),
+    preprocess: bool = Query(default=False, description="Pre-processar imatge per millorar OCR"),
+    preprocess_mode: str = Query(default="standard", description="Mode: standard, aggressive, document, auto (segons la qualitat de la imatge)"),
+):
+    """
+    Detecta el tipus de document (DNI/NIE, permís de circulació o NIF) i el processa.
+
+    - **file**: Imatge del document (JPG, PNG, WEBP)
+
+    Una sola passada OCR (1 crèdit Vision): el text es classifica per paraules
+    clau i s'envia al parser corresponent. `tipo_documento` indica el tipus
+    detectat i `meta.classification_confidence` la seguretat de la classificació.
+    """
+    content, digest = await read_upload(file)
+    return await process_auto(content, preprocess, preprocess_mode, digest)
@@ -0,0 +1,114 @@
+"""
+Ruta per processar lots de documents — Contracte unificat v1
+
+Un sol POST amb N imatges (cada una etiquetada amb el seu tipus) processades
+en paral·lel amb concurrència limitada. Cada ítem passa pel mateix pipeline
+que /ocr/dni, /ocr/permis i /ocr/nif.
+
+Admissió: el lot gasta N tokens del rate limit del client (429 si no n'hi ha
+prou) i cada ítem ocupa un slot del control d'admissió global, com una
+petició individual (sense slot a temps: l'ítem respon 503).
+"""
+import asyncio
+import logging
+import time
+from typing import List
+from fastapi import APIRouter, File, Form, Request, UploadFile, HTTPException, Query
+from app.config import settings
+from app.models.batch_response import BatchItemResult, BatchResponse
+from app.parsers.dispatch import DOC_TYPES
+from app.services.admission import Overloaded, admission_controller, request_client
+from app.services.api_keys import current_api_client
+from app.services.document_pipeline import read_upload, process_document
+
+log = logging.getLogger("ocr.batch")
+
+# Límit global: acota la feina OCR simultània encara que arribin diversos lots
+_batch_semaphore = asyncio.Semaphore(settings.batch_concurrency)
+
+router = APIRouter()
+
+
+async def _process_item(index: int, file: UploadFile, doc_type: str,
+                        preprocess: bool, preprocess_mode: str, client_id: str) -> BatchItemResult:
+    """Processa un ítem; els errors HTTP es converteixen en resultat de l'ítem."""
+    item = BatchItemResult(index=index, filename=file.filename, doc_type=doc_type, status_code=200)
+
+    if doc_type not in DOC_TYPES:
+        item.status_code = 400
+        item.error = f"Tipus de document desconegut: '{doc_type}'. Acceptem: {', '.join(DOC_TYPES)}."
+        return item
+
+    async with _batch_semaphore:
+        try:
+            # Slot global per ítem (el token ja s'ha gastat en admetre el lot)
+            async with admission_controller.admit(client_id, tokens=0):
+                # Starlette ja ha guardat els fitxers (SpooledTemporaryFile); llegir dins
+                # el semàfor limita les còpies en bytes a memòria a N alhora
+                content, digest = await read_upload(file)
+                item.result = await process_document(doc_type, content, preprocess, preprocess_mode, digest)
+        except HTTPException as e:
+            item.status_code = e.status_code
+            item.error = e.detail
+        except Overloaded as e:
+            item.status_code = e.status_code
+            item.error = e.detail
+    return item
+
+
+@router.post("/batch", response_model=BatchResponse)
+async def process_batch(
+    request: Request,
+    files: List[UploadFile] = File(..., description="Imatges dels documents"),
+    doc_types: List[str] = Form(..., description="Tipus per cada fitxer, en el mateix ordre: dni, permis, nif"),
+    preprocess: bool = Query(default=False, description="Pre-processar imatges"),
+    preprocess_mode: str = Query(default="standard", description="Mode: standard, aggressive, document, auto (segons la qualitat de la imatge)"),
+):
+    """
+    Processa un lot de documents en paral·lel (contracte unificat v1 per ítem).
+
+    - **files**: imatges (JPG, PNG, WEBP), màxim `BATCH_MAX_ITEMS`
+    - **doc_types**: un tipus per fitxer, en el mateix ordre
+
+    Els ítems es processen amb concurrència acotada (`BATCH_CONCURRENCY`).
+    Un error en un ítem no fa fallar el lot: es retorna el seu `status_code` i `error`.
+    El lot compta com N peticions per al rate limit (`429` si no n'hi ha prou).
+    """
+    if len(doc_types) == 1 and "," in doc_types[0]:
+        doc_types = [t.strip() for t in doc_types[0].split(",")]
+
+    if len(files) != len(doc_types):
+        raise HTTPException(status_code=400, detail="Cal un doc_type per cada fitxer (mateix ordre).")
+
+    if len(files) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Lot massa gran. Màxim {settings.batch_max_items} documents.")
+
+    client_id, rate_check = request_client(request, current_api_client.get())
+    try:
+        admission_controller.check_rate(client_id, rate_check, tokens=len(files))
+    except Overloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail,
+                            headers={"Retry-After": str(e.retry_after)})
+
+    t0 = time.monotonic()
+    items = await asyncio.gather(*(
+        _process_item(i, f, t.strip().lower(), preprocess, preprocess_mode, client_id)
+        for i, (f, t) in enumerate(zip(files, doc_types))
+    ))
+    durada_ms = round((time.monotonic() - t0) * 1000)
+
+    ok = sum(1 for item in items if item.status_code == 200)
+    log.info("ocr_batch_done", extra={
+        "total": len(items),
+        "ok": ok,
+        "failed": len(items) - ok,
+        "durada_ms": durada_ms,
+    })
+
+    return BatchResponse(
+        total=len(items),
+        ok=ok,
+        failed=len(items) - ok,
+        durada_ms=durada_ms,
+        items=list(items),
+    )
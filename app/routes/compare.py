@@ -5,6 +5,9 @@ from fastapi import APIRouter, File, UploadFile, HTTPException, Query
 from app.services.tesseract_service import tesseract_service
 from app.services.google_vision_service import google_vision_service
 from app.services.image_processor import image_processor
+from app.services.preprocess_executor import preprocess_executor
+from app.config import settings
+from app.utils.image_io import ImageTooLarge, check_pixels
 import tempfile
 import os
 import time
@@ -44,7 +47,7 @@ async def compare_ocr_engines(
 
     - **file**: Imatge del document (JPG, PNG)
     - **engines**: Motors a testejar (tesseract, google_vision)
-    - **preprocess_modes**: Modes a provar (standard, aggressive, document, none)
+    - **preprocess_modes**: Modes a provar (standard, aggressive, document, auto, none)
 
     Returns:
         Comparació de tots els resultats amb recomanacions
@@ -53,9 +56,17 @@ async def compare_ocr_engines(
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="El fitxer ha de ser una imatge")
 
+    content = await file.read()
+    # Dimensions de la capçalera dins del pressupost abans de descodificar res
+    try:
+        check_pixels(content, settings.max_image_pixels)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El fitxer no és una imatge vàlida.")
+
     # Guardar temporalment
     with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_file:
-        content = await file.read()
         temp_file.write(content)
         temp_path = temp_file.name
 
@@ -69,9 +80,9 @@ async def compare_ocr_engines(
                 processed_images[mode] = temp_path
             else:
                 try:
-                    processed_path = image_processor.process_for_ocr(
-                        temp_path,
-                        mode=mode
+                    # Al pool de pre-processament (no bloqueja l'event loop)
+                    processed_path, _, _ = await preprocess_executor.run(
+                        image_processor.process_for_ocr, temp_path, None, mode
                     )
                     processed_images[mode] = processed_path
                 except Exception as e:
@@ -2,39 +2,9 @@
 Ruta per processar DNI/NIE — Contracte unificat v1
 """
 import asyncio
-import logging
-import tempfile
-import os
-import time
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
-from fastapi.concurrency import run_in_threadpool
+from fastapi import APIRouter, File, UploadFile, Query
 from app.models.dni_response import DNIValidationResponse
-from app.services.tesseract_service import tesseract_service
-from app.services.google_vision_service import google_vision_service
-from app.services.image_processor import image_processor
-from app.parsers.dni_parser import dni_parser
-
-log = logging.getLogger("ocr.dni")
-
-_tesseract_semaphore = asyncio.Semaphore(2)
-
-OCR_TIMEOUT_SECONDS = 30
-MAX_FILE_SIZE = 5 * 1024 * 1024
-VALID_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
-
-_MAGIC = {
-    b"\xff\xd8\xff": "image/jpeg",
-    b"\x89PNG":      "image/png",
-    b"RIFF":         "image/webp",
-}
-
-
-def _detect_image_type(content: bytes) -> str | None:
-    for magic, mime in _MAGIC.items():
-        if content[: len(magic)] == magic:
-            return mime
-    return None
-
+from app.services.document_pipeline import read_upload, process_document, process_dni_sides
 
 router = APIRouter()
 
@@ -43,7 +13,7 @@ router = APIRouter()
 async def process_dni(
     file: UploadFile = File(...),
     preprocess: bool = Query(default=False, description="Pre-processar imatge per millorar OCR"),
-    preprocess_mode: str = Query(default="standard", description="Mode: standard, aggressive, document"),
+    preprocess_mode: str = Query(default="standard", description="Mode: standard, aggressive, document, auto (segons la qualitat de la imatge)"),
 ):
     """
     Processa un DNI/NIE i retorna validació experta (contracte unificat v1).
@@ -54,89 +24,30 @@ async def process_dni(
     - Phase 1: extracció raw (regex Python)
     - Phase 2: validació creuada + codis normalitzats (Python pur, 0 crèdits)
     """
-    if file.content_type not in VALID_MIME_TYPES:
-        raise HTTPException(status_code=400, detail="Format no suportat. Acceptem JPG, PNG o WEBP.")
-
-    content = await file.read()
-
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail=f"Imatge massa gran. Màxim {MAX_FILE_SIZE // 1024 // 1024}MB.")
-
-    if _detect_image_type(content) is None:
-        raise HTTPException(status_code=400, detail="El fitxer no és una imatge vàlida.")
+    content, digest = await read_upload(file)
+    return await process_document("dni", content, preprocess, preprocess_mode, digest)
 
-    temp_path: str | None = None
-    ocr_input_path: str | None = None
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-        tmp.write(content)
-        temp_path = tmp.name
-    del content
-
-    try:
-        ocr_input_path = temp_path
-        if preprocess:
-            try:
-                ocr_input_path = image_processor.process_for_ocr(temp_path, mode=preprocess_mode)
-            except Exception:
-                log.warning("preprocess_failed")
-                ocr_input_path = temp_path
-
-        # --- Google Vision OCR (únic motor) ---
-        if not google_vision_service.is_available():
-            raise HTTPException(status_code=503, detail="Motor OCR no disponible")
-
-        t0 = time.monotonic()
-        vision_result = await asyncio.wait_for(
-            run_in_threadpool(google_vision_service.detect_document_text, ocr_input_path),
-            timeout=OCR_TIMEOUT_SECONDS,
-        )
-        vision_ms = round((time.monotonic() - t0) * 1000)
-        vision_data, raw_mrz = dni_parser.parse(vision_result["text"])
-        result = dni_parser.validate_and_build_response(
-            vision_data, raw_mrz, "google_vision", vision_result["confidence"]
-        )
-        log.info("ocr_vision_used", extra={
-            "doc_redacted": _redact(result.datos.numero_documento),
-            "confianza": result.confianza_global,
-            "valido": result.valido,
-            "errors": len(result.errores_detectados),
-            "alerts": len(result.alertas),
-            "durada_ms": vision_ms,
-            "confidence": round(vision_result["confidence"], 1),
-        })
-
-        # TODO: si result.confianza_global < 85 → Claude text-only per refinament
-
-        log.info("ocr_success", extra={
-            "doc_redacted": _redact(result.datos.numero_documento),
-            "confianza": result.confianza_global,
-            "valido": result.valido,
-            "engine": result.raw.ocr_engine,
-        })
-        return result
-
-    except HTTPException:
-        raise
-    except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail="Timeout processant el document.")
-    except Exception:
-        log.exception("ocr_unexpected_error")
-        raise HTTPException(status_code=500, detail="Error intern processant el document.")
-
-    finally:
-        def _unlink(path: str | None) -> None:
-            if path and os.path.exists(path):
-                try:
-                    os.unlink(path)
-                except OSError:
-                    pass
-        _unlink(temp_path)
-        if ocr_input_path != temp_path:
-            _unlink(ocr_input_path)
+@router.post("/dni/complet", response_model=DNIValidationResponse)
+async def process_dni_complet(
+    front: UploadFile = File(..., description="Anvers del DNI/NIE"),
+    back: UploadFile = File(..., description="Revers del DNI/NIE (MRZ, domicili)"),
+    preprocess: bool = Query(default=False, description="Pre-processar imatges per millorar OCR"),
+    preprocess_mode: str = Query(default="standard", description="Mode: standard, aggressive, document, auto (segons la qualitat de la imatge)"),
+):
+    """
+    Processa les dues cares d'un DNI/NIE en una sola petició (contracte unificat v1).
 
+    - **front**: imatge de l'anvers (JPG, PNG, WEBP)
+    - **back**: imatge del revers (JPG, PNG, WEBP)
 
-def _redact(doc: str | None) -> str:
-    if not doc or len(doc) < 3:
-        return "***"
-    return doc[:4] + "****" + doc[-1]
+    OCR de les dues cares en paral·lel (2 crèdits Vision). Les dades es combinen
+    en una sola resposta i es validen amb coherència creuada entre cares
+    (número, dates i noms de l'anvers contra l'MRZ del revers).
+    """
+    (front_content, front_digest), (back_content, back_digest) = await asyncio.gather(
+        read_upload(front), read_upload(back),
+    )
+    return await process_dni_sides(
+        front_content, back_content, preprocess, preprocess_mode, front_digest, back_digest,
+    )
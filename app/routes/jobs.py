@@ -0,0 +1,54 @@
+"""
+Rutes de treballs OCR asíncrons — Contracte unificat v1
+
+POST /ocr/jobs encua un document i retorna el job_id de seguida (202);
+GET /ocr/jobs/{id} retorna l'estat i, quan ha acabat, la resposta v1.
+"""
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from app.models.job_response import JobResponse
+from app.parsers.dispatch import DOC_TYPES
+from app.services.api_keys import current_api_client
+from app.services.document_pipeline import read_upload
+from app.services.job_queue import job_queue
+
+router = APIRouter()
+
+
+def _client_name() -> str | None:
+    api_client = current_api_client.get()
+    return api_client.name if api_client else None
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(
+    file: UploadFile = File(..., description="Imatge del document"),
+    doc_type: str = Form(..., description="Tipus: dni, permis, nif"),
+    preprocess: bool = Query(default=False, description="Pre-processar imatge"),
+    preprocess_mode: str = Query(default="standard", description="Mode: standard, aggressive, document, auto (segons la qualitat de la imatge)"),
+):
+    """
+    Encua un document per processar-lo en segon pla.
+
+    Retorna el `job_id` immediatament; el resultat es consulta amb `GET /ocr/jobs/{job_id}`.
+    La imatge es valida (format, mida) abans d'encuar-la.
+    """
+    doc_type = doc_type.strip().lower()
+    if doc_type not in DOC_TYPES:
+        raise HTTPException(status_code=400, detail=f"Tipus de document desconegut: '{doc_type}'. Acceptem: {', '.join(DOC_TYPES)}.")
+
+    content, digest = await read_upload(file)
+    job_id = await run_in_threadpool(
+        job_queue.submit, doc_type, content, preprocess, preprocess_mode, digest, _client_name(),
+    )
+    return await get_job(job_id)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Estat del treball i, si ha acabat, el resultat (contracte v1) o l'error."""
+    job = await run_in_threadpool(job_queue.get, job_id)
+    # Cada API key només veu els seus treballs
+    if job is None or job.pop("client") != _client_name():
+        raise HTTPException(status_code=404, detail="Treball no trobat.")
+    return job
@@ -0,0 +1,221 @@
+"""
+Control d'admissió i descàrrega (load shedding)
+
+Limita la feina OCR simultània i rebutja ràpidament (429/503 + Retry-After)
+quan el servei està saturat, en comptes de deixar que les peticions s'acumulin
+fins al timeout de 30 s (504).
+
+- Capacitat: ADMISSION_MAX_IN_FLIGHT peticions OCR alhora
+- Cua: fins a ADMISSION_MAX_QUEUE peticions esperant, com a molt
+  ADMISSION_QUEUE_TIMEOUT_SECONDS; més enllà → 503
+- Rate limit: RATE_LIMIT_PER_MINUTE per client (API key o IP) → 429
+
+Un lot (/ocr/batch) no passa pel middleware com una sola petició: la ruta
+gasta un token per document i cada ítem ocupa el seu propi slot.
+
+Els indicadors (in-flight, cua, rebutjos) s'exposen a /health i /metrics
+per a l'autoscaler.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Optional
+from app.config import settings
+
+# Rate limit propi d'un client: tokens → None si s'admet, o segons de Retry-After
+RateCheck = Callable[[float], Optional[int]]
+
+
+class Overloaded(Exception):
+    """Petició rebutjada per l'admissió (status 429 o 503)."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket clàssic: `rate` tokens per segon, capacitat `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        # Més tokens que la ràfega (lot gran): cal el bucket ple i el buida
+        tokens = min(tokens, self.burst)
+        self._refill(time.monotonic())
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def retry_after(self, tokens: float = 1.0) -> int:
+        """Segons fins que hi haurà prou tokens (mínim 1)."""
+        tokens = min(tokens, self.burst)
+        missing = max(0.0, tokens - self.tokens)
+        return max(1, math.ceil(missing / self.rate)) if self.rate > 0 else 60
+
+
+class ClientRateLimiter:
+    """Un TokenBucket per client (API key o IP), amb nombre de clients acotat (LRU)."""
+
+    def __init__(self, per_minute: int, max_clients: int = 10_000):
+        self.per_minute = per_minute
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check(self, client_id: str, tokens: float = 1.0) -> Optional[int]:
+        """None si s'admeten `tokens` peticions; si no, segons de Retry-After."""
+        if self.per_minute <= 0:
+            return None
+
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = TokenBucket(rate=self.per_minute / 60, burst=self.per_minute)
+            self._buckets[client_id] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_id)
+
+        if bucket.try_acquire(tokens):
+            return None
+        return bucket.retry_after(tokens)
+
+
+def request_client(request: Any, api_client: Any = None) -> tuple[str, Optional[RateCheck]]:
+    """
+    (identificador, rate limit propi) del client d'una petició: l'API key
+    autenticada (el seu token bucket) o, si no n'hi ha, la IP amb el límit global.
+
+    Mai la capçalera X-API-Key sense validar: canviant-la a cada petició es
+    tindria un bucket nou cada vegada (i s'expulsarien els dels altres clients).
+    """
+    if api_client is not None:
+        return api_client.name, api_client.check_rate
+    return (request.client.host if request.client else "anonymous"), None
+
+
+class AdmissionController:
+    """Semàfor global de peticions OCR amb cua acotada i indicadors."""
+
+    def __init__(self, max_in_flight: int = 32, max_queue: int = 64,
+                 queue_timeout: float = 5.0, rate_limit_per_minute: int = 0,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_limiter = ClientRateLimiter(rate_limit_per_minute)
+
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+        # Indicadors
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted_total = 0
+        self.rejected_total = {"rate_limited": 0, "queue_full": 0, "queue_timeout": 0}
+        self._avg_service_s = 1.0  # EWMA de la durada de les peticions admeses
+
+    def _retry_after(self) -> int:
+        """Estimació del temps fins que hi haurà capacitat."""
+        waves = (self.queued + 1) / max(1, self.max_in_flight)
+        return max(1, math.ceil(self._avg_service_s * waves))
+
+    def check_rate(self, client_id: str = "anonymous", rate_check: Optional[RateCheck] = None,
+                   tokens: float = 1.0) -> None:
+        """
+        Gasta `tokens` peticions del rate limit del client (un lot: una per document).
+
+        Raises:
+            Overloaded 429 si no n'hi ha prou
+        """
+        if not self.enabled:
+            return
+        retry = rate_check(tokens) if rate_check else self.rate_limiter.check(client_id, tokens)
+        if retry is not None:
+            self.rejected_total["rate_limited"] += 1
+            raise Overloaded(429, "Massa peticions. Torna-ho a provar més tard.", retry)
+
+    @asynccontextmanager
+    async def admit(self, client_id: str = "anonymous", rate_check: Optional[RateCheck] = None,
+                    tokens: float = 1.0) -> AsyncIterator[None]:
+        """
+        Ocupa un slot durant el bloc.
+
+        Args:
+            client_id: identificador per al rate limit global (API key o IP)
+            rate_check: límit propi del client (p.ex. ApiClient.check_rate);
+                substitueix el rate limit global
+            tokens: peticions que es gasten del rate limit (0: ja s'han gastat,
+                p.ex. els ítems d'un lot)
+
+        Raises:
+            Overloaded 429 (rate limit) o 503 (capacitat/cua plena)
+        """
+        if not self.enabled:
+            yield
+            return
+
+        if tokens:
+            self.check_rate(client_id, rate_check, tokens)
+
+        if self._slots.locked():
+            if self.queued >= self.max_queue:
+                self.rejected_total["queue_full"] += 1
+                raise Overloaded(503, "Servei saturat. Torna-ho a provar més tard.", self._retry_after())
+
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected_total["queue_timeout"] += 1
+                raise Overloaded(503, "Servei saturat. Torna-ho a provar més tard.", self._retry_after())
+            finally:
+                self.queued -= 1
+        else:
+            await self._slots.acquire()
+
+        self.in_flight += 1
+        self.admitted_total += 1
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+            self._avg_service_s = 0.9 * self._avg_service_s + 0.1 * (time.monotonic() - t0)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "utilization": round(self.in_flight / self.max_in_flight, 3) if self.max_in_flight else 0.0,
+            "admitted_total": self.admitted_total,
+            "rejected_total": dict(self.rejected_total),
+            "avg_service_ms": round(self._avg_service_s * 1000),
+        }
+
+
+# Singleton
+admission_controller = AdmissionController(
+    max_in_flight=settings.admission_max_in_flight,
+    max_queue=settings.admission_max_queue,
+    queue_timeout=settings.admission_queue_timeout_seconds,
+    rate_limit_per_minute=settings.rate_limit_per_minute,
+    enabled=settings.admission_enabled,
+)
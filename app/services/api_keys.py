@@ -0,0 +1,244 @@
+"""
+Registre d'API keys amb límits per client
+
+Cada app integradora té la seva clau (API_KEYS) amb:
+- rate_per_minute / burst: token bucket propi (en lloc del límit global per IP)
+- daily_vision_quota: crèdits Vision per dia UTC (0 = sense límit)
+- max_in_flight: peticions simultànies màximes (0 = sense límit)
+
+Un integrador sorollós no pot esgotar el pressupost de crèdits ni la capacitat
+de què depèn la UI interactiva de GoGestor.
+
+Sense locks: els comptadors només es modifiquen des de l'event loop, i el
+registre es reemplaça sencer en recarregar (copy-on-write). L'ús diari es
+desa periòdicament a disc (snapshot) per sobreviure a reinicis.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
+from fastapi.concurrency import run_in_threadpool
+from app.config import settings
+from app.services.admission import TokenBucket
+
+log = logging.getLogger("ocr.api_keys")
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _seconds_to_midnight() -> int:
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def key_hash(key: str) -> str:
+    """SHA-256 de la clau (el registre no guarda les claus en clar)."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ApiClient:
+    """Una app integradora: límits i ús del dia."""
+
+    def __init__(self, name: str, rate_per_minute: int = 0, burst: Optional[int] = None,
+                 daily_vision_quota: int = 0, max_in_flight: int = 0):
+        self.name = name
+        self.rate_per_minute = rate_per_minute
+        self.daily_vision_quota = daily_vision_quota
+        self.max_in_flight = max_in_flight
+        self.bucket = (
+            TokenBucket(rate=rate_per_minute / 60, burst=burst or rate_per_minute)
+            if rate_per_minute > 0 else None
+        )
+
+        self.in_flight = 0
+        self.day = _today()
+        self.requests = 0
+        self.vision_credits = 0
+
+    def _roll_day(self) -> None:
+        today = _today()
+        if today != self.day:
+            self.day, self.requests, self.vision_credits = today, 0, 0
+
+    def check_rate(self, tokens: float = 1.0) -> Optional[int]:
+        """None si s'admeten `tokens` peticions (un lot: una per document); si no, segons de Retry-After."""
+        self._roll_day()
+        self.requests += 1
+        if self.bucket is None or self.bucket.try_acquire(tokens):
+            return None
+        return self.bucket.retry_after(tokens)
+
+    def try_enter(self) -> bool:
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return False
+        self.in_flight += 1
+        return True
+
+    def leave(self) -> None:
+        self.in_flight -= 1
+
+    def reserve_vision_credit(self) -> bool:
+        """Reserva 1 crèdit Vision del dia. False si la quota està esgotada."""
+        self._roll_day()
+        if self.daily_vision_quota and self.vision_credits >= self.daily_vision_quota:
+            return False
+        self.vision_credits += 1
+        return True
+
+    def charge_vision_credits(self, n: int) -> None:
+        """Anota crèdits ja gastats fora de la reserva (sonda d'orientació de Vision)."""
+        self._roll_day()
+        self.vision_credits += n
+
+    def refund_vision_credit(self) -> None:
+        """Retorna un crèdit reservat que no s'ha arribat a gastar."""
+        self.vision_credits = max(0, self.vision_credits - 1)
+
+    def quota_retry_after(self) -> int:
+        """Segons fins que es renova la quota diària (mitjanit UTC)."""
+        return _seconds_to_midnight()
+
+    def usage(self) -> dict:
+        self._roll_day()
+        return {
+            "day": self.day,
+            "requests": self.requests,
+            "vision_credits": self.vision_credits,
+            "daily_vision_quota": self.daily_vision_quota,
+            "in_flight": self.in_flight,
+        }
+
+
+# Client autenticat de la petició en curs (el fixa el middleware d'API key)
+current_api_client: ContextVar[Optional[ApiClient]] = ContextVar("current_api_client", default=None)
+
+
+class ApiKeyRegistry:
+    """Claus autoritzades (per hash SHA-256) → ApiClient."""
+
+    def __init__(self, snapshot_path: Optional[str] = None):
+        self.snapshot_path = snapshot_path
+        self._by_hash: dict[str, ApiClient] = {}
+
+    @property
+    def clients(self) -> list[ApiClient]:
+        return list(self._by_hash.values())
+
+    def load(self, entries: list[Union[str, dict]], default_rate_per_minute: int = 0) -> None:
+        """
+        Carrega les claus. Cada entrada és una clau en clar o un objecte:
+        {"name", "key" | "key_sha256", "rate_per_minute", "burst",
+         "daily_vision_quota", "max_in_flight"}
+
+        Es conserva l'ús del dia dels clients que ja existien (mateix nom).
+        """
+        previous = {c.name: c for c in self._by_hash.values()}
+        by_hash: dict[str, ApiClient] = {}
+
+        for i, entry in enumerate(entries):
+            if isinstance(entry, str):
+                entry = {"key": entry}
+            digest = entry.get("key_sha256") or (key_hash(entry["key"]) if entry.get("key") else None)
+            if not digest:
+                raise ValueError(f"API key #{i} sense 'key' ni 'key_sha256'")
+
+            client = ApiClient(
+                name=entry.get("name") or f"key-{i}",
+                rate_per_minute=entry.get("rate_per_minute", default_rate_per_minute),
+                burst=entry.get("burst"),
+                daily_vision_quota=entry.get("daily_vision_quota", 0),
+                max_in_flight=entry.get("max_in_flight", 0),
+            )
+            old = previous.get(client.name)
+            if old is not None and old.day == client.day:
+                client.requests, client.vision_credits = old.requests, old.vision_credits
+            by_hash[digest.lower()] = client
+
+        self._by_hash = by_hash  # substitució atòmica
+
+    def get_by_name(self, name: Optional[str]) -> Optional[ApiClient]:
+        if not name:
+            return None
+        return next((c for c in self._by_hash.values() if c.name == name), None)
+
+    def authenticate(self, key: Optional[str]) -> Optional[ApiClient]:
+        if not key:
+            return None
+        return self._by_hash.get(key_hash(key))
+
+    # --- Snapshot de l'ús diari ---
+
+    def snapshot(self) -> dict:
+        return {
+            "day": _today(),
+            "clients": {
+                c.name: {"requests": c.requests, "vision_credits": c.vision_credits}
+                for c in self._by_hash.values() if c.day == _today()
+            },
+        }
+
+    def restore(self, data: dict) -> None:
+        """Recupera l'ús del dia (un snapshot d'un altre dia s'ignora)."""
+        if data.get("day") != _today():
+            return
+        for client in self._by_hash.values():
+            usage = data.get("clients", {}).get(client.name)
+            if usage:
+                client.day = data["day"]
+                client.requests = max(client.requests, usage.get("requests", 0))
+                client.vision_credits = max(client.vision_credits, usage.get("vision_credits", 0))
+
+    def save_snapshot(self) -> None:
+        if not self.snapshot_path:
+            return
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.snapshot_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, self.snapshot_path)
+
+    def load_snapshot(self) -> None:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                self.restore(json.load(f))
+        except (OSError, ValueError):
+            log.warning("api_keys_snapshot_unreadable")
+
+    async def run_snapshots(self, interval_seconds: float) -> None:
+        """Desa l'ús periòdicament (tasca de fons)."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await run_in_threadpool(self.save_snapshot)
+            except Exception:
+                log.warning("api_keys_snapshot_failed")
+
+
+def _build_registry() -> ApiKeyRegistry:
+    registry = ApiKeyRegistry(snapshot_path=settings.api_keys_usage_path)
+    entries: list[Union[str, dict]] = list(settings.api_keys)
+    if settings.api_key:
+        # Clau única clàssica (API_KEY): sense quota, rate limit global
+        entries.append({"name": "default", "key": settings.api_key})
+    try:
+        registry.load(entries, default_rate_per_minute=settings.rate_limit_per_minute)
+        if registry.clients:
+            print(f"✅ API keys: {len(registry.clients)} clients configurats")
+    except (ValueError, TypeError, KeyError) as e:
+        print(f"❌ Error carregant API_KEYS: {e}")
+    return registry
+
+
+# Singleton
+api_key_registry = _build_registry()
@@ -0,0 +1,592 @@
+"""
+Pipeline comú de processament de documents — Contracte unificat v1
+
+upload (bytes) → cache → pre-processament en memòria → OCR → magatzem OCR
+→ Phase 1 + Phase 2 (parser del tipus) → resposta v1
+
+OCR en escala (OCR_TESSERACT_FIRST): Tesseract local (0 crèdits) primer; si el
+resultat no supera Phase 2 es fa Google Vision (1 crèdit). raw.ocr_engine diu
+quin nivell ha respost.
+
+Compartit per les rutes /ocr/dni, /ocr/dni/complet, /ocr/permis, /ocr/nif, /ocr/auto,
+/ocr/batch i els treballs asíncrons.
+Els errors es propaguen com HTTPException (mateix contracte HTTP a totes les rutes).
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from app.models.dni_response import DNIValidationResponse
+from app.parsers.dispatch import ValidationResponse, parse_document, should_escalate_to_vision
+from app.parsers.dni_parser import dni_parser
+from app.parsers.classifier import classify_document
+from app.config import settings
+from app.services.google_vision_service import google_vision_service
+from app.services.tesseract_service import tesseract_service
+from app.services.vision_resilience import CircuitOpenError
+from app.services.result_cache import result_cache, content_hash
+from app.services.ocr_store import ocr_store
+from app.services.admission import Overloaded
+from app.services.preprocess_executor import preprocess_executor
+from app.services.api_keys import current_api_client
+from app.utils.image_io import ImageTooLarge, check_pixels
+from app.utils.redact import redact_dni
+
+OCR_TIMEOUT_SECONDS = 30
+MAX_FILE_SIZE = 5 * 1024 * 1024
+VALID_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
+
+_MAGIC = {
+    b"\xff\xd8\xff": "image/jpeg",
+    b"\x89PNG":      "image/png",
+    b"RIFF":         "image/webp",
+}
+
+
+_MAGIC_LEN = max(len(magic) for magic in _MAGIC)
+
+# Tesseract és CPU intensiu: OCR locals alhora acotats (TESSERACT_CONCURRENCY)
+_tesseract_semaphore = asyncio.Semaphore(settings.tesseract_concurrency)
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # capçaleres multipart i camps de formulari
+
+
+def detect_image_type(content: bytes) -> str | None:
+    for magic, mime in _MAGIC.items():
+        if content[: len(magic)] == magic:
+            return mime
+    return None
+
+
+def max_request_bytes(max_files: int = 1) -> int:
+    """Mida màxima acceptable del cos d'una petició amb `max_files` imatges."""
+    return max_files * MAX_FILE_SIZE + MULTIPART_OVERHEAD
+
+
+async def read_upload(file: UploadFile) -> tuple[bytes, str]:
+    """
+    Llegeix i valida un upload en streaming (tipus MIME, magic bytes, mida i píxels).
+
+    Es llegeix per blocs: els magic bytes es comproven amb el primer bloc i
+    la lectura s'atura tan bon punt se supera MAX_FILE_SIZE. El hash SHA-256
+    (clau de cache i del magatzem OCR) es calcula mentre es llegeix. Al final
+    es llegeix la capçalera: les dimensions declarades han de cabre a
+    MAX_IMAGE_PIXELS (uns pocs KB de PNG poden declarar gigapíxels).
+
+    Returns:
+        (contingut, hash SHA-256 hexadecimal)
+
+    Raises:
+        HTTPException 400/413 si el fitxer no és acceptable
+    """
+    if file.content_type not in VALID_MIME_TYPES:
+        raise HTTPException(status_code=400, detail="Format no suportat. Acceptem JPG, PNG o WEBP.")
+
+    too_large = HTTPException(status_code=413, detail=f"Imatge massa gran. Màxim {MAX_FILE_SIZE // 1024 // 1024}MB.")
+    not_image = HTTPException(status_code=400, detail="El fitxer no és una imatge vàlida.")
+
+    # Mida coneguda pel parser multipart: rebutjar sense llegir res
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        raise too_large
+
+    hasher = hashlib.sha256()
+    chunks: list[bytes] = []
+    total = 0
+    checked = False
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > MAX_FILE_SIZE:
+            raise too_large
+        chunks.append(chunk)
+        hasher.update(chunk)
+
+        if not checked and total >= _MAGIC_LEN:
+            head = chunks[0] if len(chunks[0]) >= _MAGIC_LEN else b"".join(chunks)
+            if detect_image_type(head) is None:
+                raise not_image
+            checked = True
+
+    content = b"".join(chunks)
+    if not checked and detect_image_type(content) is None:
+        raise not_image
+
+    try:
+        check_pixels(content, settings.max_image_pixels)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError:
+        raise not_image
+
+    return content, hasher.hexdigest()
+
+
+def _log_fields(doc_type: str, result: ValidationResponse) -> dict:
+    """Identificador del document per logs (sense PII en clar)."""
+    if doc_type == "dni":
+        return {"doc_redacted": redact_dni(result.datos.numero_documento)}
+    if doc_type == "nif":
+        return {"nif_redacted": redact_dni(result.datos.numero_nif)}
+    return {"matricula": result.datos.matricula}
+
+
+async def _ocr_image(
+    doc_type: Optional[str],
+    content: bytes,
+    digest: Optional[str],
+    preprocess: bool,
+    preprocess_mode: str,
+    log: logging.Logger,
+    tesseract_first: bool = False,
+) -> tuple[dict, int]:
+    """
+    (Pre-processament) → OCR d'una imatge → magatzem OCR.
+
+    `doc_type` None: el tipus encara no es coneix (/ocr/auto) i el text el guarda
+    el cridant amb _store_text un cop classificat.
+
+    `tesseract_first`: primer Tesseract; Vision només si el resultat no supera
+    Phase 2 (should_escalate_to_vision). Si Vision no està disponible es
+    retorna el resultat de Tesseract encara que no l'hagi superat.
+
+    Amb PREPROCESS_ORIENTATION=vision la sonda d'orientació ja fa OCR amb
+    Vision de cada rotació: el text de la guanyadora es reutilitza i no es fa
+    cap altra crida (els crèdits de la sonda es carreguen a l'API key).
+
+    Amb el circuit breaker de Vision obert es fa fallback a Tesseract
+    (VISION_BREAKER_FALLBACK_TESSERACT) o es respon 503 + Retry-After.
+
+    El pre-processament s'executa al pool acotat (preprocess_executor) dins
+    del mateix OCR_TIMEOUT_SECONDS que l'OCR; el temps de cada etapa, l'espera
+    a la cua i l'execució van a "preprocessing" del resultat
+    (meta.preprocessing de la resposta).
+
+    Returns:
+        (resultat OCR {"text", "confidence", "engine", ...}, durada OCR en ms)
+    """
+    # El pre-processament i l'OCR comparteixen el mateix temps màxim
+    deadline = time.monotonic() + OCR_TIMEOUT_SECONDS
+
+    # Camí en memòria: bytes de l'upload → (pre-processament) → Vision, sense fitxers temporals
+    ocr_input: bytes = content
+    probe_ocr: Optional[dict] = None
+    report: Optional[dict] = None
+    if preprocess:
+        # Import tardà: cv2/numpy només quan cal pre-processar (l'arrencada l'avança)
+        from app.services.preprocess_pipeline import preprocess_bytes
+
+        try:
+            # Al pool de pre-processament: la CPU no bloqueja l'event loop
+            (ocr_input, probe_ocr, report), queue_ms, run_ms = await asyncio.wait_for(
+                preprocess_executor.run(preprocess_bytes, content, preprocess_mode, doc_type),
+                timeout=OCR_TIMEOUT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            log.warning("preprocess_timeout")
+            raise
+        except Overloaded as e:
+            log.warning("preprocess_rejected", extra={"in_flight": preprocess_executor.in_flight})
+            raise HTTPException(status_code=e.status_code, detail=e.detail,
+                                headers={"Retry-After": str(e.retry_after)})
+        except Exception as e:
+            log.warning("preprocess_failed", extra={"error": str(e)})
+            ocr_input = content
+        else:
+            report = {**report, "queue_ms": queue_ms, "run_ms": run_ms}
+            log.info("preprocess", extra=report)
+
+    ocr_result, ocr_ms = await _recognize(
+        doc_type, ocr_input, probe_ocr, digest, preprocess, preprocess_mode, log, tesseract_first, deadline,
+    )
+    if report is not None:
+        ocr_result["preprocessing"] = report
+    return ocr_result, ocr_ms
+
+
+async def _recognize(
+    doc_type: Optional[str],
+    ocr_input: bytes,
+    probe_ocr: Optional[dict],
+    digest: Optional[str],
+    preprocess: bool,
+    preprocess_mode: str,
+    log: logging.Logger,
+    tesseract_first: bool,
+    deadline: float,
+) -> tuple[dict, int]:
+    """Escala de motors OCR sobre la imatge ja pre-processada (vegeu _ocr_image)."""
+    t0 = time.monotonic()
+
+    # --- Sonda d'orientació de Vision: ja té l'OCR de la rotació escollida ---
+    if probe_ocr is not None:
+        api_client = current_api_client.get()
+        if api_client is not None:
+            api_client.charge_vision_credits(probe_ocr["probe_calls"])
+        if probe_ocr["text"].strip():
+            log.info("ocr_probe_reused", extra={"probe_calls": probe_ocr["probe_calls"]})
+            if doc_type:
+                await _store_text(doc_type, digest, preprocess, preprocess_mode, probe_ocr, log)
+            return probe_ocr, round((time.monotonic() - t0) * 1000)
+
+    # --- Nivell 1: Tesseract (0 crèdits) ---
+    local_result: Optional[dict] = None
+    if tesseract_first and doc_type:
+        local_result = await _tesseract_tier(doc_type, ocr_input, log)
+        if local_result is not None and not local_result["escalation"]:
+            ocr_ms = round((time.monotonic() - t0) * 1000)
+            await _store_text(doc_type, digest, preprocess, preprocess_mode, local_result, log)
+            return local_result, ocr_ms
+
+    # --- Nivell 2: Google Vision ---
+    if not google_vision_service.initialized:
+        # Client encara no creat (arrencada en curs): sense bloquejar l'event loop
+        await run_in_threadpool(google_vision_service.initialize)
+    if not google_vision_service.is_available():
+        if local_result is not None:
+            log.warning("vision_unavailable_local_result")
+            return local_result, round((time.monotonic() - t0) * 1000)
+        raise HTTPException(status_code=503, detail="Motor OCR no disponible")
+
+    # Quota diària de crèdits Vision de l'API key (els hits de cache no en gasten)
+    api_client = current_api_client.get()
+    if api_client is not None and not api_client.reserve_vision_credit():
+        log.warning("vision_quota_exceeded", extra={"client": api_client.name})
+        if local_result is not None:
+            return local_result, round((time.monotonic() - t0) * 1000)
+        raise HTTPException(
+            status_code=429,
+            detail="Quota diària de crèdits Vision esgotada per aquesta API key.",
+            headers={"Retry-After": str(api_client.quota_retry_after())},
+        )
+
+    try:
+        # El timeout s'aplica dins del servei: un Vision penjat compta per al circuit breaker
+        ocr_result = await google_vision_service.detect_document_text_async(
+            ocr_input,
+            # Cada hedge és un crèdit Vision més, a compte de la mateixa API key
+            on_hedge=(lambda: api_client.charge_vision_credits(1)) if api_client is not None else None,
+            timeout=max(0.0, deadline - time.monotonic()),
+        )
+        ocr_result["engine"] = "google_vision"
+        if local_result is not None:
+            ocr_result["escalation"] = local_result["escalation"]
+    except CircuitOpenError as e:
+        if api_client is not None:
+            api_client.refund_vision_credit()
+        ocr_result = local_result or await _tesseract_fallback(ocr_input, e, log)
+    except asyncio.CancelledError:
+        # Cancel·lada (l'altra cara ha fallat, client desconnectat): el crèdit no es carrega
+        if api_client is not None:
+            api_client.refund_vision_credit()
+        raise
+    ocr_ms = round((time.monotonic() - t0) * 1000)
+
+    if doc_type:
+        await _store_text(doc_type, digest, preprocess, preprocess_mode, ocr_result, log)
+    return ocr_result, ocr_ms
+
+
+async def _tesseract_tier(doc_type: str, ocr_input: bytes, log: logging.Logger) -> Optional[dict]:
+    """
+    Nivell local de l'escala: Tesseract + Phase 1/2 + decisió d'escalar.
+
+    Returns:
+        resultat OCR amb "escalation" (None si s'accepta, o el motiu per anar a
+        Vision), o None si Tesseract no està disponible o ha fallat
+    """
+    if not tesseract_service.initialized:
+        await run_in_threadpool(tesseract_service.initialize)  # no bloquejar l'event loop
+    if not tesseract_service.is_available():
+        return None
+    try:
+        async with _tesseract_semaphore:
+            local = await asyncio.wait_for(
+                run_in_threadpool(tesseract_service.detect_text, ocr_input),
+                timeout=settings.tesseract_timeout_seconds,
+            )
+        local["engine"] = "tesseract"
+        result = parse_document(doc_type, local["text"], "tesseract", local["confidence"])
+        escalate, reason = should_escalate_to_vision(
+            doc_type, result, local["text"], local["confidence"], settings.ocr_tesseract_min_confidence,
+        )
+    except asyncio.TimeoutError:
+        log.warning("tesseract_tier_timeout")
+        return None
+    except Exception:
+        log.warning("tesseract_tier_failed")
+        return None
+
+    local["escalation"] = reason if escalate else None
+    if escalate:
+        log.info("ocr_escalated", extra={"reason": reason, "confidence": round(local["confidence"], 1)})
+    return local
+
+
+async def _tesseract_fallback(ocr_input: bytes, error: CircuitOpenError, log: logging.Logger) -> dict:
+    """OCR amb Tesseract mentre el circuit de Vision és obert, o 503 si no es pot."""
+    if settings.vision_breaker_fallback_tesseract and not tesseract_service.initialized:
+        await run_in_threadpool(tesseract_service.initialize)
+    if not (settings.vision_breaker_fallback_tesseract and tesseract_service.is_available()):
+        raise HTTPException(
+            status_code=503,
+            detail="Motor OCR temporalment no disponible. Torna-ho a provar més tard.",
+            headers={"Retry-After": str(error.retry_after)},
+        )
+
+    log.warning("vision_circuit_open_fallback")
+    async with _tesseract_semaphore:
+        result = await asyncio.wait_for(
+            run_in_threadpool(tesseract_service.detect_text, ocr_input),
+            timeout=OCR_TIMEOUT_SECONDS,
+        )
+    result["engine"] = "tesseract"
+    return result
+
+
+async def _store_text(doc_type: str, digest: Optional[str], preprocess: bool,
+                      preprocess_mode: str, ocr_result: dict, log: logging.Logger) -> None:
+    """Guarda el text OCR cru (re-parseig futur sense nous crèdits)."""
+    if not (digest and ocr_store.enabled):
+        return
+    try:
+        await run_in_threadpool(
+            ocr_store.put, digest, doc_type, ocr_result.get("engine", "google_vision"),
+            ocr_store.mode_key(preprocess, preprocess_mode), ocr_result,
+        )
+    except Exception:
+        log.warning("ocr_store_failed")
+
+
+async def process_document(
+    doc_type: str,
+    content: bytes,
+    preprocess: bool = False,
+    preprocess_mode: str = "standard",
+    digest: Optional[str] = None,
+) -> ValidationResponse:
+    """
+    Processa un document ja validat i retorna la resposta v1.
+
+    `digest` és el hash SHA-256 del contingut si ja s'ha calculat (read_upload).
+
+    Sistema de doble passada — 1 sol crèdit Vision per document:
+    - Phase 1: extracció raw (regex Python)
+    - Phase 2: validació creuada + codis normalitzats (Python pur, 0 crèdits)
+
+    Raises:
+        HTTPException 503 (motor no disponible), 504 (timeout), 500 (error intern)
+    """
+    log = logging.getLogger(f"ocr.{doc_type}")
+
+    # Cache per hash de contingut (opt-in): la mateixa imatge no torna a gastar crèdit Vision
+    if digest is None and (result_cache.enabled or ocr_store.enabled):
+        digest = content_hash(content)
+    cache_key: Optional[str] = None
+    if result_cache.enabled:
+        cache_key = result_cache.make_key(digest, doc_type, preprocess, preprocess_mode)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            log.info("ocr_cache_hit", extra={
+                **_log_fields(doc_type, cached),
+                "valido": cached.valido,
+            })
+            return cached
+
+    try:
+        ocr_result, ocr_ms = await _ocr_image(
+            doc_type, content, digest, preprocess, preprocess_mode, log,
+            tesseract_first=settings.ocr_tesseract_first and doc_type in settings.ocr_tesseract_first_types,
+        )
+
+        # Phase 1 + Phase 2
+        result = parse_document(doc_type, ocr_result["text"], ocr_result["engine"], ocr_result["confidence"])
+        if result.meta is not None:
+            result.meta.preprocessing = ocr_result.get("preprocessing")
+
+        log.info("ocr_vision_used" if ocr_result["engine"] == "google_vision" else "ocr_tesseract_used", extra={
+            **_log_fields(doc_type, result),
+            "confianza": result.confianza_global,
+            "valido": result.valido,
+            "errors": len(result.errores_detectados),
+            "alerts": len(result.alertas),
+            "durada_ms": ocr_ms,
+            "confidence": round(ocr_result["confidence"], 1),
+            "escalation": ocr_result.get("escalation"),
+        })
+
+        # TODO: si result.confianza_global < 85 → Claude text-only per refinament
+
+        log.info("ocr_success", extra={
+            **_log_fields(doc_type, result),
+            "confianza": result.confianza_global,
+            "valido": result.valido,
+            "engine": result.raw.ocr_engine,
+        })
+
+        if cache_key:
+            result_cache.set(cache_key, result)
+        return result
+
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timeout processant el document.")
+    except Exception:
+        log.exception("ocr_unexpected_error")
+        raise HTTPException(status_code=500, detail="Error intern processant el document.")
+
+
+async def _gather_or_cancel(*aws):
+    """
+    Com asyncio.gather, però la primera excepció cancel·la les altres tasques
+    (p.ex. un 400 del revers no deixa l'anvers gastant un crèdit Vision).
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def process_dni_sides(
+    front: bytes,
+    back: bytes,
+    preprocess: bool = False,
+    preprocess_mode: str = "standard",
+    front_digest: Optional[str] = None,
+    back_digest: Optional[str] = None,
+) -> DNIValidationResponse:
+    """
+    Processa anvers i revers d'un DNI/NIE en paral·lel i retorna una sola resposta v1.
+
+    Les dues imatges es llegeixen amb OCR alhora (amb micro-batching actiu,
+    en una sola crida batch_annotate_images). Cada cara passa per Phase 1;
+    les dades es combinen i Phase 2 valida el resultat amb les comprovacions
+    de coherència entre cares. 2 crèdits Vision (un per cara).
+
+    Raises:
+        HTTPException 503 (motor no disponible), 504 (timeout), 500 (error intern)
+    """
+    log = logging.getLogger("ocr.dni")
+
+    if result_cache.enabled or ocr_store.enabled:
+        front_digest = front_digest or content_hash(front)
+        back_digest = back_digest or content_hash(back)
+    cache_key: Optional[str] = None
+    if result_cache.enabled:
+        pair_digest = content_hash(f"{front_digest}:{back_digest}".encode())
+        cache_key = result_cache.make_key(pair_digest, "dni_sides", preprocess, preprocess_mode)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            log.info("ocr_cache_hit", extra={**_log_fields("dni", cached), "valido": cached.valido})
+            return cached
+
+    try:
+        (front_ocr, front_ms), (back_ocr, back_ms) = await _gather_or_cancel(
+            _ocr_image("dni", front, front_digest, preprocess, preprocess_mode, log),
+            _ocr_image("dni", back, back_digest, preprocess, preprocess_mode, log),
+        )
+
+        # Phase 1 per cara → combinació → Phase 2 amb coherència entre cares
+        front_data, front_mrz = dni_parser.parse(front_ocr["text"])
+        back_data, back_mrz = dni_parser.parse(back_ocr["text"])
+        result = dni_parser.validate_and_build_response(
+            dni_parser.merge_sides(front_data, back_data),
+            back_mrz or front_mrz,
+            "tesseract" if "tesseract" in (front_ocr["engine"], back_ocr["engine"]) else "google_vision",
+            min(front_ocr["confidence"], back_ocr["confidence"]),
+            extra_items=dni_parser.cross_check_sides(front_data, back_data),
+        )
+
+        log.info("ocr_success", extra={
+            **_log_fields("dni", result),
+            "confianza": result.confianza_global,
+            "valido": result.valido,
+            "engine": result.raw.ocr_engine,
+            "sides": 2,
+            "durada_ms": max(front_ms, back_ms),
+        })
+
+        if cache_key:
+            result_cache.set(cache_key, result)
+        return result
+
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timeout processant el document.")
+    except Exception:
+        log.exception("ocr_unexpected_error")
+        raise HTTPException(status_code=500, detail="Error intern processant el document.")
+
+
+async def process_auto(
+    content: bytes,
+    preprocess: bool = False,
+    preprocess_mode: str = "standard",
+    digest: Optional[str] = None,
+) -> ValidationResponse:
+    """
+    Processa un document de tipus desconegut amb una sola passada OCR.
+
+    El text es classifica per paraules clau (classify_document) i s'envia al
+    parser del tipus detectat. 1 crèdit Vision, igual que les rutes per tipus.
+
+    Raises:
+        HTTPException 422 (tipus no identificat), 503, 504, 500
+    """
+    log = logging.getLogger("ocr.auto")
+
+    if digest is None and (result_cache.enabled or ocr_store.enabled):
+        digest = content_hash(content)
+    cache_key: Optional[str] = None
+    if result_cache.enabled:
+        cache_key = result_cache.make_key(digest, "auto", preprocess, preprocess_mode)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            log.info("ocr_cache_hit", extra={"tipo_documento": cached.tipo_documento, "valido": cached.valido})
+            return cached
+
+    try:
+        ocr_result, ocr_ms = await _ocr_image(None, content, digest, preprocess, preprocess_mode, log)
+
+        doc_type, score, scores = classify_document(ocr_result["text"])
+        log.info("ocr_classified", extra={"doc_type": doc_type, "score": score, "scores": scores})
+        if doc_type is None:
+            raise HTTPException(
+                status_code=422,
+                detail="No s'ha pogut identificar el tipus de document. Acceptem DNI/NIE, permís de circulació o NIF.",
+            )
+
+        await _store_text(doc_type, digest, preprocess, preprocess_mode, ocr_result, log)
+
+        # Phase 1 + Phase 2 del parser detectat
+        result = parse_document(doc_type, ocr_result["text"], ocr_result["engine"], ocr_result["confidence"])
+        result.meta.classification_confidence = score
+        result.meta.preprocessing = ocr_result.get("preprocessing")
+
+        log.info("ocr_success", extra={
+            **_log_fields(doc_type, result),
+            "confianza": result.confianza_global,
+            "valido": result.valido,
+            "engine": result.raw.ocr_engine,
+            "durada_ms": ocr_ms,
+        })
+
+        if cache_key:
+            result_cache.set(cache_key, result)
+        return result
+
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timeout processant el document.")
+    except Exception:
+        log.exception("ocr_unexpected_error")
+        raise HTTPException(status_code=500, detail="Error intern processant el document.")
@@ -1,19 +1,91 @@
 """
 Servei de Google Cloud Vision
+
+El client (google.cloud.vision, credencials, canal gRPC) es crea a
+initialize(), no en importar el mòdul: l'arrencada ho fa en paral·lel amb la
+resta de serveis (app.services.startup) i, si no, el primer ús.
 """
+import asyncio
 import json
-from google.cloud import vision
-from google.oauth2 import service_account
+import threading
+from fastapi.concurrency import run_in_threadpool
 from app.config import settings
-from typing import Optional
+from app.services.vision_batcher import VisionBatcher
+from app.services.vision_resilience import CircuitBreaker, CircuitOpenError, Hedger
+from app.utils.image_io import ImageInput, image_content
+from typing import Callable, Optional
+
+
+def _vision():
+    """Mòdul google.cloud.vision (import tardà: ~0,4 s)."""
+    from google.cloud import vision
+    return vision
+
+
+class VisionResponseError(Exception):
+    """Error de Vision per a una imatge concreta (el servei respon: no compta per al circuit breaker)."""
 
 
 class GoogleVisionService:
     """Wrapper per Google Cloud Vision API"""
 
     def __init__(self):
-        self.client: Optional[vision.ImageAnnotatorClient] = None
-        self._initialize_client()
+        self._client = None
+        self._credentials = None
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+        # Client gRPC async: es crea dins l'event loop en el primer ús (lligat al loop)
+        self._async_client = None
+        self._async_owner: tuple = (None, None)  # (loop, client síncron) per al qual s'ha creat
+
+        # Micro-batching de document_text_detection (opt-in)
+        self.batcher: Optional[VisionBatcher] = None
+        if settings.vision_batch_enabled:
+            self.batcher = VisionBatcher(
+                self.batch_document_text_async if settings.vision_async_enabled else self.batch_document_text,
+                window_ms=settings.vision_batch_window_ms,
+                max_size=settings.vision_batch_max_size,
+                max_bytes=settings.vision_batch_max_bytes,
+            )
+
+        # Cua de latència i errors de Vision (camí async de les rutes)
+        self.hedger = Hedger(
+            enabled=settings.vision_hedge_enabled,
+            percentile=settings.vision_hedge_percentile,
+            min_delay_ms=settings.vision_hedge_min_delay_ms,
+            max_delay_ms=settings.vision_hedge_max_delay_ms,
+            budget_ratio=settings.vision_hedge_budget_ratio,
+        )
+        self.breaker = CircuitBreaker(
+            failure_rate=settings.vision_breaker_failure_rate,
+            min_requests=settings.vision_breaker_min_requests,
+            open_seconds=settings.vision_breaker_open_seconds,
+            enabled=settings.vision_breaker_enabled,
+        )
+
+    @property
+    def initialized(self) -> bool:
+        return self._initialized
+
+    @property
+    def client(self):
+        """Client síncron (ImageAnnotatorClient o fals); es crea en el primer accés."""
+        if not self._initialized:
+            self.initialize()
+        return self._client
+
+    @client.setter
+    def client(self, value) -> None:
+        self._client = value
+        self._initialized = True
+
+    def initialize(self) -> None:
+        """Crea el client si encara no existeix (idempotent, thread-safe)."""
+        with self._init_lock:
+            if not self._initialized:
+                self._initialize_client()
+                self._initialized = True
 
     def _initialize_client(self):
         """Inicialitza el client de Google Vision"""
@@ -21,34 +93,68 @@ class GoogleVisionService:
             print("⚠️  Google Cloud Vision deshabilitat")
             return
 
+        if settings.google_cloud_vision_fake:
+            from app.services.vision_fake import FakeImageAnnotatorClient
+            self._client = FakeImageAnnotatorClient()
+            print("⚠️  Google Vision: client fals local (0 crèdits)")
+            return
+
+        vision = _vision()
         try:
             # Credencials des de variable d'entorn JSON
             if settings.google_cloud_credentials_json:
+                from google.oauth2 import service_account
+
                 credentials_dict = json.loads(settings.google_cloud_credentials_json)
                 credentials = service_account.Credentials.from_service_account_info(credentials_dict)
-                self.client = vision.ImageAnnotatorClient(credentials=credentials)
+                self._credentials = credentials
+                self._client = vision.ImageAnnotatorClient(credentials=credentials)
                 print("✅ Google Vision: Credencials carregades des de variable d'entorn")
             else:
                 # Usar Application Default Credentials
-                self.client = vision.ImageAnnotatorClient()
+                self._client = vision.ImageAnnotatorClient()
                 print("⚠️  Google Vision: Usant Application Default Credentials")
 
             print(f"✅ Client Google Vision creat (Project: {settings.google_cloud_project_id or 'N/A'})")
 
         except Exception as e:
             print(f"❌ Error inicialitzant Google Vision: {e}")
-            self.client = None
+            self._client = None
 
     def is_available(self) -> bool:
         """Verifica si Google Vision està disponible"""
         return self.client is not None
 
-    def detect_text(self, image_path: str) -> dict:
+    async def warm_up(self, timeout: float = 10) -> None:
+        """
+        Obre el canal gRPC que faran servir les peticions, sense cap crida facturable.
+
+        Raises:
+            RuntimeError si Vision no està disponible; TimeoutError si el canal no connecta
+        """
+        if not self.initialized:
+            await run_in_threadpool(self.initialize)
+        if not self.is_available():
+            raise RuntimeError("Google Vision no està disponible")
+
+        async_client = self._get_async_client()
+        if async_client is not None:
+            channel = getattr(getattr(async_client, "transport", None), "grpc_channel", None)
+            if channel is not None:
+                await asyncio.wait_for(channel.channel_ready(), timeout=timeout)
+            return
+
+        channel = getattr(getattr(self.client, "transport", None), "grpc_channel", None)
+        if channel is not None:
+            import grpc
+            await run_in_threadpool(grpc.channel_ready_future(channel).result, timeout)
+
+    def detect_text(self, image: ImageInput) -> dict:
         """
         Detecta text en una imatge
 
         Args:
-            image_path: Path a la imatge
+            image: Bytes de la imatge, ndarray o path
 
         Returns:
             dict amb 'text', 'confidence' i 'annotations'
@@ -56,10 +162,7 @@ class GoogleVisionService:
         if not self.is_available():
             raise RuntimeError("Google Vision no està disponible")
 
-        with open(image_path, "rb") as image_file:
-            content = image_file.read()
-
-        image = vision.Image(content=content)
+        image = _vision().Image(content=image_content(image))
         response = self.client.text_detection(image=image)
 
         if response.error.message:
@@ -86,38 +189,192 @@ class GoogleVisionService:
             "annotations": annotations
         }
 
-    def detect_document_text(self, image_path: str) -> dict:
+    def detect_document_text(self, image: ImageInput) -> dict:
         """
         Detecta text de documents (millor per documents estructurats)
 
         Args:
-            image_path: Path a la imatge
+            image: Bytes de la imatge, ndarray o path
 
         Returns:
-            dict amb 'text' i 'confidence'
+            dict amb 'text', 'confidence' i 'annotations' (paraules amb bounding box i confiança)
         """
         if not self.is_available():
             raise RuntimeError("Google Vision no està disponible")
 
-        with open(image_path, "rb") as image_file:
-            content = image_file.read()
-
-        image = vision.Image(content=content)
+        image = _vision().Image(content=image_content(image))
         response = self.client.document_text_detection(image=image)
 
+        return self._parse_document_response(response)
+
+    def batch_document_text(self, images: list[ImageInput]) -> list:
+        """
+        document_text_detection per diverses imatges en una sola crida (batch_annotate_images)
+
+        Args:
+            images: fins a 16 imatges (límit de Vision)
+
+        Returns:
+            Una entrada per imatge, en el mateix ordre: dict (com detect_document_text) o Exception
+        """
+        if not self.is_available():
+            raise RuntimeError("Google Vision no està disponible")
+
+        batch_response = self.client.batch_annotate_images(requests=self._batch_requests(images))
+        return self._parse_batch_response(batch_response)
+
+    async def batch_document_text_async(self, images: list[ImageInput]) -> list:
+        """Com batch_document_text, amb el client gRPC async (fallback: threadpool)."""
+        client = self._get_async_client()
+        if client is None:
+            return await run_in_threadpool(self.batch_document_text, images)
+
+        batch_response = await client.batch_annotate_images(requests=self._batch_requests(images))
+        return self._parse_batch_response(batch_response)
+
+    async def detect_document_text_async(self, image: ImageInput,
+                                         on_hedge: Optional[Callable[[], None]] = None,
+                                         timeout: Optional[float] = None) -> dict:
+        """
+        Versió async de detect_document_text per les rutes.
+
+        - VISION_BATCH_ENABLED: s'agrupa amb les peticions concurrents (batch_annotate_images)
+        - VISION_ASYNC_ENABLED: crida directa amb ImageAnnotatorAsyncClient, sense ocupar
+          cap thread (centenars de crides en vol per worker)
+        - Fallback: client síncron al threadpool
+
+        Amb VISION_HEDGE_ENABLED s'envia una segona crida si la primera supera el
+        percentil de latència observat. El circuit breaker talla les crides quan
+        la taxa d'errors és alta. `on_hedge` es crida si s'envia la segona crida
+        (per carregar el crèdit extra a l'API key).
+
+        `timeout` (el temps que queda de la petició) s'aplica aquí dins perquè
+        un Vision que no respon compti com a error per al circuit breaker; una
+        cancel·lació de fora (l'altra cara, client desconnectat) no compta.
+
+        Raises:
+            CircuitOpenError si el circuit breaker és obert
+            asyncio.TimeoutError si Vision no respon dins de `timeout`
+        """
+        if not self.is_available():
+            raise RuntimeError("Google Vision no està disponible")
+        if timeout is not None and timeout <= 0:
+            raise asyncio.TimeoutError()  # sense temps: Vision no s'arriba a cridar
+
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.breaker.retry_after())
+
+        content = image_content(image)
+        try:
+            result = await asyncio.wait_for(
+                self.hedger.run(lambda: self._document_text_once(content), on_hedge), timeout,
+            )
+        except VisionResponseError:
+            self.breaker.record(failed=False)  # Vision ha respost
+            raise
+        except asyncio.TimeoutError:
+            self.breaker.record(failed=True)   # Vision penjat: és l'error que el breaker ha de veure
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release()             # cancel·lada des de fora: no diu res de Vision
+            raise
+        except BaseException:
+            self.breaker.record(failed=True)   # error de transport, quota, timeout...
+            raise
+        self.breaker.record(failed=False)
+        return result
+
+    async def _document_text_once(self, content: bytes) -> dict:
+        """Una crida document_text_detection pel camí async configurat."""
+        if self.batcher is not None:
+            return await self.batcher.submit(content)
+
+        client = self._get_async_client()
+        if client is None:
+            return await run_in_threadpool(self.detect_document_text, content)
+
+        response = await client.document_text_detection(image=_vision().Image(content=content))
+        return self._parse_document_response(response)
+
+    def _get_async_client(self):
+        """
+        Retorna el client async per l'event loop actual, o None per usar el camí síncron.
+
+        El canal gRPC aio queda lligat al loop on es crea: si canvia el loop (o el
+        client síncron, p.ex. en tests), es torna a crear.
+        """
+        if not settings.vision_async_enabled or self.client is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        if self._async_owner == (loop, self.client):
+            return self._async_client
+
+        from app.services.vision_fake import FakeImageAnnotatorClient, FakeImageAnnotatorAsyncClient
+
+        async_client = None
+        try:
+            vision = _vision()
+            if isinstance(self.client, FakeImageAnnotatorClient):
+                async_client = FakeImageAnnotatorAsyncClient(self.client)
+            elif isinstance(self.client, vision.ImageAnnotatorClient):
+                async_client = vision.ImageAnnotatorAsyncClient(credentials=self._credentials)
+        except Exception as e:
+            print(f"⚠️  Google Vision: client async no disponible, usant threadpool ({e})")
+
+        self._async_client = async_client
+        self._async_owner = (loop, self.client)
+        return async_client
+
+    @staticmethod
+    def _batch_requests(images: list[ImageInput]) -> list:
+        vision = _vision()
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        return [
+            vision.AnnotateImageRequest(image=vision.Image(content=image_content(image)), features=[feature])
+            for image in images
+        ]
+
+    def _parse_batch_response(self, batch_response) -> list:
+        results = []
+        for response in batch_response.responses:
+            try:
+                results.append(self._parse_document_response(response))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _parse_document_response(self, response) -> dict:
+        """AnnotateImageResponse (DOCUMENT_TEXT_DETECTION) → dict de resultat."""
         if response.error.message:
-            raise Exception(f"Google Vision API error: {response.error.message}")
+            raise VisionResponseError(f"Google Vision API error: {response.error.message}")
 
         if not response.full_text_annotation:
-            return {"text": "", "confidence": 0.0}
+            return {"text": "", "confidence": 0.0, "annotations": []}
 
         full_text = response.full_text_annotation.text
 
         return {
             "text": full_text,
-            "confidence": 95.0
+            "confidence": 95.0,
+            "annotations": self._word_annotations(response.full_text_annotation)
         }
 
+    @staticmethod
+    def _word_annotations(full_text_annotation) -> list:
+        """Paraules de document_text_detection amb bounding box i confiança (0-100)."""
+        annotations = []
+        for page in full_text_annotation.pages:
+            for block in page.blocks:
+                for paragraph in block.paragraphs:
+                    for word in paragraph.words:
+                        annotations.append({
+                            "text": "".join(symbol.text for symbol in word.symbols),
+                            "vertices": [(v.x, v.y) for v in word.bounding_box.vertices],
+                            "confidence": round(word.confidence * 100, 1),
+                        })
+        return annotations
+
 
 # Singleton
 google_vision_service = GoogleVisionService()
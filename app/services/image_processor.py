@@ -6,49 +6,131 @@ import numpy as np
 from PIL import Image, ImageEnhance
 from typing import Tuple, Optional
 import os
-import tempfile
+from app.config import settings
 from app.services.google_vision_service import google_vision_service
+from app.services.tesseract_service import tesseract_service
+from app.utils.image_io import ImageInput, decode_image, encode_image
+
+# Rotació en sentit horari (graus) → codi cv2.rotate
+_ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+# Costat llarg de la miniatura per detectar l'orientació en local
+_ORIENTATION_THUMB = 1000
+
+# Confiança OSD mínima de Tesseract per girar la imatge
+_OSD_MIN_CONFIDENCE = 2.0
+
+# Desplaçament mínim de la tinta dins les línies (fracció de l'alçada) per girar 180°
+_UPSIDE_DOWN_MIN = 0.008
+
+# Miniatura per a les mètriques de qualitat (preprocess_mode=auto)
+_QUALITY_THUMB = 800
+
+# Miniatura per estimar vores, orientació i inclinació (plan_geometry)
+_GEOMETRY_THUMB = 1000
+
+
+def _scale(factor: float) -> np.ndarray:
+    """Matriu homogènia 3x3 d'escalat uniforme."""
+    return np.diag([factor, factor, 1.0])
+
+
+def _rotation90(degrees: int, size: tuple[int, int]) -> tuple[np.ndarray, tuple[int, int]]:
+    """Matriu homogènia d'un gir horari de 90/180/270 graus i la mida resultant."""
+    w, h = size
+    if degrees == 90:
+        return np.array([[0, -1, h - 1], [1, 0, 0], [0, 0, 1]], dtype=float), (h, w)
+    if degrees == 180:
+        return np.array([[-1, 0, w - 1], [0, -1, h - 1], [0, 0, 1]], dtype=float), (w, h)
+    if degrees == 270:
+        return np.array([[0, 1, 0], [-1, 0, w - 1], [0, 0, 1]], dtype=float), (h, w)
+    return np.eye(3), (w, h)
 
 
 class ImageProcessor:
     """Processador d'imatges amb OpenCV i Pillow"""
 
     @staticmethod
-    def detect_and_fix_rotation(image: np.ndarray) -> np.ndarray:
+    def estimate_skew(image: np.ndarray, hough_threshold: int = 200) -> float:
         """
-        Detecta i corregeix la rotació de la imatge
+        Angle de desviació (graus) de les línies dominants, 0 si no se'n troben
         """
         # Convertir a escala de grisos
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
 
         # Detectar vores
         edges = cv2.Canny(gray, 50, 150, apertureSize=3)
 
         # Detectar línies amb Hough Transform
-        lines = cv2.HoughLines(edges, 1, np.pi / 180, 200)
-
-        if lines is not None and len(lines) > 0:
-            # Calcular angle mitjà
-            angles = []
-            for line in lines[:10]:  # Usar les primeres 10 línies
-                rho, theta = line[0]
-                angle = np.degrees(theta) - 90
-                angles.append(angle)
-
-            median_angle = np.median(angles)
-
-            # Si l'angle és significatiu, rotar
-            if abs(median_angle) > 0.5:
-                (h, w) = image.shape[:2]
-                center = (w // 2, h // 2)
-                M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-                rotated = cv2.warpAffine(image, M, (w, h),
-                                         flags=cv2.INTER_CUBIC,
-                                         borderMode=cv2.BORDER_REPLICATE)
-                return rotated
+        lines = cv2.HoughLines(edges, 1, np.pi / 180, hough_threshold)
+
+        if lines is None or len(lines) == 0:
+            return 0.0
+
+        # Calcular angle mitjà
+        angles = []
+        for line in lines[:10]:  # Usar les primeres 10 línies
+            rho, theta = line[0]
+            angle = np.degrees(theta) - 90
+            angles.append(angle)
+
+        return float(np.median(angles))
+
+    @staticmethod
+    def detect_and_fix_rotation(image: np.ndarray) -> np.ndarray:
+        """
+        Detecta i corregeix la rotació de la imatge
+        """
+        median_angle = ImageProcessor.estimate_skew(image)
+
+        # Si l'angle és significatiu, rotar
+        if abs(median_angle) > 0.5:
+            (h, w) = image.shape[:2]
+            center = (w // 2, h // 2)
+            M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
+            rotated = cv2.warpAffine(image, M, (w, h),
+                                     flags=cv2.INTER_CUBIC,
+                                     borderMode=cv2.BORDER_REPLICATE)
+            return rotated
 
         return image
 
+    @staticmethod
+    def quality_metrics(image: np.ndarray) -> dict:
+        """
+        Mètriques de qualitat barates sobre una miniatura (preprocess_mode=auto)
+
+        - blur: variància del Laplacià (baixa = desenfocada)
+        - sharpness: blur / variància dels grisos (desenfocament independent del contrast)
+        - contrast: desviació estàndard dels grisos
+        - brightness: mitjana dels grisos (0-255)
+        - glare: fracció de píxels saturats (≥250)
+        - background: mediana dels grisos (fons blanc ≈ paper escanejat)
+        - skew: desviació estimada de les línies (graus)
+        """
+        height, width = image.shape[:2]
+        thumb = ImageProcessor._thumbnail(image, _QUALITY_THUMB)
+        gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY) if thumb.ndim == 3 else thumb
+        # Llindar de Hough proporcional a la mida (200 per a 2000 px d'amplada)
+        hough_threshold = max(40, int(200 * gray.shape[1] / 2000))
+        blur = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        contrast = float(gray.std())
+        return {
+            "width": width,
+            "height": height,
+            "blur": round(blur, 1),
+            "sharpness": round(blur / max(contrast ** 2, 1.0), 3),
+            "contrast": round(contrast, 1),
+            "brightness": round(float(gray.mean()), 1),
+            "glare": round(float((gray >= 250).mean()), 4),
+            "background": float(np.median(gray)),
+            "skew": round(ImageProcessor.estimate_skew(gray, hough_threshold), 2),
+        }
+
     @staticmethod
     def _calculate_horizontal_score(annotations: list) -> float:
         """
@@ -87,15 +169,130 @@ class ImageProcessor:
         # Retornar percentatge de text horitzontal
         return (horizontal_count / total_count) * 100
 
+    @staticmethod
+    def rotate(image: np.ndarray, degrees: int) -> np.ndarray:
+        """Gira 0/90/180/270 graus en sentit horari."""
+        code = _ROTATIONS.get(degrees % 360)
+        return image if code is None else cv2.rotate(image, code)
+
+    @staticmethod
+    def _thumbnail(image: np.ndarray, max_side: int = _ORIENTATION_THUMB) -> np.ndarray:
+        height, width = image.shape[:2]
+        scale = max_side / max(height, width)
+        if scale >= 1:
+            return image
+        return cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def _text_line_count(binary: np.ndarray) -> int:
+        """Nombre de línies de text horitzontals (blobs molt més amples que alts)."""
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3))
+        closed = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(closed)
+        widths = stats[1:, cv2.CC_STAT_WIDTH]
+        heights = stats[1:, cv2.CC_STAT_HEIGHT]
+        lines = (widths > 3 * heights) & (heights >= 5) & (widths >= 30)
+        return int(np.count_nonzero(lines))
+
+    @staticmethod
+    def _upside_down_score(binary: np.ndarray) -> float:
+        """
+        > 0 si el text sembla cap per avall.
+
+        En llatí hi ha més ascendents que descendents: dins de cada línia, la
+        tinta es concentra a la part de baix de la caixa. Girat 180°, a dalt.
+        """
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 3))
+        closed = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(closed)
+        offsets = []
+        for x, y, w, h, _ in stats[1:]:
+            if w <= 3 * h or h < 8:
+                continue
+            rows = binary[y:y + h, x:x + w].sum(axis=1).astype(np.float64)
+            if rows.sum() == 0:
+                continue
+            centroid = (rows * np.arange(h)).sum() / rows.sum()
+            offsets.append((centroid - (h - 1) / 2) / h)  # + = tinta a baix
+        return -float(np.mean(offsets)) if offsets else 0.0
+
+    @staticmethod
+    def detect_orientation_geometry(image: np.ndarray) -> int:
+        """
+        Orientació per geometria de línies de text (sense OCR, 0 crèdits).
+
+        Returns:
+            graus a girar en sentit horari (0/90/180/270)
+        """
+        gray = cv2.cvtColor(ImageProcessor._thumbnail(image), cv2.COLOR_BGR2GRAY)
+        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+
+        # Eix: línies horitzontals o verticals
+        horizontal = ImageProcessor._text_line_count(binary)
+        vertical = ImageProcessor._text_line_count(np.ascontiguousarray(binary.T))
+        base = 90 if vertical > 1.5 * max(horizontal, 1) else 0
+        upright = ImageProcessor.rotate(binary, base)
+
+        # Sentit: 0 o 180 (només si el senyal és clar)
+        return (base + 180) % 360 if ImageProcessor._upside_down_score(upright) > _UPSIDE_DOWN_MIN else base
+
+    @staticmethod
+    def detect_orientation(image: np.ndarray) -> tuple[int, str]:
+        """
+        Orientació local, sense crèdits Vision: Tesseract OSD sobre una
+        miniatura i, si no hi és o no n'està segur, geometria de línies.
+
+        Returns:
+            (graus a girar en sentit horari, mètode)
+        """
+        osd = tesseract_service.detect_orientation(ImageProcessor._thumbnail(image))
+        if osd is not None and osd[1] >= _OSD_MIN_CONFIDENCE:
+            return osd[0], "tesseract_osd"
+        return ImageProcessor.detect_orientation_geometry(image), "geometry"
+
     @staticmethod
     def detect_and_fix_orientation(image: np.ndarray) -> np.ndarray:
         """
         Detecta i corregeix orientació de 90/180/270 graus
-        Utilitza Google Vision per provar cada orientació
+
+        PREPROCESS_ORIENTATION: "local" (per defecte, 0 crèdits), "vision"
+        (sonda de 4 crides Vision, opt-in) o "off".
+        """
+        mode = settings.preprocess_orientation
+        if mode == "off":
+            return image
+        if mode == "vision":
+            return ImageProcessor.detect_and_fix_orientation_vision(image)
+
+        try:
+            degrees, method = ImageProcessor.detect_orientation(image)
+        except Exception as e:
+            print(f"⚠️  Error detectant orientació: {e}")
+            return image
+        if degrees:
+            print(f"🔄 Orientació corregida: {degrees}° ({method})")
+        return ImageProcessor.rotate(image, degrees)
+
+    @staticmethod
+    def detect_and_fix_orientation_vision(image: np.ndarray) -> np.ndarray:
+        """
+        Detecta i corregeix orientació de 90/180/270 graus
+        Utilitza Google Vision per provar cada orientació (4 crèdits)
+        """
+        return ImageProcessor.probe_orientation_vision(image)[0]
+
+    @staticmethod
+    def probe_orientation_vision(image: np.ndarray) -> tuple[np.ndarray, Optional[dict]]:
+        """
+        Sonda d'orientació amb Google Vision (una crida detect_text per rotació).
+
+        Returns:
+            (imatge orientada, OCR de la rotació escollida amb "engine",
+            "source" i "probe_calls"; None si no se n'ha obtingut cap)
         """
         if not google_vision_service.is_available():
             print("⚠️  Google Vision no disponible, saltant detecció d'orientació")
-            return image
+            return image, None
 
         try:
             # Provar cada orientació possible
@@ -110,18 +307,18 @@ class ImageProcessor:
             best_image = image
             best_angle_name = "0°"
             original_score = 0
+            # OCR de cada rotació: el de la guanyadora es reutilitza com a resultat final
+            results: dict[str, dict] = {}
+            calls = 0
 
             print("🔄 Detectant orientació amb Google Vision...")
 
             for angle, rotated, angle_name in orientations:
                 try:
-                    # Guardar imatge rotada temporalment
-                    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp_file:
-                        tmp_path = tmp_file.name
-                        cv2.imwrite(tmp_path, rotated)
-
-                    # Detectar text amb Google Vision
-                    result = google_vision_service.detect_text(tmp_path)
+                    # Detectar text amb Google Vision (imatge codificada en memòria)
+                    calls += 1
+                    result = google_vision_service.detect_text(encode_image(rotated))
+                    results[angle_name] = result
                     annotations = result.get('annotations', [])
 
                     # Calcular score basat en text horitzontal
@@ -142,9 +339,6 @@ class ImageProcessor:
                         best_image = rotated
                         best_angle_name = angle_name
 
-                    # Esborrar fitxer temporal
-                    os.unlink(tmp_path)
-
                 except Exception as e:
                     print(f"⚠️  Error provant orientació {angle_name}: {e}")
                     continue
@@ -163,11 +357,15 @@ class ImageProcessor:
                 best_image = image
                 best_angle_name = "0°"
 
-            return best_image
+            probe_ocr = results.get(best_angle_name)
+            if probe_ocr is not None:
+                probe_ocr = {**probe_ocr, "engine": "google_vision",
+                             "source": "orientation_probe", "probe_calls": calls}
+            return best_image, probe_ocr
 
         except Exception as e:
             print(f"⚠️  Error detectant orientació: {e}")
-            return image
+            return image, None
 
 
     @staticmethod
@@ -196,6 +394,25 @@ class ImageProcessor:
         """
         return cv2.fastNlMeansDenoisingColored(image, None, 10, 10, 7, 21)
 
+    @staticmethod
+    def denoise_lite(image: np.ndarray) -> np.ndarray:
+        """
+        Elimina soroll en una fracció del temps de denoise()
+
+        Filtre bilateral només a la luminància (on és el text) i mediana al
+        color. Cost lineal amb els píxels (≈0,1 s a 2000 px, enfront de ≈8 s
+        de fastNlMeansDenoisingColored) i error similar respecte de la
+        imatge neta (bench_denoise.py).
+        """
+        if image.ndim == 2:
+            return cv2.bilateralFilter(image, 7, 40, 7)
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        l, a, b = cv2.split(lab)
+        l = cv2.bilateralFilter(l, 7, 40, 7)
+        a = cv2.medianBlur(a, 5)
+        b = cv2.medianBlur(b, 5)
+        return cv2.cvtColor(cv2.merge([l, a, b]), cv2.COLOR_LAB2BGR)
+
     @staticmethod
     def binarize(image: np.ndarray) -> np.ndarray:
         """
@@ -273,9 +490,12 @@ class ImageProcessor:
         return None
 
     @staticmethod
-    def perspective_transform(image: np.ndarray, points: np.ndarray) -> np.ndarray:
+    def perspective_matrix(points: np.ndarray) -> tuple[np.ndarray, tuple[int, int]]:
         """
-        Aplica transformació de perspectiva per enderreçar el document
+        Matriu de perspectiva que enderreça el quadrilàter `points`
+
+        Returns:
+            (matriu 3x3, (amplada, alçada) del document enderreçat)
         """
         # Assegurar que points té forma (4, 2)
         if points.shape != (4, 2):
@@ -309,17 +529,159 @@ class ImageProcessor:
             [0, maxHeight - 1]], dtype="float32")
 
         # Transformació
-        M = cv2.getPerspectiveTransform(rect, dst)
-        warped = cv2.warpPerspective(image, M, (maxWidth, maxHeight))
+        return cv2.getPerspectiveTransform(rect, dst), (maxWidth, maxHeight)
+
+    @staticmethod
+    def perspective_transform(image: np.ndarray, points: np.ndarray) -> np.ndarray:
+        """
+        Aplica transformació de perspectiva per enderreçar el document
+        """
+        M, size = ImageProcessor.perspective_matrix(points)
+        return cv2.warpPerspective(image, M, size)
+
+    @staticmethod
+    def plan_geometry(image: np.ndarray, find_boundaries: bool = False, orientation: bool = True,
+                      skew: bool = True, max_width: int = 2000) -> tuple[np.ndarray, tuple[int, int], dict]:
+        """
+        Geometria completa estimada sobre miniatures, sense tocar la imatge
+
+        Vores del document, redimensionament, orientació 0/90/180/270 (local)
+        i inclinació es calculen a ≤1000 px i es componen en una sola matriu
+        per a la resolució completa (una sola interpolació amb warp_geometry).
+
+        Returns:
+            (matriu 3x3 completa → sortida, (amplada, alçada) de sortida,
+            {"boundaries", "orientation", "skew"})
+        """
+        height, width = image.shape[:2]
+        thumb = ImageProcessor._thumbnail(image, _GEOMETRY_THUMB)
+        t = thumb.shape[1] / width  # completa → miniatura
+        info = {"boundaries": False, "orientation": 0, "skew": 0.0}
+
+        # 1. Vores del document (a la miniatura, escalades a resolució completa)
+        M = np.eye(3)
+        size = (width, height)
+        if find_boundaries:
+            quad = ImageProcessor.detect_document_boundaries(thumb)
+            if quad is not None:
+                M, size = ImageProcessor.perspective_matrix(quad.reshape(4, 2).astype("float32") / t)
+                info["boundaries"] = True
+
+        # 2. Redimensionament (com resize_if_needed)
+        if size[0] > max_width:
+            r = max_width / size[0]
+            M = _scale(r) @ M
+            size = (max_width, int(size[1] * r))
+
+        def preview() -> np.ndarray:
+            # Vista prèvia barata: la miniatura amb la geometria acumulada
+            p = min(1.0, _GEOMETRY_THUMB / max(size))
+            return cv2.warpPerspective(thumb, _scale(p) @ M @ _scale(1 / t),
+                                       (max(1, int(size[0] * p)), max(1, int(size[1] * p))),
+                                       borderMode=cv2.BORDER_REPLICATE)
+
+        # 3. Orientació 0/90/180/270 (Tesseract OSD o geometria)
+        if orientation:
+            try:
+                degrees, method = ImageProcessor.detect_orientation(preview())
+            except Exception as e:
+                print(f"⚠️  Error detectant orientació: {e}")
+                degrees = 0
+            if degrees:
+                print(f"🔄 Orientació corregida: {degrees}° ({method})")
+                R, size = _rotation90(degrees, size)
+                M = R @ M
+                info["orientation"] = degrees
+
+        # 4. Inclinació (Hough a la vista prèvia; l'angle no depèn de l'escala)
+        angle = 0.0
+        if skew:
+            small = preview()
+            angle = ImageProcessor.estimate_skew(small, max(40, int(200 * small.shape[1] / 2000)))
+        if abs(angle) > 0.5:
+            A = np.vstack([cv2.getRotationMatrix2D((size[0] // 2, size[1] // 2), angle, 1.0), [0, 0, 1]])
+            M = A @ M
+            info["skew"] = round(angle, 2)
+
+        return M, size, info
+
+    @staticmethod
+    def warp_geometry(image: np.ndarray, M: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+        """
+        Aplica la matriu de plan_geometry a la imatge completa (una interpolació)
+
+        Si la matriu és la identitat, retorna la mateixa imatge sense copiar-la.
+        """
+        height, width = image.shape[:2]
+        if size == (width, height) and np.allclose(M, np.eye(3)):
+            return image
+
+        # Reducció de 4x o més: primer una decimació entera per àrea fins a
+        # ~2x la mida final (evita aliasing al text)
+        scale = float(np.sqrt(abs(np.linalg.det(M[:2, :2]))))
+        factor = int(1 / (2 * scale)) if scale > 0 else 1
+        if factor >= 2:
+            image = cv2.resize(image, (max(1, width // factor), max(1, height // factor)),
+                               interpolation=cv2.INTER_AREA)
+            M = M @ _scale(factor)
+
+        return cv2.warpPerspective(image, M, size, flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+    @staticmethod
+    def process_image(image: np.ndarray, mode: str = "standard") -> np.ndarray:
+        """
+        Processa una imatge ja descodificada per millorar OCR (tot en memòria)
 
-        return warped
+        Args:
+            image: ndarray BGR
+            mode: "standard", "aggressive", "document"
+
+        Returns:
+            ndarray processat
+        """
+        return ImageProcessor.process_image_with_ocr(image, mode=mode)[0]
+
+    @staticmethod
+    def process_image_with_ocr(image: np.ndarray, mode: str = "standard") -> tuple[np.ndarray, Optional[dict]]:
+        """
+        Com process_image, però retorna també l'OCR que la sonda d'orientació
+        de Vision (PREPROCESS_ORIENTATION=vision) ja ha fet de la rotació
+        escollida, perquè el cridant no torni a enviar la imatge a Vision.
+
+        Les etapes de cada mode (i el mode "auto") són a app.services.preprocess_pipeline.
+
+        Returns:
+            (ndarray processat, resultat OCR de la sonda o None)
+        """
+        from app.services import preprocess_pipeline
+
+        result = preprocess_pipeline.run(image, mode)
+        return result.image, result.probe_ocr
+
+    @staticmethod
+    def process_bytes(content: ImageInput, mode: str = "standard") -> bytes:
+        """
+        Processa una imatge rebuda com a bytes i retorna els bytes codificats (JPEG)
+
+        Camí sense fitxers temporals: upload → ndarray → processat → bytes per l'OCR.
+        """
+        return ImageProcessor.process_bytes_with_ocr(content, mode=mode)[0]
+
+    @staticmethod
+    def process_bytes_with_ocr(content: ImageInput, mode: str = "standard") -> tuple[bytes, Optional[dict]]:
+        """process_bytes + OCR de la sonda d'orientació (vegeu process_image_with_ocr)."""
+        from app.services.preprocess_pipeline import decode_width
+
+        image = decode_image(content, max_pixels=settings.max_image_pixels, min_width=decode_width(mode))
+        image, probe_ocr = ImageProcessor.process_image_with_ocr(image, mode=mode)
+        return encode_image(image), probe_ocr
 
     @staticmethod
     def process_for_ocr(image_path: str,
                         output_path: Optional[str] = None,
                         mode: str = "standard") -> str:
         """
-        Processa una imatge per millorar OCR
+        Processa una imatge en disc per millorar OCR
 
         Args:
             image_path: Path de la imatge d'entrada
@@ -340,28 +702,7 @@ class ImageProcessor:
             base, ext = os.path.splitext(image_path)
             output_path = f"{base}_processed{ext}"
 
-        # Processar segons mode
-        if mode == "document":
-            # Intentar detectar i enderreçar document
-            boundaries = ImageProcessor.detect_document_boundaries(image)
-            if boundaries is not None:
-                image = ImageProcessor.perspective_transform(image, boundaries.reshape(4, 2))
-
-        # Processos comuns
-        image = ImageProcessor.resize_if_needed(image)
-
-        # Primer corregir orientació de 90/180/270 graus
-        image = ImageProcessor.detect_and_fix_orientation(image)
-
-        # Després corregir petites desviacions d'angle
-        image = ImageProcessor.detect_and_fix_rotation(image)
-
-        if mode == "aggressive":
-            image = ImageProcessor.denoise(image)
-            image = ImageProcessor.enhance_contrast(image)
-            image = ImageProcessor.sharpen(image)
-        elif mode == "standard":
-            image = ImageProcessor.enhance_contrast(image)
+        image = ImageProcessor.process_image(image, mode=mode)
 
         # Guardar
         cv2.imwrite(output_path, image)
@@ -0,0 +1,364 @@
+"""
+Cua de treballs OCR asíncrons (SQLite local + pool de workers en procés)
+
+POST /ocr/jobs desa la imatge a la cua i retorna un job_id immediatament;
+els workers la processen amb el mateix pipeline que les rutes síncrones i el
+client consulta el resultat amb GET /ocr/jobs/{id}. Pensat per a càrregues
+massives que no necessiten resposta síncrona.
+
+La cua és persistent: els treballs acceptats sobreviuen a un reinici (els que
+estaven en curs es tornen a encuar). La imatge s'esborra en acabar el treball,
+es pot xifrar (Fernet, JOBS_ENCRYPTION_KEY) i els resultats caduquen segons
+JOBS_RETENTION_HOURS.
+
+Opt-in via JOBS_ENABLED=true (desactivat per defecte).
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.config import settings
+from app.services.api_keys import api_key_registry, current_api_client
+from app.utils.crypto import make_fernet
+
+log = logging.getLogger("ocr.jobs")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              TEXT PRIMARY KEY,
+    doc_type        TEXT NOT NULL,
+    status          TEXT NOT NULL,
+    client          TEXT,
+    preprocess      INTEGER NOT NULL,
+    preprocess_mode TEXT NOT NULL,
+    image_hash      TEXT,
+    encrypted       INTEGER NOT NULL,
+    image           BLOB,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    not_before      REAL NOT NULL DEFAULT 0,
+    created_at      REAL NOT NULL,
+    started_at      REAL,
+    finished_at     REAL,
+    status_code     INTEGER,
+    result          TEXT,
+    error           TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, not_before, created_at);
+"""
+
+# Errors transitoris que es reintenten (motor no disponible, timeout)
+_RETRY_STATUS = {503, 504}
+_MAX_ATTEMPTS = 3
+_RETRY_DELAY_SECONDS = 5
+
+# Cada quants treballs acabats es purguen els caducats
+_PURGE_EVERY = 200
+
+
+class JobQueue:
+    """Cua SQLite de treballs OCR amb pool de workers asyncio."""
+
+    def __init__(self, path: str, enabled: bool = True, workers: int = 4,
+                 max_pending: int = 1000, retention_hours: int = 24,
+                 encryption_key: Optional[str] = None, poll_seconds: float = 1.0):
+        self.path = path
+        self.enabled = enabled
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention_hours = retention_hours
+        self.poll_seconds = poll_seconds
+        self._fernet = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._finished = 0
+
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        if not enabled:
+            return
+
+        # Clau configurada però no utilitzable: error, mai imatges en clar
+        if encryption_key:
+            self._fernet = make_fernet(encryption_key, "JOBS_ENCRYPTION_KEY")
+
+        try:
+            self._connect()
+        except Exception as e:
+            print(f"❌ Error inicialitzant la cua de treballs: {e}")
+            self.enabled = False
+            self._conn = None
+
+    def _connect(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Operacions SQLite (síncrones, s'executen al threadpool)
+    # ------------------------------------------------------------------
+
+    def submit(self, doc_type: str, content: bytes, preprocess: bool = False,
+               preprocess_mode: str = "standard", image_hash: Optional[str] = None,
+               client: Optional[str] = None) -> str:
+        """
+        Encua un treball i retorna el seu id.
+
+        Raises:
+            HTTPException 503 si la cua està desactivada o plena
+        """
+        if not self.enabled:
+            raise HTTPException(status_code=503, detail="Cua de treballs no disponible.")
+
+        image = self._fernet.encrypt(content) if self._fernet is not None else content
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+            if pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Cua de treballs plena. Torna-ho a provar més tard.",
+                    headers={"Retry-After": "30"},
+                )
+            self._conn.execute(
+                "INSERT INTO jobs (id, doc_type, status, client, preprocess, preprocess_mode, "
+                "image_hash, encrypted, image, created_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, doc_type, client, int(preprocess), preprocess_mode, image_hash,
+                 int(self._fernet is not None), image, time.time()),
+            )
+            self._conn.commit()
+
+        # submit() corre al threadpool: asyncio.Event no és thread-safe, el set el fa el loop
+        if self._wakeup is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Estat i resultat d'un treball (sense la imatge), o None."""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, doc_type, status, client, attempts, created_at, started_at, "
+                "finished_at, status_code, result, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        keys = ("job_id", "doc_type", "status", "client", "attempts", "created_at",
+                "started_at", "finished_at", "status_code", "result", "error")
+        job = dict(zip(keys, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _claim(self) -> Optional[dict]:
+        """
+        Marca com a 'running' el treball encuat més antic i el retorna.
+
+        Un treball que no es pot desxifrar (JOBS_ENCRYPTION_KEY canviada o
+        perduda) es marca 'failed' amb un 500 i es passa al següent.
+        """
+        now = time.time()
+        with self._lock:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id, doc_type, client, preprocess, preprocess_mode, image_hash, "
+                    "encrypted, image, attempts FROM jobs "
+                    "WHERE status = 'queued' AND not_before <= ? ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    return None
+
+                job_id, doc_type, client, preprocess, mode, image_hash, encrypted, image, attempts = row
+                try:
+                    if encrypted:
+                        if self._fernet is None:
+                            raise ValueError("JOBS_ENCRYPTION_KEY no configurada")
+                        image = self._fernet.decrypt(image)
+                except Exception as e:
+                    log.error("job_decrypt_failed", extra={"job_id": job_id, "error": type(e).__name__})
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'failed', started_at = ?, finished_at = ?, "
+                        "attempts = attempts + 1, status_code = 500, error = ?, image = NULL WHERE id = ?",
+                        (now, now, "No s'ha pogut desxifrar la imatge del treball.", job_id),
+                    )
+                    self._conn.commit()
+                    continue
+
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (now, job_id),
+                )
+                self._conn.commit()
+                break
+
+        return {
+            "job_id": job_id, "doc_type": doc_type, "client": client,
+            "preprocess": bool(preprocess), "preprocess_mode": mode,
+            "image_hash": image_hash, "content": image, "attempts": attempts + 1,
+        }
+
+    def _finish(self, job_id: str, status_code: int, result: Optional[str],
+                error: Optional[str], attempts: int) -> None:
+        """Desa el resultat (i esborra la imatge) o torna a encuar si és transitori."""
+        with self._lock:
+            if status_code in _RETRY_STATUS and attempts < _MAX_ATTEMPTS:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', not_before = ? WHERE id = ?",
+                    (time.time() + _RETRY_DELAY_SECONDS * attempts, job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = ?, status_code = ?, result = ?, "
+                    "error = ?, image = NULL WHERE id = ?",
+                    ("done" if status_code == 200 else "failed", time.time(),
+                     status_code, result, error, job_id),
+                )
+            self._conn.commit()
+            self._finished += 1
+            purge = self._finished % _PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def requeue_running(self) -> int:
+        """
+        Torna a encuar els treballs que estaven en curs (p.ex. després d'un reinici).
+
+        Els que ja han esgotat _MAX_ATTEMPTS es marquen 'failed': un treball que
+        fa caure el procés no es reintenta indefinidament a cada arrencada.
+        Retorna quants s'han tornat a encuar.
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, status_code = 500, error = ?, "
+                "image = NULL WHERE status = 'running' AND attempts >= ?",
+                (time.time(), "Treball interromput massa vegades.", _MAX_ATTEMPTS),
+            )
+            cursor = self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+            self._conn.commit()
+        return cursor.rowcount
+
+    def purge_expired(self) -> int:
+        """Esborra els treballs acabats més antics que la retenció. Retorna quants."""
+        if not self.enabled or self.retention_hours <= 0:
+            return 0
+
+        cutoff = time.time() - self.retention_hours * 3600
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0, **dict(rows)}
+        return {"enabled": True, "workers": len(self._tasks), **counts}
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Arrenca el pool de workers (lifespan de l'app)."""
+        if not self.enabled or self._tasks:
+            return
+        requeued = await run_in_threadpool(self.requeue_running)
+        await run_in_threadpool(self.purge_expired)
+        if requeued:
+            log.info("jobs_requeued", extra={"count": requeued})
+
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+        self._loop = None
+
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await run_in_threadpool(self._claim)
+                if job is not None:
+                    await self._run(job)
+                    continue
+            except Exception:
+                # Un error de SQLite (o d'un treball) no pot deixar el pool sense workers
+                log.exception("job_worker_error")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: dict) -> None:
+        # Import tardà: el pipeline importa els serveis OCR
+        from app.services.document_pipeline import process_document
+
+        # Quota Vision de l'API key que va encuar el treball
+        token = current_api_client.set(api_key_registry.get_by_name(job["client"]))
+        result: Optional[str] = None
+        error: Optional[str] = None
+        t0 = time.monotonic()
+        try:
+            response = await process_document(
+                job["doc_type"], job["content"], job["preprocess"],
+                job["preprocess_mode"], job["image_hash"],
+            )
+            status_code, result = 200, response.model_dump_json()
+        except HTTPException as e:
+            status_code, error = e.status_code, e.detail
+        except Exception:
+            log.exception("job_unexpected_error")
+            status_code, error = 500, "Error intern processant el document."
+        finally:
+            current_api_client.reset(token)
+
+        await run_in_threadpool(self._finish, job["job_id"], status_code, result, error, job["attempts"])
+        log.info("job_done", extra={
+            "job_id": job["job_id"],
+            "doc_type": job["doc_type"],
+            "status_code": status_code,
+            "attempt": job["attempts"],
+            "durada_ms": round((time.monotonic() - t0) * 1000),
+        })
+
+
+# Singleton
+job_queue = JobQueue(
+    path=settings.jobs_db_path,
+    enabled=settings.jobs_enabled,
+    workers=settings.jobs_workers,
+    max_pending=settings.jobs_max_pending,
+    retention_hours=settings.jobs_retention_hours,
+    encryption_key=settings.jobs_encryption_key,
+)
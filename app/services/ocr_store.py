@@ -0,0 +1,207 @@
+"""
+Magatzem persistent del text OCR (SQLite local)
+
+Guarda la sortida crua de detect_document_text (text, motor, confiança i
+paraules amb bounding box) per poder re-executar els parsers sobre l'històric
+quan hi ha una correcció, a velocitat de Python pur i sense tornar a pagar
+Vision ni conservar les imatges.
+
+Clau: (hash SHA-256 de la imatge, motor OCR, mode de pre-processament).
+El payload es pot xifrar (Fernet, OCR_STORE_ENCRYPTION_KEY) i les entrades
+caduquen segons OCR_STORE_RETENTION_DAYS.
+
+Opt-in via OCR_STORE_ENABLED=true (desactivat per defecte).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, Optional
+from app.config import settings
+from app.utils.crypto import make_fernet
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_text (
+    image_hash      TEXT NOT NULL,
+    engine          TEXT NOT NULL,
+    preprocess_mode TEXT NOT NULL,
+    doc_type        TEXT NOT NULL,
+    created_at      REAL NOT NULL,
+    encrypted       INTEGER NOT NULL,
+    payload         BLOB NOT NULL,
+    PRIMARY KEY (image_hash, engine, preprocess_mode)
+);
+CREATE INDEX IF NOT EXISTS ix_ocr_text_doc_type ON ocr_text (doc_type, created_at);
+"""
+
+# Cada quantes escriptures es purguen les entrades caducades
+_PURGE_EVERY = 500
+
+
+class OCRStore:
+    """Magatzem SQLite de resultats OCR crus, opcionalment xifrat."""
+
+    def __init__(self, path: str, enabled: bool = True,
+                 encryption_key: Optional[str] = None, retention_days: int = 90):
+        self.path = path
+        self.enabled = enabled
+        self.retention_days = retention_days
+        self._fernet = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        if not enabled:
+            return
+
+        # Clau configurada però no utilitzable: error, mai text en clar
+        if encryption_key:
+            self._fernet = make_fernet(encryption_key, "OCR_STORE_ENCRYPTION_KEY")
+
+        try:
+            self._connect()
+            self.purge_expired()
+        except Exception as e:
+            print(f"❌ Error inicialitzant el magatzem OCR: {e}")
+            self.enabled = False
+            self._conn = None
+
+    def _connect(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Serialització
+    # ------------------------------------------------------------------
+
+    def _encode(self, result: dict) -> bytes:
+        payload = json.dumps({
+            "text": result.get("text", ""),
+            "confidence": result.get("confidence", 0.0),
+            "annotations": result.get("annotations", []),
+        }, ensure_ascii=False).encode("utf-8")
+        if self._fernet is not None:
+            return self._fernet.encrypt(payload)
+        return payload
+
+    def _decode(self, payload: bytes, encrypted: bool) -> dict:
+        if encrypted:
+            if self._fernet is None:
+                raise RuntimeError("Entrada xifrada però OCR_STORE_ENCRYPTION_KEY no configurada")
+            payload = self._fernet.decrypt(payload)
+        return json.loads(payload)
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def mode_key(preprocess: bool, preprocess_mode: Optional[str]) -> str:
+        """Mode de pre-processament tal com forma part de la clau."""
+        return preprocess_mode if preprocess and preprocess_mode else "none"
+
+    def put(self, image_hash: str, doc_type: str, engine: str,
+            preprocess_mode: str, result: dict) -> None:
+        """Guarda (o substitueix) la sortida OCR d'una imatge."""
+        if not self.enabled:
+            return
+
+        payload = self._encode(result)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_text "
+                "(image_hash, engine, preprocess_mode, doc_type, created_at, encrypted, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (image_hash, engine, preprocess_mode, doc_type, time.time(),
+                 int(self._fernet is not None), payload),
+            )
+            self._conn.commit()
+            self._writes += 1
+            purge = self._writes % _PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def get(self, image_hash: str, engine: str, preprocess_mode: str) -> Optional[dict]:
+        """Retorna la sortida OCR guardada o None."""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_type, encrypted, payload FROM ocr_text "
+                "WHERE image_hash = ? AND engine = ? AND preprocess_mode = ?",
+                (image_hash, engine, preprocess_mode),
+            ).fetchone()
+        if row is None:
+            return None
+
+        doc_type, encrypted, payload = row
+        record = self._decode(payload, bool(encrypted))
+        record.update(doc_type=doc_type, engine=engine, preprocess_mode=preprocess_mode,
+                      image_hash=image_hash)
+        return record
+
+    def iter_records(self, doc_type: Optional[str] = None,
+                     since: Optional[float] = None) -> Iterator[dict]:
+        """
+        Recorre l'històric (per re-parsejar en bloc).
+
+        Args:
+            doc_type: filtrar per tipus ("dni", "permis", "nif")
+            since: timestamp UNIX mínim de creació
+        """
+        if not self.enabled:
+            return
+
+        query = ("SELECT image_hash, engine, preprocess_mode, doc_type, created_at, encrypted, payload "
+                 "FROM ocr_text WHERE 1=1")
+        params: list = []
+        if doc_type:
+            query += " AND doc_type = ?"
+            params.append(doc_type)
+        if since is not None:
+            query += " AND created_at >= ?"
+            params.append(since)
+        query += " ORDER BY created_at"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        for image_hash, engine, mode, dtype, created_at, encrypted, payload in rows:
+            record = self._decode(payload, bool(encrypted))
+            record.update(image_hash=image_hash, engine=engine, preprocess_mode=mode,
+                          doc_type=dtype, created_at=created_at)
+            yield record
+
+    def purge_expired(self) -> int:
+        """Esborra les entrades més antigues que la retenció. Retorna quantes."""
+        if not self.enabled or self.retention_days <= 0:
+            return 0
+
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM ocr_text WHERE created_at < ?", (cutoff,))
+            self._conn.commit()
+        return cursor.rowcount
+
+    def count(self) -> int:
+        if not self.enabled:
+            return 0
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ocr_text").fetchone()[0]
+
+
+# Singleton
+ocr_store = OCRStore(
+    path=settings.ocr_store_path,
+    enabled=settings.ocr_store_enabled,
+    encryption_key=settings.ocr_store_encryption_key,
+    retention_days=settings.ocr_store_retention_days,
+)
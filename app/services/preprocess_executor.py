@@ -0,0 +1,129 @@
+"""
+Executor acotat per al pre-processament d'imatges
+
+Canny, Hough, fastNlMeansDenoisingColored o la sonda d'orientació de Vision
+bloquejaven l'event loop quan s'executaven dins del handler async: totes les
+altres peticions del worker s'aturaven. Ara es fan en un pool propi de
+PREPROCESS_WORKERS fils (o processos, PREPROCESS_EXECUTOR=process), separat
+del threadpool de FastAPI; les peticions de més esperen torn.
+
+Cada execució retorna el temps d'espera a la cua i el d'execució per separat.
+
+La cua també és acotada (PREPROCESS_MAX_PENDING tasques esperant o
+executant-se, incloses les que ja han fet timeout però encara ocupen un
+worker): més enllà es rebutja de seguida amb 503 + Retry-After, com el
+control d'admissió. Una tasca que fa timeout abans de començar surt de la cua.
+"""
+import asyncio
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from app.config import settings
+from app.services.admission import Overloaded
+
+
+def _timed(fn: Callable[..., Any], *args: Any) -> tuple[Any, float, float]:
+    # time.time() i no monotonic: amb processos el rellotge ha de ser comú
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+class PreprocessExecutor:
+    """Pool de mida fixa (fils o processos) per a feina de CPU."""
+
+    def __init__(self, kind: str = "thread", workers: int = 2, max_pending: int = 0):
+        self.kind = kind if kind in ("thread", "process") else "thread"
+        self.workers = max(1, workers)
+        self.max_pending = max_pending  # 0 = sense límit
+        self.in_flight = 0  # tasques esperant o executant-se al pool (encara que el cridant ja no esperi)
+        self.completed = 0
+        self.rejected = 0
+        self._avg_run_s = 0.5  # EWMA de la durada d'una tasca (Retry-After)
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+
+    def _get(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn: un fork amb fils de gRPC vius pot quedar penjat
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="preprocess")
+        return self._executor
+
+    def _retry_after(self) -> int:
+        waves = (self.in_flight + 1) / self.workers
+        return max(1, math.ceil(self._avg_run_s * waves))
+
+    def _done(self, future: Future) -> None:
+        # Callback del fil del pool (o del gestor de processos)
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> tuple[Any, float, float]:
+        """
+        Executa fn(*args) al pool sense bloquejar l'event loop.
+
+        Amb processos, fn i els arguments han de ser picklables (funcions de mòdul
+        lleugers: el procés fill importa el mòdul de fn).
+        Si el cridant cancel·la (timeout) abans que comenci, la tasca surt de la cua.
+
+        Returns:
+            (resultat, espera a la cua en ms, execució en ms)
+
+        Raises:
+            Overloaded 503 si ja hi ha PREPROCESS_MAX_PENDING tasques pendents
+        """
+        with self._lock:
+            if self.max_pending and self.in_flight >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded(503, "Pre-processament saturat. Torna-ho a provar més tard.",
+                                 self._retry_after())
+            self.in_flight += 1
+        submitted = time.time()
+        try:
+            future = self._get().submit(_timed, fn, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        try:
+            result, started, finished = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Timeout o desconnexió: si encara és a la cua, no s'arriba a executar
+            future.cancel()
+            raise
+        self.completed += 1
+        self._avg_run_s = 0.8 * self._avg_run_s + 0.2 * (finished - started)
+        return (
+            result,
+            round(max(0.0, started - submitted) * 1000, 1),
+            round((finished - started) * 1000, 1),
+        )
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+# Singleton
+preprocess_executor = PreprocessExecutor(
+    settings.preprocess_executor, settings.preprocess_workers, settings.preprocess_max_pending,
+)
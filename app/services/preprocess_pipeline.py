@@ -0,0 +1,322 @@
+"""
+Pre-processament com a pipeline d'etapes amb nom
+
+Cada etapa rep i deixa la imatge (ndarray) en un StageContext en memòria; el
+pipeline cronometra cada etapa. Els modes (`preprocess_mode`) són llistes
+d'etapes predefinides i PREPROCESS_PIPELINES permet definir-ne d'altres per
+tipus de document (p.ex. un pipeline més barat per al permís que per al DNI)
+sense tocar el codi:
+
+    PREPROCESS_PIPELINES={"permis": ["resize", "deskew", "clahe"],
+                          "dni:aggressive": ["resize", "orientation", "deskew", "denoise", "clahe"]}
+
+preprocess_mode=auto mesura la qualitat de la imatge en una miniatura
+(ImageProcessor.quality_metrics) i tria el mode: cap pre-processament per a
+escanejos bons, standard per a contrast/llum/reflexos/inclinació i aggressive
+per a fotos desenfocades.
+
+Etapes: geometry (resize + orientation + deskew), document_geometry
+(boundaries + perspective + geometry), boundaries, perspective, resize,
+orientation, deskew, denoise (denoise_lite o denoise_full segons
+PREPROCESS_DENOISE), clahe, sharpen, binarize.
+"""
+import time
+from typing import Callable, Optional, Sequence, Union
+import numpy as np
+from app.config import settings
+from app.services.image_processor import ImageProcessor
+from app.utils.image_io import decode_image, encode_image
+
+
+class StageContext:
+    """Estat que passa d'una etapa a la següent."""
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self.boundaries: Optional[np.ndarray] = None  # quadrilàter del document (4, 2)
+        self.probe_ocr: Optional[dict] = None         # OCR de la sonda d'orientació de Vision
+
+
+class Stage:
+    """Etapa amb nom: modifica el context (normalment ctx.image)."""
+
+    def __init__(self, name: str, fn: Callable[[StageContext], None]):
+        self.name = name
+        self.fn = fn
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r})"
+
+
+def _boundaries(ctx: StageContext) -> None:
+    boundaries = ImageProcessor.detect_document_boundaries(ctx.image)
+    ctx.boundaries = boundaries.reshape(4, 2) if boundaries is not None else None
+
+
+def _perspective(ctx: StageContext) -> None:
+    if ctx.boundaries is not None:
+        ctx.image = ImageProcessor.perspective_transform(ctx.image, ctx.boundaries)
+        ctx.boundaries = None
+
+
+def _resize(ctx: StageContext) -> None:
+    ctx.image = ImageProcessor.resize_if_needed(ctx.image)
+
+
+def _orientation(ctx: StageContext) -> None:
+    if settings.preprocess_orientation == "vision":
+        ctx.image, ctx.probe_ocr = ImageProcessor.probe_orientation_vision(ctx.image)
+    else:
+        ctx.image = ImageProcessor.detect_and_fix_orientation(ctx.image)
+
+
+def _geometry(ctx: StageContext, find_boundaries: bool = False) -> None:
+    """
+    Vores + redimensionament + orientació + inclinació en una sola interpolació
+
+    Tot s'estima sobre miniatures (ImageProcessor.plan_geometry). Amb la sonda
+    de Vision l'orientació s'ha de provar a resolució completa: vores i mida
+    en un warp, el gir de 90° sense interpolar i la inclinació en un segon warp.
+    """
+    if settings.preprocess_orientation == "vision":
+        M, size, _ = ImageProcessor.plan_geometry(ctx.image, find_boundaries, orientation=False, skew=False)
+        image = ImageProcessor.warp_geometry(ctx.image, M, size)
+        image, ctx.probe_ocr = ImageProcessor.probe_orientation_vision(image)
+        M, size, _ = ImageProcessor.plan_geometry(image, orientation=False)
+        ctx.image = ImageProcessor.warp_geometry(image, M, size)
+        return
+
+    M, size, _ = ImageProcessor.plan_geometry(
+        ctx.image, find_boundaries, orientation=settings.preprocess_orientation == "local",
+    )
+    ctx.image = ImageProcessor.warp_geometry(ctx.image, M, size)
+
+
+def _document_geometry(ctx: StageContext) -> None:
+    _geometry(ctx, find_boundaries=True)
+
+
+def _deskew(ctx: StageContext) -> None:
+    ctx.image = ImageProcessor.detect_and_fix_rotation(ctx.image)
+
+
+def _denoise(ctx: StageContext) -> None:
+    # PREPROCESS_DENOISE: "lite" (bilateral a la luminància) o "full" (NL-means en color)
+    if settings.preprocess_denoise == "full":
+        _denoise_full(ctx)
+    else:
+        _denoise_lite(ctx)
+
+
+def _denoise_full(ctx: StageContext) -> None:
+    ctx.image = ImageProcessor.denoise(ctx.image)
+
+
+def _denoise_lite(ctx: StageContext) -> None:
+    ctx.image = ImageProcessor.denoise_lite(ctx.image)
+
+
+def _clahe(ctx: StageContext) -> None:
+    ctx.image = ImageProcessor.enhance_contrast(ctx.image)
+
+
+def _sharpen(ctx: StageContext) -> None:
+    ctx.image = ImageProcessor.sharpen(ctx.image)
+
+
+def _binarize(ctx: StageContext) -> None:
+    ctx.image = ImageProcessor.binarize(ctx.image)
+
+
+STAGES: dict[str, Stage] = {
+    stage.name: stage for stage in (
+        Stage("boundaries", _boundaries),
+        Stage("perspective", _perspective),
+        Stage("resize", _resize),
+        Stage("orientation", _orientation),
+        Stage("deskew", _deskew),
+        Stage("geometry", _geometry),
+        Stage("document_geometry", _document_geometry),
+        Stage("denoise", _denoise),
+        Stage("denoise_full", _denoise_full),
+        Stage("denoise_lite", _denoise_lite),
+        Stage("clahe", _clahe),
+        Stage("sharpen", _sharpen),
+        Stage("binarize", _binarize),
+    )
+}
+
+# Etapes de cada preprocess_mode. "geometry" equival a resize → orientation →
+# deskew (i "document_geometry" a boundaries → perspective → ...) amb una sola
+# interpolació; les etapes separades continuen disponibles per a pipelines propis.
+MODES: dict[str, tuple[str, ...]] = {
+    "standard": ("geometry", "clahe"),
+    "aggressive": ("geometry", "denoise", "clahe", "sharpen"),
+    "document": ("document_geometry",),
+}
+# Mode desconegut: només les correccions geomètriques comunes
+_BASE = ("geometry",)
+
+# Amplada mínima a què es descodifiquen els JPEG (decode_image, escala reduïda):
+# la de treball del redimensionament; amb detecció de vores el document és
+# només una part de la foto i es guarda el doble de resolució per retallar-lo
+DECODE_WIDTH = 2000
+DECODE_WIDTH_BOUNDARIES = 4000
+
+AUTO = "auto"
+# Llindars de preprocess_mode=auto (mètriques de ImageProcessor.quality_metrics)
+AUTO_SHARPNESS_MIN = 0.15    # per sota: desenfocada → aggressive
+AUTO_CONTRAST_MIN = 30.0     # desviació dels grisos
+AUTO_BRIGHTNESS_MIN = 70.0   # foto fosca
+AUTO_GLARE_MAX = 0.02        # píxels saturats, només amb fons no blanc (un escaneig és blanc)
+AUTO_GLARE_BACKGROUND = 200
+AUTO_SKEW_MAX = 1.0          # graus
+
+
+class PipelineResult:
+    """Imatge processada + temps per etapa."""
+
+    def __init__(self, name: str, image: np.ndarray, probe_ocr: Optional[dict], timings: dict[str, float]):
+        self.name = name
+        self.image = image
+        self.probe_ocr = probe_ocr
+        self.timings = timings
+        self.quality: Optional[dict] = None  # mètriques de preprocess_mode=auto
+
+    @property
+    def total_ms(self) -> float:
+        return round(sum(self.timings.values()), 1)
+
+    def report(self) -> dict:
+        report = {"pipeline": self.name, "stages": dict(self.timings), "total_ms": self.total_ms}
+        if self.quality is not None:
+            report["quality"] = self.quality
+        return report
+
+
+class PreprocessPipeline:
+    """Seqüència d'etapes que s'executen en ordre sobre una imatge en memòria."""
+
+    def __init__(self, stages: Sequence[Union[str, Stage]], name: str = "custom"):
+        self.name = name
+        self.stages: list[Stage] = []
+        for stage in stages:
+            if isinstance(stage, str):
+                if stage not in STAGES:
+                    raise ValueError(f"Etapa de pre-processament desconeguda: {stage}")
+                stage = STAGES[stage]
+            self.stages.append(stage)
+
+    @property
+    def stage_names(self) -> list[str]:
+        return [stage.name for stage in self.stages]
+
+    def run(self, image: np.ndarray) -> PipelineResult:
+        ctx = StageContext(image)
+        timings: dict[str, float] = {}
+        for stage in self.stages:
+            t0 = time.perf_counter()
+            stage.fn(ctx)
+            # Una etapa repetida acumula el temps
+            timings[stage.name] = round(timings.get(stage.name, 0) + (time.perf_counter() - t0) * 1000, 1)
+        return PipelineResult(self.name, ctx.image, ctx.probe_ocr, timings)
+
+    def __repr__(self) -> str:
+        return f"PreprocessPipeline({self.name!r}, {self.stage_names})"
+
+
+def pipeline_for(mode: str, doc_type: Optional[str] = None) -> PreprocessPipeline:
+    """
+    Pipeline per a un mode i tipus de document.
+
+    Ordre: PREPROCESS_PIPELINES["<doc_type>:<mode>"], PREPROCESS_PIPELINES["<doc_type>"]
+    i finalment el mode predefinit.
+
+    Raises:
+        ValueError si una etapa configurada no existeix
+    """
+    if doc_type:
+        for key in (f"{doc_type}:{mode}", doc_type):
+            if key in settings.preprocess_pipelines:
+                return PreprocessPipeline(settings.preprocess_pipelines[key], name=key)
+    return PreprocessPipeline(MODES.get(mode, _BASE), name=mode)
+
+
+def _decode_width(stage_names: list[str]) -> Optional[int]:
+    names = set(stage_names)
+    if names & {"boundaries", "document_geometry"}:
+        return DECODE_WIDTH_BOUNDARIES
+    if names & {"resize", "geometry"}:
+        return DECODE_WIDTH
+    return None  # el pipeline no redimensiona: resolució completa
+
+
+def decode_width(mode: str, doc_type: Optional[str] = None) -> Optional[int]:
+    """
+    Amplada mínima de descodificació per al pipeline del mode/tipus de document
+    (None: descodificar a resolució completa). Amb "auto", la dels modes que pot triar.
+    """
+    modes = ("standard", "aggressive") if mode == AUTO else (mode,)
+    widths = [_decode_width(pipeline_for(m, doc_type).stage_names) for m in modes]
+    return None if None in widths else max(widths)
+
+
+def auto_mode(metrics: dict) -> Optional[str]:
+    """Mode per a preprocess_mode=auto segons les mètriques (None: no cal pre-processar)."""
+    if metrics["sharpness"] < AUTO_SHARPNESS_MIN:
+        return "aggressive"
+    if (
+        metrics["contrast"] < AUTO_CONTRAST_MIN
+        or metrics["brightness"] < AUTO_BRIGHTNESS_MIN
+        or (metrics["background"] < AUTO_GLARE_BACKGROUND and metrics["glare"] > AUTO_GLARE_MAX)
+        or abs(metrics["skew"]) > AUTO_SKEW_MAX
+    ):
+        return "standard"
+    return None
+
+
+def run(image: np.ndarray, mode: str, doc_type: Optional[str] = None) -> PipelineResult:
+    """
+    Pre-processa una imatge amb el pipeline del mode/tipus de document.
+
+    Amb mode "auto" primer es mesura la qualitat (etapa "quality") i es tria
+    el mode amb auto_mode(); si no cal, la imatge es retorna tal qual.
+    """
+    if mode != AUTO:
+        return pipeline_for(mode, doc_type).run(image)
+
+    t0 = time.perf_counter()
+    metrics = ImageProcessor.quality_metrics(image)
+    chosen = auto_mode(metrics)
+    quality_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    if chosen is None:
+        result = PipelineResult("auto:none", image, None, {})
+    else:
+        result = pipeline_for(chosen, doc_type).run(image)
+        result.name = f"auto:{result.name}"
+    result.timings = {"quality": quality_ms, **result.timings}
+    result.quality = metrics
+    return result
+
+
+def preprocess_bytes(content: bytes, mode: str,
+                     doc_type: Optional[str]) -> tuple[bytes, Optional[dict], dict]:
+    """
+    Pre-processa una imatge codificada (tasca del preprocess_executor).
+
+    Viu aquí i no a document_pipeline perquè amb PREPROCESS_EXECUTOR=process
+    el procés fill importa el mòdul de la funció: només aquest i
+    image_processor, sense els singletons del servei (magatzem OCR, cua...).
+
+    Returns:
+        (bytes per l'OCR, OCR de la sonda d'orientació o None, temps per etapa)
+    """
+    # JPEG a escala reduïda fins a l'amplada de treball: la foto sencera
+    # (12-50 MP) no es materialitza mai
+    image = decode_image(content, max_pixels=settings.max_image_pixels,
+                         min_width=decode_width(mode, doc_type))
+    result = run(image, mode, doc_type)
+    # Imatge intacta (auto sense pre-processament): els bytes originals, sense recodificar
+    ocr_input = content if result.image is image else encode_image(result.image)
+    return ocr_input, result.probe_ocr, result.report()
@@ -0,0 +1,118 @@
+"""
+Cache de resultats OCR per hash de contingut (LRU + TTL, en procés)
+
+El back-office puja sovint la mateixa imatge diverses vegades (reintents,
+revalidacions, mateix fitxer a expedients diferents). Cada pujada costa un
+crèdit Vision i ~600 ms; amb el cache, la segona pujada retorna la resposta
+ja calculada.
+
+Clau: SHA-256 dels bytes de l'upload + endpoint + opcions de pre-processament.
+Opt-in via CACHE_ENABLED=true (desactivat per defecte).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from pydantic import BaseModel
+from app.config import settings
+
+
+def content_hash(content: bytes) -> str:
+    """SHA-256 hexadecimal dels bytes de la imatge."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class ResultCache:
+    """Cache LRU amb caducitat (TTL) i comptadors de hits/misses."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, tuple[float, BaseModel]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(digest: str, endpoint: str, preprocess: bool = False,
+                 preprocess_mode: Optional[str] = None) -> str:
+        """
+        Construeix la clau de cache.
+
+        El mode només compta si hi ha pre-processament (sense preprocess, el
+        mode no canvia el resultat).
+        """
+        mode = preprocess_mode if preprocess else "-"
+        return f"{endpoint}:{int(preprocess)}:{mode}:{digest}"
+
+    def get(self, key: str) -> Optional[BaseModel]:
+        """
+        Retorna una còpia de la resposta guardada amb meta.cached=True,
+        o None si no hi és o ha caducat.
+        """
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, response = entry
+            if now - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        cached = response.model_copy(deep=True)
+        if getattr(cached, "meta", None) is not None:
+            cached.meta.cached = True
+        return cached
+
+    def set(self, key: str, response: BaseModel) -> None:
+        """Guarda una còpia de la resposta i aplica el límit de mida (LRU)."""
+        if not self.enabled or self.max_entries <= 0:
+            return
+
+        stored = response.model_copy(deep=True)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Comptadors per /health i mètriques."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+# Singleton
+result_cache = ResultCache(
+    max_entries=settings.cache_max_entries,
+    ttl_seconds=settings.cache_ttl_seconds,
+    enabled=settings.cache_enabled,
+)
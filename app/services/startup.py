@@ -0,0 +1,99 @@
+"""
+Arrencada del servei (cold start)
+
+Importar l'app no inicialitza cap motor: el client de Google Vision
+(credencials + canal gRPC), la comprovació de Tesseract (subprocés) i
+cv2/numpy del pre-processament es preparen aquí, en paral·lel al threadpool i
+en segon pla, perquè el port s'obri de seguida (scale-to-zero). Una petició
+que arribi abans només espera el pas que necessita.
+
+Després s'escalfen els camins de petició (app.services.warmup): només llavors
+`ready` passa a cert i /ready respon 200.
+
+Cada pas es cronometra: el desglossament es publica al log `startup` i a
+/health.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, Union
+from fastapi.concurrency import run_in_threadpool
+
+log = logging.getLogger("ocr.startup")
+
+# Pas síncron (s'executa al threadpool) o funció async
+Step = Callable[[], Union[object, Awaitable[object]]]
+
+
+class Startup:
+    """Passos d'inicialització i d'escalfament concurrents amb temps per pas."""
+
+    def __init__(self):
+        self.import_ms: Optional[int] = None
+        self.steps: dict[str, dict] = {}
+        self.warmup: dict[str, dict] = {}
+        self.total_ms: Optional[int] = None
+        self.warmup_ms: Optional[int] = None
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+
+    def record_import(self, seconds: float) -> None:
+        """Temps d'importar l'app (mòduls i singletons)."""
+        self.import_ms = round(seconds * 1000)
+
+    @staticmethod
+    async def _step(results: dict, name: str, fn: Step) -> None:
+        t0 = time.monotonic()
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                await fn()
+            else:
+                await run_in_threadpool(fn)
+            status = "ok"
+        except Exception as e:
+            status = f"error: {e or type(e).__name__}"
+        results[name] = {"ms": round((time.monotonic() - t0) * 1000), "status": status}
+
+    async def run(self, steps: dict[str, Step], warmup: Optional[dict[str, Step]] = None) -> None:
+        t0 = time.monotonic()
+        await asyncio.gather(*(self._step(self.steps, name, fn) for name, fn in steps.items()))
+        self.total_ms = round((time.monotonic() - t0) * 1000)
+
+        # Escalfament: després de la inicialització (el canal gRPC necessita el client)
+        t0 = time.monotonic()
+        await asyncio.gather(*(self._step(self.warmup, name, fn) for name, fn in (warmup or {}).items()))
+        self.warmup_ms = round((time.monotonic() - t0) * 1000)
+        self.ready = True
+
+        log.info("startup", extra={
+            "import_ms": self.import_ms,
+            "init_ms": self.total_ms,
+            "warmup_ms": self.warmup_ms,
+            "steps": self.steps,
+            "warmup": self.warmup,
+        })
+
+    def start(self, steps: dict[str, Step], warmup: Optional[dict[str, Step]] = None) -> None:
+        """Llança els passos en segon pla (lifespan de l'app)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(steps, warmup))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "import_ms": self.import_ms,
+            "init_ms": self.total_ms,
+            "warmup_ms": self.warmup_ms,
+            "ready": self.ready,
+            "steps": dict(self.steps),
+            "warmup": dict(self.warmup),
+        }
+
+
+# Singleton
+startup = Startup()
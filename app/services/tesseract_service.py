@@ -1,10 +1,82 @@
 """
 Servei de Tesseract OCR
+
+pytesseract i la comprovació de `tesseract --version` (un subprocés) es fan
+a initialize(), no en importar el mòdul; la disponibilitat queda en memòria.
+
+Motor:
+- tesserocr (si està instal·lat): pool de handles PyTessBaseAPI de llarga
+  durada, un per OCR concurrent (TESSERACT_CONCURRENCY). El traineddata
+  (spa+cat+eng) es carrega una sola vegada per handle i cada imatge es
+  reconeix en una passada (text, caixes i confiança alhora), sense subprocés.
+- pytesseract (alternativa): una sola crida image_to_data per imatge (abans
+  eren dues, image_to_string + image_to_data); el text es recompon de les
+  paraules.
 """
-import pytesseract
-from PIL import Image
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
 from app.config import settings
-from typing import Optional
+from app.utils.image_io import ImageInput, to_pil
+
+# PSM 6: Assume a single uniform block of text (millor per DNIs)
+# PSM 3: Fully automatic page segmentation (default)
+_PSM = 6
+
+
+class TesseractEnginePool:
+    """Handles de Tesseract reutilitzables (com a molt `size`, creats sota demanda)."""
+
+    def __init__(self, factory: Callable[[], Any], size: int = 2):
+        self.factory = factory
+        self.size = max(1, size)
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Presta un handle; si tots estan ocupats i n'hi ha `size`, espera."""
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            engine = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    engine = self.factory()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                engine = self._idle.get()
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+    def close(self) -> None:
+        """Allibera els handles inactius (final de l'app)."""
+        while True:
+            try:
+                engine = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._created -= 1
+            end = getattr(engine, "End", None)
+            if end is not None:
+                end()
+
+    def stats(self) -> dict:
+        return {"size": self.size, "created": self._created, "idle": self._idle.qsize()}
 
 
 class TesseractService:
@@ -12,37 +84,81 @@ class TesseractService:
 
     def __init__(self):
         self.lang = settings.tesseract_lang
-        self._check_availability()
+        self.backend: Optional[str] = None  # "tesserocr" | "pytesseract"
+        self.pool: Optional[TesseractEnginePool] = None
+        self._installed: Optional[bool] = None
+        self._init_lock = threading.Lock()
+        self._osd = None  # handle tesserocr amb osd.traineddata (creat en el primer ús)
+        self._osd_lock = threading.Lock()
 
-    def _check_availability(self):
-        """Verifica que Tesseract està instal·lat"""
+    @property
+    def initialized(self) -> bool:
+        return self._installed is not None
+
+    def initialize(self) -> None:
+        """Verifica (una sola vegada) que Tesseract està instal·lat i prepara el motor"""
+        with self._init_lock:
+            if self._installed is not None:
+                return
+            try:
+                self._init_tesserocr()
+            except Exception as e:
+                self.pool = None
+                print(f"⚠️  tesserocr no utilitzable, usant pytesseract: {e}")
+            if self.backend is None:
+                try:
+                    import pytesseract
+                    version = pytesseract.get_tesseract_version()
+                    self.backend = "pytesseract"
+                    print(f"✅ Tesseract disponible (v{version}, pytesseract)")
+                except Exception as e:
+                    self._installed = False
+                    print(f"⚠️  Tesseract no disponible: {e}")
+                    return
+            self._installed = True
+
+    def _init_tesserocr(self) -> None:
+        """Pool de PyTessBaseAPI; el primer handle es crea ara (valida idiomes)."""
         try:
-            version = pytesseract.get_tesseract_version()
-            print(f"✅ Tesseract disponible (v{version})")
-        except Exception as e:
-            print(f"⚠️  Tesseract no disponible: {e}")
+            import tesserocr
+        except ImportError:
+            return
+
+        def factory():
+            return tesserocr.PyTessBaseAPI(lang=self.lang, psm=tesserocr.PSM.SINGLE_BLOCK)
+
+        self.pool = TesseractEnginePool(factory, size=settings.tesseract_concurrency)
+        with self.pool.acquire():
+            pass
+        self.backend = "tesserocr"
+        print(f"✅ Tesseract disponible (tesserocr, pool de {self.pool.size} handles)")
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+        if self._osd is not None:
+            self._osd.End()
+            self._osd = None
 
     def is_available(self) -> bool:
         """Verifica si Tesseract està disponible"""
         if not settings.tesseract_enabled:
             return False
 
-        try:
-            pytesseract.get_tesseract_version()
-            return True
-        except Exception:
-            return False
+        if self._installed is None:
+            self.initialize()
+        return self._installed
 
-    def detect_text(self, image_path: str, lang: Optional[str] = None) -> dict:
+    def detect_text(self, image: ImageInput, lang: Optional[str] = None) -> dict:
         """
-        Detecta text en una imatge
+        Detecta text en una imatge (una sola passada)
 
         Args:
-            image_path: Path a la imatge
+            image: Bytes de la imatge, ndarray, PIL.Image o path
             lang: Idiomes (per defecte usa config)
 
         Returns:
-            dict amb 'text' i 'confidence'
+            dict amb 'text', 'confidence' i 'annotations' (paraules amb bounding box i confiança)
         """
         if not self.is_available():
             raise RuntimeError("Tesseract no està disponible")
@@ -50,30 +166,130 @@ class TesseractService:
         lang = lang or self.lang
 
         try:
-            # Carregar imatge
-            image = Image.open(image_path)
-
-            # Configuració Tesseract
-            # PSM 6: Assume a single uniform block of text (millor per DNIs)
-            # PSM 3: Fully automatic page segmentation (default)
-            custom_config = r'--psm 6'
+            # Carregar imatge (en memòria)
+            image = to_pil(image)
 
-            # OCR
-            text = pytesseract.image_to_string(image, lang=lang, config=custom_config)
+            if self.backend == "tesserocr" and lang == self.lang:
+                text, words = self._recognize_tesserocr(image)
+            else:
+                text, words = self._recognize_pytesseract(image, lang)
 
-            # Obtenir confidence
-            data = pytesseract.image_to_data(image, lang=lang, config=custom_config, output_type=pytesseract.Output.DICT)
-            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
+            confidences = [w["confidence"] for w in words if w["confidence"] > 0]
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
 
             return {
                 "text": text,
-                "confidence": round(avg_confidence, 2)
+                "confidence": round(avg_confidence, 2),
+                "annotations": words,
             }
 
         except Exception as e:
             raise Exception(f"Error en Tesseract OCR: {str(e)}")
 
+    def detect_orientation(self, image: ImageInput) -> Optional[tuple[int, float]]:
+        """
+        Orientació del text amb OSD (Orientation and Script Detection).
+
+        Returns:
+            (graus a girar en sentit horari per posar el text dret, confiança OSD),
+            o None si Tesseract/osd.traineddata no hi són o no hi ha prou text
+        """
+        if not self.is_available():
+            return None
+        try:
+            image = to_pil(image)
+            if self.backend == "tesserocr":
+                import tesserocr
+                with self._osd_lock:
+                    if self._osd is None:
+                        self._osd = tesserocr.PyTessBaseAPI(lang="osd", psm=tesserocr.PSM.OSD_ONLY)
+                    self._osd.SetImage(image)
+                    osd = self._osd.DetectOrientationScript()
+                if not osd:
+                    return None
+                # orient_deg: rotació horària detectada de la imatge
+                return (360 - osd["orient_deg"]) % 360, osd["orient_conf"]
+
+            import pytesseract
+            osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+            return int(osd["rotate"]) % 360, float(osd["orientation_conf"])
+        except Exception:
+            return None
+
+    def _recognize_tesserocr(self, image: Any) -> tuple[str, list]:
+        import tesserocr
+
+        level = tesserocr.RIL.WORD
+        words = []
+        with self.pool.acquire() as api:
+            api.SetImage(image)
+            api.Recognize()
+            text = api.GetUTF8Text()
+            for word in tesserocr.iterate_level(api.GetIterator(), level):
+                box = word.BoundingBox(level)
+                if box is None:
+                    continue
+                x1, y1, x2, y2 = box
+                words.append({
+                    "text": word.GetUTF8Text(level),
+                    "vertices": [(x1, y1), (x2, y1), (x2, y2), (x1, y2)],
+                    "confidence": round(word.Confidence(level), 1),
+                })
+            api.Clear()
+        return text, words
+
+    @staticmethod
+    def _recognize_pytesseract(image: Any, lang: str) -> tuple[str, list]:
+        import pytesseract
+
+        data = pytesseract.image_to_data(
+            image, lang=lang, config=f"--psm {_PSM}", output_type=pytesseract.Output.DICT,
+        )
+        return _words_from_data(data)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "pool": self.pool.stats() if self.pool is not None else None,
+        }
+
+
+def _words_from_data(data: dict) -> tuple[str, list]:
+    """
+    Text i paraules a partir de la sortida d'image_to_data (TSV).
+
+    El text es recompon com image_to_string: paraules separades per espai,
+    línies per salt de línia i paràgrafs/blocs per una línia en blanc.
+    """
+    lines: list[str] = []
+    words: list[dict] = []
+    current: list[str] = []
+    line_key = para_key = None
+
+    for i, word in enumerate(data["text"]):
+        if int(data["level"][i]) != 5 or not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key != line_key:
+            if current:
+                lines.append(" ".join(current))
+                current = []
+            if para_key is not None and key[:2] != para_key:
+                lines.append("")
+            line_key, para_key = key, key[:2]
+        current.append(word)
+
+        x, y, w, h = (int(data[k][i]) for k in ("left", "top", "width", "height"))
+        words.append({
+            "text": word,
+            "vertices": [(x, y), (x + w, y), (x + w, y + h), (x, y + h)],
+            "confidence": round(float(data["conf"][i]), 1),
+        })
+    if current:
+        lines.append(" ".join(current))
+
+    return "\n".join(lines) + ("\n" if lines else ""), words
+
 
 # Singleton
 tesseract_service = TesseractService()
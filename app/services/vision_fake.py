@@ -0,0 +1,65 @@
+"""
+Client Vision fals (local, 0 crèdits)
+
+Substitut de vision.ImageAnnotatorClient per tests i desenvolupament sense
+credencials (GOOGLE_CLOUD_VISION_FAKE=true). Retorna respostes proto reals,
+de manera que el parseig del servei s'exercita igual que amb Vision.
+"""
+from typing import Callable, Optional, Union
+from google.cloud import vision
+
+# responder(content) → text OCR, o Exception per simular un error per imatge
+Responder = Callable[[bytes], Union[str, Exception]]
+
+
+class FakeImageAnnotatorClient:
+    """Imita els mètodes d'ImageAnnotatorClient que fa servir l'agent."""
+
+    def __init__(self, text: str = "", responder: Optional[Responder] = None):
+        self.text = text
+        self.responder = responder
+        self.calls: dict[str, int] = {"document_text_detection": 0, "text_detection": 0,
+                                      "batch_annotate_images": 0}
+        self.batch_sizes: list[int] = []
+
+    def _response(self, content: bytes) -> vision.AnnotateImageResponse:
+        text = self.responder(content) if self.responder else self.text
+        if isinstance(text, Exception):
+            return vision.AnnotateImageResponse(error={"code": 3, "message": str(text)})
+        if not text:
+            return vision.AnnotateImageResponse()
+        return vision.AnnotateImageResponse(
+            full_text_annotation=vision.TextAnnotation(text=text),
+            text_annotations=[vision.EntityAnnotation(description=text)],
+        )
+
+    def document_text_detection(self, image: vision.Image, **kwargs) -> vision.AnnotateImageResponse:
+        self.calls["document_text_detection"] += 1
+        return self._response(image.content)
+
+    def text_detection(self, image: vision.Image, **kwargs) -> vision.AnnotateImageResponse:
+        self.calls["text_detection"] += 1
+        return self._response(image.content)
+
+    def batch_annotate_images(self, requests: list, **kwargs) -> vision.BatchAnnotateImagesResponse:
+        self.calls["batch_annotate_images"] += 1
+        self.batch_sizes.append(len(requests))
+        return vision.BatchAnnotateImagesResponse(
+            responses=[self._response(request.image.content) for request in requests]
+        )
+
+
+class FakeImageAnnotatorAsyncClient:
+    """Versió async (com ImageAnnotatorAsyncClient) que delega al client fals síncron."""
+
+    def __init__(self, sync_client: FakeImageAnnotatorClient):
+        self.sync_client = sync_client
+
+    async def document_text_detection(self, image: vision.Image, **kwargs) -> vision.AnnotateImageResponse:
+        return self.sync_client.document_text_detection(image=image)
+
+    async def text_detection(self, image: vision.Image, **kwargs) -> vision.AnnotateImageResponse:
+        return self.sync_client.text_detection(image=image)
+
+    async def batch_annotate_images(self, requests: list, **kwargs) -> vision.BatchAnnotateImagesResponse:
+        return self.sync_client.batch_annotate_images(requests=requests)
@@ -0,0 +1,228 @@
+"""
+Resiliència de les crides a Google Vision: hedging i circuit breaker
+
+- Hedging: si una crida triga més que el percentil observat (p.ex. p95), se
+  n'envia una segona i s'agafa la primera resposta. Retalla la cua de latència
+  (p99 de diversos segons amb una mediana de ~600 ms). Un pressupost limita les
+  crides extra (i per tant els crèdits) a una fracció de les crides primàries.
+- Circuit breaker: si la taxa d'errors supera el llindar, s'obre i deixa de
+  cridar Vision durant un temps (fallada ràpida o fallback); després deixa
+  passar una crida de prova (half-open) per decidir si es tanca.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Vision no es crida: el circuit breaker és obert."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Google Vision temporalment desactivat (circuit breaker obert)")
+        self.retry_after = retry_after
+
+
+class LatencyTracker:
+    """Latències recents (finestra lliscant) per calcular percentils."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """
+    Pressupost de crides extra: cada crida primària aporta `ratio` tokens
+    (fins a `burst`) i cada hedge en gasta un. Amb ratio=0.05, com a molt
+    un 5% de crides Vision addicionals a la llarga.
+    """
+
+    def __init__(self, ratio: float = 0.05, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+
+    def on_request(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class CircuitBreaker:
+    """Circuit breaker per taxa d'errors sobre les últimes `window` crides."""
+
+    def __init__(self, failure_rate: float = 0.5, min_requests: int = 20,
+                 window: int = 50, open_seconds: float = 30, enabled: bool = True):
+        self.enabled = enabled
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self._outcomes: deque[bool] = deque(maxlen=window)  # True = error
+
+        self.state = "closed"  # closed | open | half_open
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened_total = 0
+
+    def retry_after(self) -> int:
+        remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+        return max(1, math.ceil(remaining))
+
+    def allow(self) -> bool:
+        """Cert si es pot cridar Vision ara (en half-open, una sola crida de prova)."""
+        if not self.enabled or self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record(self, failed: bool) -> None:
+        if not self.enabled:
+            return
+        if self.state == "half_open":
+            self._probe_in_flight = False
+            if failed:
+                self._open()
+            else:
+                self.state = "closed"
+                self._outcomes.clear()
+            return
+
+        self._outcomes.append(failed)
+        if len(self._outcomes) >= self.min_requests \
+                and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def release(self) -> None:
+        """
+        Crida cancel·lada (client desconnectat, deadline, hedge perdedor): no
+        compta ni com a error ni com a èxit; en half-open allibera la prova.
+        """
+        if self.enabled and self.state == "half_open":
+            self._probe_in_flight = False
+
+    def _open(self) -> None:
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opened_total += 1
+
+    def stats(self) -> dict:
+        errors = sum(self._outcomes)
+        return {
+            "state": self.state,
+            "error_rate": round(errors / len(self._outcomes), 3) if self._outcomes else 0.0,
+            "opened_total": self.opened_total,
+        }
+
+
+class Hedger:
+    """Executa una crida amb una segona crida (hedge) si la primera s'endarrereix."""
+
+    def __init__(self, enabled: bool = False, percentile: float = 95,
+                 min_delay_ms: float = 300, max_delay_ms: float = 5000,
+                 min_samples: int = 20, budget_ratio: float = 0.05):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.min_samples = min_samples
+        self.latency = LatencyTracker()
+        self.budget = HedgeBudget(ratio=budget_ratio)
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def delay(self) -> Optional[float]:
+        """Espera abans del hedge (percentil observat, acotat) o None si no s'ha de fer."""
+        if not self.enabled or len(self.latency) < self.min_samples:
+            return None
+        return min(self.max_delay, max(self.min_delay, self.latency.percentile(self.percentile)))
+
+    async def run(self, call: Callable[[], Awaitable[T]],
+                  on_hedge: Optional[Callable[[], None]] = None) -> T:
+        """
+        Executa `call`; si s'endarrereix i hi ha pressupost, en llança una segona.
+
+        `on_hedge` es crida en llançar el hedge (el crèdit Vision extra es carrega
+        a qui fa la crida; HedgeBudget només limita el total global).
+        """
+        self.requests += 1
+        self.budget.on_request()
+
+        async def timed() -> T:
+            t0 = time.monotonic()
+            result = await call()
+            self.latency.observe(time.monotonic() - t0)
+            return result
+
+        primary = asyncio.ensure_future(timed())
+        tasks = {primary}
+        try:
+            delay = self.delay()
+            if delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self.budget.try_spend():
+                return await primary
+
+            self.hedges += 1
+            if on_hedge is not None:
+                on_hedge()
+            hedge = asyncio.ensure_future(timed())
+            tasks.add(hedge)
+
+            # Primera resposta correcta; si totes dues fallen, l'error de la primària
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        delay = self.delay()
+        p50 = self.latency.percentile(50)
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "hedge_delay_ms": round(delay * 1000) if delay is not None else None,
+        }
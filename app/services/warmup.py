@@ -0,0 +1,49 @@
+"""
+Escalfament abans d'acceptar trànsit
+
+La primera petició després d'un desplegament pagava la compilació de les
+regex dels parsers, la construcció dels validadors/serialitzadors pydantic i
+la primera crida a OpenCV (pic de p99 a cada rollout). Aquí es fa tot això
+amb dades fictícies (0 crèdits) abans que /ready doni 200.
+"""
+from app.parsers.dispatch import DOC_TYPES, parse_document
+
+# Text fictici que passa per les regex principals de cada parser
+_SAMPLES = {
+    "dni": (
+        "DOCUMENTO NACIONAL DE IDENTIDAD\n"
+        "APELLIDOS\nESPAÑOL ESPAÑOL\nNOMBRE\nCARMEN\n"
+        "SEXO F NACIONALIDAD ESP\nFECHA DE NACIMIENTO 01 01 1980\n"
+        "VALIDEZ 01 01 2030\nDNI 99999999R\n"
+        "IDESPBAA000000099999999R<<<<<<\n"
+        "8001014F3001018ESP<<<<<<<<<<<0\n"
+        "ESPANOL<ESPANOL<<CARMEN<<<<<<<"
+    ),
+    "permis": (
+        "PERMISO DE CIRCULACION\n"
+        "A 0000BBB\nB 01/01/2020\nC.1.1 ESPAÑOL ESPAÑOL\nC.1.2 CARMEN\n"
+        "D.1 SEAT\nD.2 KJ\nD.3 IBIZA\nE VSSZZZKJZLR000000\n"
+        "P.1 999\nP.2 70\nP.3 GASOLINA\nJEFATURA PROVINCIAL DE TRAFICO"
+    ),
+    "nif": (
+        "AGENCIA TRIBUTARIA\nTARJETA DE IDENTIFICACION FISCAL\n"
+        "NIF B00000000\nDENOMINACION O RAZON SOCIAL\nEXEMPLE SL\n"
+        "DOMICILIO SOCIAL\nCL MAJOR 1 08001 BARCELONA"
+    ),
+}
+
+
+def warm_parsers() -> None:
+    """Phase 1 + Phase 2 i serialització JSON de cada tipus de document."""
+    for doc_type in DOC_TYPES:
+        parse_document(doc_type, _SAMPLES[doc_type], "google_vision", 95.0).model_dump_json()
+
+
+def warm_image_processing() -> None:
+    """Una operació OpenCV petita (descodificar, CLAHE, codificar)."""
+    import numpy as np
+    from app.services.image_processor import image_processor
+    from app.utils.image_io import decode_image, encode_image
+
+    image = decode_image(encode_image(np.full((32, 32, 3), 255, np.uint8)))
+    encode_image(image_processor.enhance_contrast(image))
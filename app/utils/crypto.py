@@ -0,0 +1,25 @@
+"""
+Xifratge en repòs (Fernet) del magatzem OCR i de la cua de treballs
+
+Si l'operador ha configurat una clau, el servei no arrenca sense xifrar: una
+clau invàlida o el paquet cryptography absent és un error d'arrencada.
+"""
+import logging
+from typing import Any
+
+log = logging.getLogger("ocr.crypto")
+
+
+def make_fernet(key: str, setting: str) -> Any:
+    """
+    Fernet per a la clau configurada a `setting` (p.ex. "JOBS_ENCRYPTION_KEY").
+
+    Raises:
+        RuntimeError si la clau no es pot fer servir
+    """
+    try:
+        from cryptography.fernet import Fernet
+        return Fernet(key.encode())
+    except Exception as e:
+        log.error("encryption_key_unusable", extra={"setting": setting, "error": type(e).__name__})
+        raise RuntimeError(f"{setting} configurada però no utilitzable: {e}") from e
@@ -0,0 +1,200 @@
+"""
+Utilitats d'entrada d'imatges en memòria
+
+Els motors OCR i el pre-processament treballen sobre bytes o ndarrays:
+cap imatge del document toca el disc (RGPD + cost de tmpfs per petició).
+"""
+import io
+import os
+import warnings
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+if TYPE_CHECKING:  # cv2/numpy/PIL s'importen tard: només per als tipus
+    import numpy as np
+    from PIL import Image
+
+# Entrada acceptada pels motors: bytes codificats (JPG/PNG/WEBP), ndarray BGR,
+# PIL.Image (Tesseract) o path
+ImageInput = Union[bytes, bytearray, memoryview, str, os.PathLike, "np.ndarray", "Image.Image"]
+
+# Factors de descodificació JPEG a escala reduïda (libjpeg escala la DCT: 1/2, 1/4, 1/8)
+_JPEG_REDUCTIONS = (8, 4, 2)
+
+
+class ImageTooLarge(ValueError):
+    """La capçalera declara més píxels del pressupost (bomba de descompressió)."""
+
+
+def _is_array(image: Any) -> bool:
+    """ndarray (memoryview també té .shape, però són bytes codificats)."""
+    return hasattr(image, "shape") and not isinstance(image, memoryview)
+
+
+def _is_pil(image: Any) -> bool:
+    """PIL.Image sense importar PIL."""
+    return type(image).__module__.startswith("PIL.")
+
+
+def image_content(image: ImageInput) -> bytes:
+    """
+    Retorna els bytes codificats d'una imatge.
+
+    - bytes: es retornen tal qual (sense còpia)
+    - bytearray / memoryview: es converteixen a bytes
+    - ndarray (BGR, OpenCV): es codifica a JPEG en memòria
+    - PIL.Image: es codifica a PNG en memòria
+    - str / PathLike: es llegeix del fitxer (compatibilitat amb l'API antiga)
+    """
+    if isinstance(image, bytes):
+        return image
+    if isinstance(image, (bytearray, memoryview)):
+        return bytes(image)
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as image_file:
+            return image_file.read()
+    if _is_array(image):
+        return encode_image(image)
+    if _is_pil(image):
+        buf = io.BytesIO()
+        image.save(buf, format="PNG")
+        return buf.getvalue()
+    raise TypeError(f"Tipus d'imatge no suportat: {type(image).__name__}")
+
+
+def encode_image(image: Any, ext: str = ".jpg") -> bytes:
+    """Codifica un ndarray BGR a bytes (JPEG qualitat 95, com cv2.imwrite)."""
+    import cv2  # import tardà: només cal quan arriba un ndarray
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, 95] if ext in (".jpg", ".jpeg") else []
+    ok, buf = cv2.imencode(ext, image, params)
+    if not ok:
+        raise ValueError("No s'ha pogut codificar la imatge")
+    return buf.tobytes()
+
+
+def image_size(data: ImageInput) -> tuple[int, int]:
+    """
+    (amplada, alçada) llegides de la capçalera, sense descodificar els píxels.
+
+    PIL només llegeix la capçalera en obrir: uns pocs KB de PNG poden declarar
+    30000x30000 píxels (2,7 GB en BGR) i això es detecta abans de reservar res.
+
+    Raises:
+        ImageTooLarge si PIL ja la considera una bomba de descompressió
+        ValueError si la capçalera no és llegible
+    """
+    from PIL import Image
+
+    source = os.fspath(data) if isinstance(data, (str, os.PathLike)) else io.BytesIO(data)
+    try:
+        with warnings.catch_warnings():
+            # El límit és check_pixels: l'avís de PIL (> 89 MP) només embruta els logs
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(source) as img:
+                return img.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge("Imatge massa gran: la capçalera declara massa píxels.") from e
+    except Exception as e:
+        raise ValueError("No s'ha pogut llegir la capçalera de la imatge") from e
+
+
+def check_pixels(data: ImageInput, max_pixels: int) -> tuple[int, int]:
+    """
+    Comprova el pressupost de píxels a partir de la capçalera.
+
+    Returns:
+        (amplada, alçada)
+
+    Raises:
+        ImageTooLarge si amplada x alçada supera max_pixels
+        ValueError si la capçalera no és llegible
+    """
+    width, height = image_size(data)
+    if width * height > max_pixels:
+        raise ImageTooLarge(
+            f"Imatge massa gran: {width}x{height} píxels (màxim {max_pixels / 1e6:g} MP)."
+        )
+    return width, height
+
+
+def _exif_transposed(data: ImageInput) -> bool:
+    """True si l'EXIF Orientation (5-8) gira la imatge 90°: l'amplada final és l'alçada."""
+    from PIL import Image
+
+    source = os.fspath(data) if isinstance(data, (str, os.PathLike)) else io.BytesIO(data)
+    try:
+        with Image.open(source) as img:
+            return img.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+    except Exception:
+        return False
+
+
+def _jpeg_reduction(width: int, min_width: int) -> int:
+    """Factor de reducció més gran que manté l'amplada >= min_width (1: sense reduir)."""
+    return next((f for f in _JPEG_REDUCTIONS if width // f >= min_width), 1)
+
+
+def decode_image(data: ImageInput, max_pixels: Optional[int] = None,
+                 min_width: Optional[int] = None) -> Any:
+    """
+    Descodifica bytes a ndarray BGR sense fitxers temporals.
+
+    Args:
+        max_pixels: pressupost de píxels, comprovat a la capçalera abans de descodificar
+        min_width: amplada de treball; els JPEG es descodifiquen a 1/2, 1/4 o 1/8
+            (IMREAD_REDUCED_COLOR_*) sempre que quedin amb almenys aquesta amplada
+            un cop aplicada l'orientació EXIF, sense materialitzar mai el bitmap sencer. Els PNG/WEBP es descodifiquen sencers.
+
+    Raises:
+        ImageTooLarge si se supera max_pixels
+        ValueError si no es pot descodificar
+    """
+    import cv2
+    import numpy as np
+
+    if _is_array(data):
+        return data
+    if _is_pil(data):
+        data = image_content(data)
+
+    flags = cv2.IMREAD_COLOR
+    if max_pixels is not None or min_width is not None:
+        width, height = check_pixels(data, max_pixels) if max_pixels is not None else image_size(data)
+        if min_width is not None and _is_jpeg(data):
+            if _exif_transposed(data):
+                width = height  # OpenCV gira segons l'EXIF: l'amplada resultant és l'alçada
+            flags = {
+                2: cv2.IMREAD_REDUCED_COLOR_2,
+                4: cv2.IMREAD_REDUCED_COLOR_4,
+                8: cv2.IMREAD_REDUCED_COLOR_8,
+            }.get(_jpeg_reduction(width, min_width), cv2.IMREAD_COLOR)
+
+    if isinstance(data, (str, os.PathLike)):
+        image = cv2.imread(os.fspath(data), flags)
+    else:
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if image is None:
+        raise ValueError("No s'ha pogut descodificar la imatge")
+    return image
+
+
+def _is_jpeg(data: ImageInput) -> bool:
+    if isinstance(data, (str, os.PathLike)):
+        with open(data, "rb") as image_file:
+            return image_file.read(3) == b"\xff\xd8\xff"
+    return bytes(data[:3]) == b"\xff\xd8\xff"
+
+
+def to_pil(image: ImageInput) -> Any:
+    """Converteix qualsevol entrada a PIL.Image (per Tesseract)."""
+    from PIL import Image
+
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (str, os.PathLike)):
+        return Image.open(image)
+    if _is_array(image):
+        if image.ndim == 3:
+            image = image[:, :, ::-1]  # BGR → RGB
+        return Image.fromarray(image)
+    return Image.open(io.BytesIO(image))
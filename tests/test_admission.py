@@ -0,0 +1,148 @@
+"""
+Tests del control d'admissió (capacitat, cua acotada, rate limit)
+"""
+import asyncio
+import pytest
+from app.services.admission import AdmissionController, ClientRateLimiter, Overloaded, TokenBucket
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class TestTokenBucket:
+    def test_burst_then_empty(self):
+        bucket = TokenBucket(rate=1, burst=2)
+        assert bucket.try_acquire()
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+        assert bucket.retry_after() >= 1
+
+
+class TestClientRateLimiter:
+    def test_per_client_isolation(self):
+        limiter = ClientRateLimiter(per_minute=2)
+        assert limiter.check("a") is None
+        assert limiter.check("a") is None
+        assert limiter.check("a") is not None
+        assert limiter.check("b") is None
+
+    def test_zero_disables(self):
+        limiter = ClientRateLimiter(per_minute=0)
+        assert all(limiter.check("a") is None for _ in range(100))
+
+    def test_bounded_clients(self):
+        limiter = ClientRateLimiter(per_minute=5, max_clients=3)
+        for i in range(10):
+            limiter.check(f"c{i}")
+        assert len(limiter._buckets) == 3
+
+
+class TestAdmissionController:
+    def test_admits_and_tracks_in_flight(self):
+        ctrl = AdmissionController(max_in_flight=2)
+
+        async def main():
+            async with ctrl.admit():
+                return ctrl.stats()["in_flight"]
+
+        assert _run(main()) == 1
+        assert ctrl.in_flight == 0
+        assert ctrl.admitted_total == 1
+
+    def test_queue_full_rejects_fast(self):
+        ctrl = AdmissionController(max_in_flight=1, max_queue=0)
+
+        async def main():
+            async with ctrl.admit():
+                with pytest.raises(Overloaded) as exc:
+                    async with ctrl.admit():
+                        pass
+                return exc.value
+
+        err = _run(main())
+        assert err.status_code == 503
+        assert err.retry_after >= 1
+        assert ctrl.rejected_total["queue_full"] == 1
+
+    def test_queued_request_gets_slot(self):
+        ctrl = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=1)
+        order = []
+
+        async def worker(name, hold):
+            async with ctrl.admit():
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        async def main():
+            first = asyncio.create_task(worker("a", 0.05))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(worker("b", 0))
+            await asyncio.sleep(0.01)
+            queued = ctrl.queued
+            await asyncio.gather(first, second)
+            return queued
+
+        assert _run(main()) == 1
+        assert order == ["a", "b"]
+        assert ctrl.queued == 0
+
+    def test_queue_timeout(self):
+        ctrl = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.01)
+
+        async def main():
+            async with ctrl.admit():
+                with pytest.raises(Overloaded) as exc:
+                    async with ctrl.admit():
+                        pass
+                return exc.value
+
+        assert _run(main()).status_code == 503
+        assert ctrl.rejected_total["queue_timeout"] == 1
+
+    def test_rate_limited_429(self):
+        ctrl = AdmissionController(rate_limit_per_minute=1)
+
+        async def main():
+            async with ctrl.admit("k"):
+                pass
+            with pytest.raises(Overloaded) as exc:
+                async with ctrl.admit("k"):
+                    pass
+            return exc.value
+
+        err = _run(main())
+        assert err.status_code == 429
+        assert err.retry_after >= 1
+
+    def test_batch_tokens(self):
+        ctrl = AdmissionController(rate_limit_per_minute=5)
+        ctrl.check_rate("k", tokens=4)
+        with pytest.raises(Overloaded) as exc:
+            ctrl.check_rate("k", tokens=2)
+        assert exc.value.status_code == 429
+
+        # Més que la ràfega: cal el bucket ple i el buida
+        ctrl.check_rate("big", tokens=50)
+        with pytest.raises(Overloaded):
+            ctrl.check_rate("big", tokens=1)
+
+    def test_zero_tokens_skips_rate_limit(self):
+        ctrl = AdmissionController(rate_limit_per_minute=1)
+
+        async def main():
+            ctrl.check_rate("k")
+            async with ctrl.admit("k", tokens=0):
+                return ctrl.in_flight
+
+        assert _run(main()) == 1
+
+    def test_disabled(self):
+        ctrl = AdmissionController(max_in_flight=1, max_queue=0, enabled=False)
+
+        async def main():
+            async with ctrl.admit():
+                async with ctrl.admit():
+                    return True
+
+        assert _run(main())
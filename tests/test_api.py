@@ -0,0 +1,477 @@
+"""
+Tests d'integració de les rutes amb un client Vision fals (0 crèdits)
+"""
+import asyncio
+import io
+from collections import OrderedDict
+import time
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from app.config import settings
+from app.main import app
+from app.services import document_pipeline, preprocess_pipeline
+from app.services.admission import admission_controller
+from app.services.api_keys import ApiKeyRegistry, api_key_registry
+from app.services.google_vision_service import google_vision_service
+from app.services.job_queue import JobQueue
+from app.services.tesseract_service import tesseract_service
+from app.services.vision_fake import FakeImageAnnotatorClient
+
+DNI_TEXT = (
+    "DOCUMENTO NACIONAL DE IDENTIDAD\n"
+    "IDESPBHV122738077612097T<<<<<<\n"
+    "7301245M2808288ESP<<<<<<<<<<<4\n"
+    "COLL<CEREZO<<JOAQUIN<<<<<<<<<<"
+)
+
+
+def _jpeg(label: str = "DNI") -> bytes:
+    img = np.full((200, 300, 3), 255, np.uint8)
+    cv2.putText(img, label, (40, 120), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+@pytest.fixture
+def vision(monkeypatch):
+    fake = FakeImageAnnotatorClient(text=DNI_TEXT)
+    monkeypatch.setattr(google_vision_service, "client", fake)
+    monkeypatch.setattr(settings, "ocr_tesseract_first", False)
+    monkeypatch.setattr(settings, "api_key_enabled", False)
+    monkeypatch.setattr(admission_controller.rate_limiter, "per_minute", 0)
+    return fake
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+class TestSingleRoutes:
+    def test_dni_ok(self, vision, client):
+        r = client.post("/ocr/dni", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        body = r.json()
+        assert body["tipo_documento"] == "dni"
+        assert body["datos"]["numero_documento"] == "77612097T"
+        assert body["raw"]["ocr_engine"] == "google_vision"
+        assert vision.calls["document_text_detection"] == 1
+
+    def test_rejects_non_image(self, vision, client):
+        r = client.post("/ocr/dni", files={"file": ("dni.jpg", b"not an image", "image/jpeg")})
+        assert r.status_code == 400
+        assert vision.calls["document_text_detection"] == 0
+
+    def test_rejects_mime(self, vision, client):
+        r = client.post("/ocr/permis", files={"file": ("a.pdf", b"%PDF", "application/pdf")})
+        assert r.status_code == 400
+
+    def test_content_length_over_limit_413(self, vision, client):
+        body = b"\xff\xd8\xff" + b"x" * (6 * 1024 * 1024)
+        r = client.post("/ocr/dni", files={"file": ("dni.jpg", body, "image/jpeg")})
+        assert r.status_code == 413
+        assert vision.calls["document_text_detection"] == 0
+
+    def test_chunked_body_411(self, vision, client):
+        def chunks():
+            yield b"\xff\xd8\xff"
+            yield b"x" * 1024
+
+        r = client.post("/ocr/dni", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=x"})
+        assert r.status_code == 411
+        assert vision.calls["document_text_detection"] == 0
+
+    def test_decompression_bomb_413(self, vision, client):
+        buf = io.BytesIO()
+        Image.new("L", (10000, 10000)).save(buf, "PNG")
+        r = client.post("/ocr/dni", files={"file": ("dni.png", buf.getvalue(), "image/png")})
+        assert r.status_code == 413
+        assert vision.calls["document_text_detection"] == 0
+
+    def test_vision_unavailable(self, vision, client, monkeypatch):
+        monkeypatch.setattr(google_vision_service, "client", None)
+        r = client.post("/ocr/nif", files={"file": ("nif.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 503
+
+
+class TestEngineLadder:
+    """Tesseract primer; Vision només si Phase 2 no el dóna per bo."""
+
+    @pytest.fixture
+    def tesseract(self, vision, monkeypatch):
+        local = {"text": DNI_TEXT, "confidence": 90.0, "calls": 0}
+
+        def detect_text(content):
+            local["calls"] += 1
+            return {"text": local["text"], "confidence": local["confidence"]}
+
+        monkeypatch.setattr(settings, "ocr_tesseract_first", True)
+        monkeypatch.setattr(tesseract_service, "is_available", lambda: True)
+        monkeypatch.setattr(tesseract_service, "detect_text", detect_text)
+        return local
+
+    def test_tesseract_accepted_no_vision_credit(self, vision, tesseract, client):
+        r = client.post("/ocr/dni", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        assert r.json()["raw"]["ocr_engine"] == "tesseract"
+        assert r.json()["datos"]["numero_documento"] == "77612097T"
+        assert tesseract["calls"] == 1
+        assert vision.calls["document_text_detection"] == 0
+
+    def test_poor_tesseract_escalates_to_vision(self, vision, tesseract, client):
+        tesseract["text"], tesseract["confidence"] = "D0CUMENT0 ILEGIBLE", 30.0
+        r = client.post("/ocr/dni", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        assert r.json()["raw"]["ocr_engine"] == "google_vision"
+        assert vision.calls["document_text_detection"] == 1
+
+    def test_low_confidence_threshold_escalates(self, vision, tesseract, client, monkeypatch):
+        monkeypatch.setattr(settings, "ocr_tesseract_min_confidence", 101)
+        r = client.post("/ocr/dni", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.json()["raw"]["ocr_engine"] == "google_vision"
+
+    def test_type_not_in_ladder_goes_to_vision(self, vision, tesseract, client, monkeypatch):
+        monkeypatch.setattr(settings, "ocr_tesseract_first_types", ["permis"])
+        r = client.post("/ocr/dni", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.json()["raw"]["ocr_engine"] == "google_vision"
+        assert tesseract["calls"] == 0
+
+    def test_vision_unavailable_returns_local_result(self, vision, tesseract, client, monkeypatch):
+        tesseract["confidence"] = 20.0
+        monkeypatch.setattr(google_vision_service, "client", None)
+        r = client.post("/ocr/dni", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        assert r.json()["raw"]["ocr_engine"] == "tesseract"
+
+
+class TestOrientationProbeReuse:
+    """PREPROCESS_ORIENTATION=vision: l'OCR de la sonda és el resultat final."""
+
+    def test_no_second_vision_call(self, vision, client, monkeypatch):
+        monkeypatch.setattr(settings, "preprocess_orientation", "vision")
+        r = client.post("/ocr/dni?preprocess=true", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        assert r.json()["datos"]["numero_documento"] == "77612097T"
+        assert r.json()["raw"]["ocr_engine"] == "google_vision"
+        assert vision.calls["text_detection"] == 4
+        assert vision.calls["document_text_detection"] == 0
+        assert r.json()["meta"]["preprocessing"]["pipeline"] == "standard"
+        assert "geometry" in r.json()["meta"]["preprocessing"]["stages"]
+
+    def test_probe_credits_charged(self, keys, client, vision, monkeypatch):
+        monkeypatch.setattr(settings, "preprocess_orientation", "vision")
+        r = client.post("/ocr/dni?preprocess=true", files={"file": ("a.jpg", _jpeg(), "image/jpeg")},
+                        headers={"X-API-Key": "ui-key"})
+        assert r.status_code == 200
+        assert keys.authenticate("ui-key").vision_credits == 4
+
+    def test_empty_probe_falls_through(self, client, monkeypatch):
+        fake = FakeImageAnnotatorClient(text="")
+        monkeypatch.setattr(google_vision_service, "client", fake)
+        monkeypatch.setattr(settings, "ocr_tesseract_first", False)
+        monkeypatch.setattr(settings, "api_key_enabled", False)
+        monkeypatch.setattr(settings, "preprocess_orientation", "vision")
+        client.post("/ocr/dni?preprocess=true", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert fake.calls["text_detection"] == 4
+        assert fake.calls["document_text_detection"] == 1
+
+
+class TestPreprocessing:
+    def test_slow_preprocess_504(self, vision, client, monkeypatch):
+        def slow(*args):
+            time.sleep(0.5)
+
+        monkeypatch.setattr(document_pipeline, "OCR_TIMEOUT_SECONDS", 0.1)
+        monkeypatch.setattr(preprocess_pipeline, "preprocess_bytes", slow)
+        r = client.post("/ocr/dni?preprocess=true", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 504
+        assert vision.calls["document_text_detection"] == 0
+
+    def test_saturated_preprocess_503(self, vision, client, monkeypatch):
+        from app.services.preprocess_executor import preprocess_executor
+
+        monkeypatch.setattr(preprocess_executor, "max_pending", 1)
+        monkeypatch.setattr(preprocess_executor, "in_flight", 1)  # un timeout anterior encara ocupa el pool
+        r = client.post("/ocr/dni?preprocess=true", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 503
+        assert int(r.headers["Retry-After"]) >= 1
+        assert vision.calls["document_text_detection"] == 0
+
+    def test_queue_and_run_in_meta(self, vision, client, monkeypatch):
+        monkeypatch.setattr(settings, "preprocess_orientation", "off")
+        r = client.post("/ocr/dni?preprocess=true", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        report = r.json()["meta"]["preprocessing"]
+        assert report["queue_ms"] >= 0
+        assert report["run_ms"] >= report["total_ms"]
+
+
+    def test_auto_mode_reports_quality(self, vision, client):
+        r = client.post("/ocr/dni?preprocess=true&preprocess_mode=auto",
+                        files={"file": ("dni.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        report = r.json()["meta"]["preprocessing"]
+        assert report["pipeline"].startswith("auto:")
+        assert {"blur", "contrast", "brightness", "glare", "skew"} <= set(report["quality"])
+
+
+class TestDniSides:
+    def test_failed_side_cancels_the_other(self, monkeypatch):
+        from app.services.api_keys import ApiClient, current_api_client
+
+        started = asyncio.Event()
+
+        async def slow_vision(content, on_hedge=None, timeout=None):
+            started.set()
+            await asyncio.sleep(5)
+
+        monkeypatch.setattr(settings, "ocr_tesseract_first", False)
+        monkeypatch.setattr(google_vision_service, "is_available", lambda: True)
+        monkeypatch.setattr(google_vision_service, "detect_document_text_async", slow_vision)
+        original = document_pipeline._ocr_image
+
+        async def ocr_image(doc_type, content, *args, **kwargs):
+            if content == b"back":
+                await started.wait()
+                raise HTTPException(status_code=400, detail="El fitxer no és una imatge vàlida.")
+            return await original(doc_type, content, *args, **kwargs)
+
+        monkeypatch.setattr(document_pipeline, "_ocr_image", ocr_image)
+        api_client = ApiClient("ui", daily_vision_quota=10)
+
+        async def scenario():
+            current_api_client.set(api_client)
+            with pytest.raises(HTTPException) as e:
+                await document_pipeline.process_dni_sides(b"front", b"back")
+            # Abans que asyncio.run cancel·li les tasques penjades
+            return e.value.status_code, api_client.vision_credits
+
+        status_code, credits = asyncio.run(scenario())
+        assert status_code == 400
+        assert credits == 0  # l'anvers s'ha cancel·lat i el crèdit reservat s'ha retornat
+
+    def test_front_and_back_merged(self, vision, client):
+        front, back = _jpeg("FRONT"), _jpeg("BACK")
+        vision.responder = lambda content: (
+            "APELLIDOS\nCOLL CEREZO\nNOMBRE\nJOAQUIN\nDNI\n77612097T" if content == front
+            else "DOMICILIO\nC. ARTAIL 9\n\n" + DNI_TEXT.split("\n", 1)[1]
+        )
+        r = client.post("/ocr/dni/complet", files={
+            "front": ("front.jpg", front, "image/jpeg"),
+            "back": ("back.jpg", back, "image/jpeg"),
+        })
+        assert r.status_code == 200
+        body = r.json()
+        assert body["valido"] is True
+        assert body["datos"]["numero_documento"] == "77612097T"
+        assert body["datos"]["domicilio"] == "C. ARTAIL 9"
+        assert body["datos"]["mrz"]["document_number"] == "77612097T"
+        assert vision.calls["document_text_detection"] == 2
+
+    def test_requires_both_sides(self, vision, client):
+        r = client.post("/ocr/dni/complet", files={"front": ("front.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 422
+
+
+class TestAuto:
+    def test_detects_dni(self, vision, client):
+        r = client.post("/ocr/auto", files={"file": ("doc.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        body = r.json()
+        assert body["tipo_documento"] == "dni"
+        assert body["meta"]["classification_confidence"] > 50
+        assert vision.calls["document_text_detection"] == 1
+
+    def test_detects_permis(self, vision, client):
+        vision.text = "PERMISO DE CIRCULACIÓN\nA 1177MTM\nD.1\nTOYOTA\nC.1.1\nCOLL CEREZO"
+        r = client.post("/ocr/auto", files={"file": ("doc.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 200
+        assert r.json()["tipo_documento"] == "permiso_circulacion"
+
+    def test_unknown_type_422(self, vision, client):
+        vision.text = "LOREM IPSUM"
+        r = client.post("/ocr/auto", files={"file": ("doc.jpg", _jpeg(), "image/jpeg")})
+        assert r.status_code == 422
+
+
+class TestBatch:
+    def test_mixed_batch(self, vision, client):
+        img = _jpeg()
+        r = client.post(
+            "/ocr/batch",
+            files=[
+                ("files", ("a.jpg", img, "image/jpeg")),
+                ("files", ("b.jpg", img, "image/jpeg")),
+                ("files", ("c.jpg", b"garbage", "image/jpeg")),
+            ],
+            data={"doc_types": ["dni", "permis", "nif"]},
+        )
+        assert r.status_code == 200
+        body = r.json()
+        assert body["total"] == 3
+        assert body["ok"] == 2
+        assert [i["index"] for i in body["items"]] == [0, 1, 2]
+        assert body["items"][0]["result"]["tipo_documento"] == "dni"
+        assert body["items"][1]["result"]["tipo_documento"] == "permiso_circulacion"
+        assert body["items"][2]["status_code"] == 400
+        assert vision.calls["document_text_detection"] == 2
+
+    def test_unknown_doc_type_is_item_error(self, vision, client):
+        r = client.post(
+            "/ocr/batch",
+            files=[("files", ("a.jpg", _jpeg(), "image/jpeg"))],
+            data={"doc_types": ["passaport"]},
+        )
+        assert r.status_code == 200
+        assert r.json()["items"][0]["status_code"] == 400
+
+    def test_count_mismatch(self, vision, client):
+        r = client.post(
+            "/ocr/batch",
+            files=[("files", ("a.jpg", _jpeg(), "image/jpeg"))],
+            data={"doc_types": ["dni", "nif"]},
+        )
+        assert r.status_code == 400
+
+    def test_too_many_items(self, vision, client, monkeypatch):
+        monkeypatch.setattr(settings, "batch_max_items", 1)
+        img = _jpeg()
+        r = client.post(
+            "/ocr/batch",
+            files=[("files", ("a.jpg", img, "image/jpeg")), ("files", ("b.jpg", img, "image/jpeg"))],
+            data={"doc_types": ["dni", "dni"]},
+        )
+        assert r.status_code == 413
+
+
+class TestAdmission:
+    def test_rate_limit_returns_429_with_retry_after(self, vision, client, monkeypatch):
+        monkeypatch.setattr(admission_controller.rate_limiter, "per_minute", 1)
+        monkeypatch.setattr(admission_controller.rate_limiter, "_buckets", OrderedDict())
+        first = client.post("/ocr/dni", files={"file": ("a.jpg", _jpeg(), "image/jpeg")})
+        # Una X-API-Key no autenticada diferent no dona un bucket nou: el límit és per IP
+        second = client.post("/ocr/dni", files={"file": ("a.jpg", _jpeg(), "image/jpeg")},
+                             headers={"X-API-Key": "spoofed-1"})
+        assert first.status_code == 200
+        assert second.status_code == 429
+        assert int(second.headers["Retry-After"]) >= 1
+        assert list(admission_controller.rate_limiter._buckets) == ["testclient"]
+
+    def test_batch_charged_per_document(self, vision, client, monkeypatch):
+        monkeypatch.setattr(admission_controller.rate_limiter, "per_minute", 3)
+        monkeypatch.setattr(admission_controller.rate_limiter, "_buckets", OrderedDict())
+        img = _jpeg()
+
+        def batch(n):
+            return client.post(
+                "/ocr/batch",
+                files=[("files", (f"{i}.jpg", img, "image/jpeg")) for i in range(n)],
+                data={"doc_types": ["dni"] * n},
+            )
+
+        assert batch(2).status_code == 200
+        second = batch(2)  # només queda 1 token
+        assert second.status_code == 429
+        assert int(second.headers["Retry-After"]) >= 1
+        assert vision.calls["document_text_detection"] == 2
+
+    def test_batch_items_take_global_slots(self, vision, client, monkeypatch):
+        seen = []
+        original = document_pipeline.process_document
+
+        async def spy(*args, **kwargs):
+            seen.append(admission_controller.in_flight)
+            return await original(*args, **kwargs)
+
+        monkeypatch.setattr("app.routes.batch.process_document", spy)
+        img = _jpeg()
+        admitted = admission_controller.admitted_total
+        r = client.post(
+            "/ocr/batch",
+            files=[("files", (f"{i}.jpg", img, "image/jpeg")) for i in range(3)],
+            data={"doc_types": ["dni"] * 3},
+        )
+        assert r.status_code == 200
+        assert len(seen) == 3 and min(seen) >= 1  # cada ítem dins del seu slot
+        assert admission_controller.admitted_total - admitted == 3
+
+    def test_health_exposes_gauges(self, vision, client):
+        body = client.get("/health").json()
+        assert body["admission"]["in_flight"] == 0
+        assert "rejected_total" in body["admission"]
+
+
+@pytest.fixture
+def keys(vision, monkeypatch):
+    registry = ApiKeyRegistry()
+    registry.load([
+        {"name": "gogestor-ui", "key": "ui-key"},
+        {"name": "integrador", "key": "int-key", "rate_per_minute": 2, "daily_vision_quota": 1},
+    ])
+    monkeypatch.setattr(settings, "api_key_enabled", True)
+    monkeypatch.setattr(api_key_registry, "_by_hash", registry._by_hash)
+    return registry
+
+
+class TestApiKeys:
+    def _post(self, client, key):
+        return client.post("/ocr/dni", files={"file": ("a.jpg", _jpeg(), "image/jpeg")},
+                           headers={"X-API-Key": key})
+
+    def test_unknown_key_401(self, keys, client):
+        assert self._post(client, "nope").status_code == 401
+
+    def test_daily_quota_429(self, keys, client, vision):
+        assert self._post(client, "int-key").status_code == 200
+        r = self._post(client, "int-key")
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) >= 1
+        assert vision.calls["document_text_detection"] == 1
+        # L'altre integrador no es veu afectat
+        assert self._post(client, "ui-key").status_code == 200
+        assert keys.authenticate("ui-key").vision_credits == 1
+
+    def test_per_key_rate_limit(self, keys, client):
+        self._post(client, "int-key")
+        self._post(client, "int-key")
+        r = self._post(client, "int-key")
+        assert r.status_code == 429
+        assert keys.authenticate("int-key").requests == 3
+
+
+class TestJobs:
+    @pytest.fixture
+    def queue(self, vision, tmp_path, monkeypatch):
+        from app import main
+        from app.routes import jobs
+        queue = JobQueue(path=str(tmp_path / "jobs.sqlite3"), workers=1, poll_seconds=0.05)
+        monkeypatch.setattr(main, "job_queue", queue)
+        monkeypatch.setattr(jobs, "job_queue", queue)
+        return queue
+
+    def test_submit_and_poll(self, queue):
+        with TestClient(app) as client:
+            r = client.post("/ocr/jobs", files={"file": ("dni.jpg", _jpeg(), "image/jpeg")},
+                            data={"doc_type": "dni"})
+            assert r.status_code == 202
+            job_id = r.json()["job_id"]
+
+            for _ in range(100):
+                job = client.get(f"/ocr/jobs/{job_id}").json()
+                if job["status"] in ("done", "failed"):
+                    break
+                time.sleep(0.02)
+
+        assert job["status"] == "done"
+        assert job["result"]["datos"]["numero_documento"] == "77612097T"
+
+    def test_rejects_unknown_doc_type(self, queue, client):
+        r = client.post("/ocr/jobs", files={"file": ("a.jpg", _jpeg(), "image/jpeg")},
+                        data={"doc_type": "passaport"})
+        assert r.status_code == 400
+
+    def test_unknown_job_404(self, queue, client):
+        assert client.get("/ocr/jobs/nope").status_code == 404
@@ -0,0 +1,95 @@
+"""
+Tests del registre d'API keys (rate per client, quota diària Vision, snapshot)
+"""
+import json
+import pytest
+from app.services.api_keys import ApiClient, ApiKeyRegistry, key_hash
+
+
+class TestRegistry:
+    def test_plain_and_hashed_keys(self):
+        registry = ApiKeyRegistry()
+        registry.load(["plain", {"name": "ui", "key_sha256": key_hash("secret")}])
+        assert registry.authenticate("plain").name == "key-0"
+        assert registry.authenticate("secret").name == "ui"
+        assert registry.authenticate("other") is None
+        assert registry.authenticate(None) is None
+
+    def test_entry_without_key_is_rejected(self):
+        with pytest.raises(ValueError):
+            ApiKeyRegistry().load([{"name": "x"}])
+
+    def test_reload_keeps_today_usage(self):
+        registry = ApiKeyRegistry()
+        registry.load([{"name": "ui", "key": "a"}])
+        registry.authenticate("a").reserve_vision_credit()
+        registry.load([{"name": "ui", "key": "b"}])
+        assert registry.authenticate("a") is None
+        assert registry.authenticate("b").vision_credits == 1
+
+    def test_default_rate(self):
+        registry = ApiKeyRegistry()
+        registry.load(["k"], default_rate_per_minute=2)
+        client = registry.authenticate("k")
+        assert client.check_rate() is None
+        assert client.check_rate() is None
+        assert client.check_rate() >= 1
+
+
+class TestApiClient:
+    def test_daily_quota(self):
+        client = ApiClient("x", daily_vision_quota=2)
+        assert client.reserve_vision_credit()
+        assert client.reserve_vision_credit()
+        assert not client.reserve_vision_credit()
+        assert client.quota_retry_after() >= 1
+
+    def test_quota_resets_next_day(self):
+        client = ApiClient("x", daily_vision_quota=1)
+        assert client.reserve_vision_credit()
+        client.day = "2000-01-01"
+        assert client.reserve_vision_credit()
+        assert client.vision_credits == 1
+
+    def test_unlimited_by_default(self):
+        client = ApiClient("x")
+        assert all(client.check_rate() is None for _ in range(100))
+        assert all(client.reserve_vision_credit() for _ in range(100))
+
+    def test_max_in_flight(self):
+        client = ApiClient("x", max_in_flight=1)
+        assert client.try_enter()
+        assert not client.try_enter()
+        client.leave()
+        assert client.try_enter()
+
+
+class TestSnapshot:
+    def test_roundtrip(self, tmp_path):
+        path = str(tmp_path / "usage.json")
+        registry = ApiKeyRegistry(snapshot_path=path)
+        registry.load([{"name": "ui", "key": "a", "daily_vision_quota": 5}])
+        for _ in range(3):
+            registry.authenticate("a").reserve_vision_credit()
+        registry.save_snapshot()
+
+        restored = ApiKeyRegistry(snapshot_path=path)
+        restored.load([{"name": "ui", "key": "a", "daily_vision_quota": 5}])
+        restored.load_snapshot()
+        assert restored.authenticate("a").vision_credits == 3
+
+    def test_old_day_ignored(self, tmp_path):
+        path = tmp_path / "usage.json"
+        path.write_text(json.dumps({"day": "2000-01-01", "clients": {"ui": {"vision_credits": 9}}}))
+        registry = ApiKeyRegistry(snapshot_path=str(path))
+        registry.load([{"name": "ui", "key": "a"}])
+        registry.load_snapshot()
+        assert registry.authenticate("a").vision_credits == 0
+
+    def test_corrupt_snapshot_is_ignored(self, tmp_path):
+        path = tmp_path / "usage.json"
+        path.write_text("{not json")
+        registry = ApiKeyRegistry(snapshot_path=str(path))
+        registry.load(["a"])
+        registry.load_snapshot()
+        assert registry.authenticate("a").vision_credits == 0
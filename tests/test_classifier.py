@@ -0,0 +1,79 @@
+"""
+Tests de la classificació de documents per paraules clau
+"""
+from app.parsers.classifier import classify_document, score_document
+
+DNI_FRONT = """ESPAÑA
+DOCUMENTO NACIONAL DE IDENTIDAD
+APELLIDOS
+COLL CEREZO
+NOMBRE
+JOAQUIN
+SEXO NACIONALIDAD
+M ESP
+DNI 77612097T"""
+
+DNI_BACK = """DOMICILIO
+C. ARTAIL 9
+LLEIDA
+HIJO/A DE JOAQUIN / MARIA
+IDESPBHV122738077612097T<<<<<<
+7301245M2808288ESP<<<<<<<<<<<4
+COLL<CEREZO<<JOAQUIN<<<<<<<<<<"""
+
+PERMIS = """PERMISO DE CIRCULACIÓN
+A 1177MTM
+E YARKAAC3100018794
+D.1
+TOYOTA
+D.3
+TOYOTA YARIS
+P.1
+1490
+C.1.1
+COLL CEREZO
+C.1.2
+JOAQUIN"""
+
+NIF = """TARJETA DE IDENTIFICACIÓN FISCAL
+Número de Identificación Fiscal Definitivo
+B76261874
+Denominación
+CASAACTIVA GESTION, S.L.
+Domicilio Fiscal
+CALLE ORINOCO, NUM. 5
+Administración
+35601 PALMAS G.C"""
+
+
+class TestClassifyDocument:
+    def test_dni_front(self):
+        assert classify_document(DNI_FRONT)[0] == "dni"
+
+    def test_dni_back_by_mrz(self):
+        assert classify_document(DNI_BACK)[0] == "dni"
+
+    def test_permis(self):
+        assert classify_document(PERMIS)[0] == "permis"
+
+    def test_permis_without_header(self):
+        # Sense capçalera: només pels codis de camp DGT
+        text = PERMIS.split("\n", 1)[1]
+        assert classify_document(text)[0] == "permis"
+
+    def test_nif(self):
+        assert classify_document(NIF)[0] == "nif"
+
+    def test_unknown(self):
+        doc_type, confidence, scores = classify_document("LOREM IPSUM DOLOR")
+        assert doc_type is None
+        assert confidence == 0.0
+        assert scores == {"dni": 0, "permis": 0, "nif": 0}
+
+    def test_confidence_is_share_of_points(self):
+        doc_type, confidence, scores = classify_document(NIF)
+        assert confidence == round(100 * scores["nif"] / sum(scores.values()), 1)
+        assert 50 < confidence <= 100
+
+    def test_case_insensitive(self):
+        assert score_document(NIF.lower())["nif"] == score_document(NIF)["nif"]
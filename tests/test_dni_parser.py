@@ -382,3 +382,72 @@ class TestShouldFallback:
         fallback, motiu = DNIParser.should_fallback_to_vision(self._base(), 30.0)
         assert fallback is True
         assert "confidence" in motiu
+
+
+# ---------------------------------------------------------------------------
+# Anvers + revers
+# ---------------------------------------------------------------------------
+
+FRONT_TEXT = """APELLIDOS
+COLL CEREZO
+NOMBRE
+JOAQUÍN
+DNI
+77612097T
+FECHA DE NACIMIENTO
+24 01 1973"""
+
+BACK_TEXT = """DOMICILIO
+C. ARTAIL 9
+LLEIDA
+LLEIDA
+HIJO/A DE
+JOAQUIN / MARIA
+IDESPBHV122738077612097T<<<<<<
+7301245M2808288ESP<<<<<<<<<<<4
+COLL<CEREZO<<JOAQUIN<<<<<<<<<<"""
+
+
+class TestSides:
+    def test_merge_prefers_front_personal_and_back_address(self):
+        front, _ = DNIParser.parse(FRONT_TEXT)
+        back, _ = DNIParser.parse(BACK_TEXT)
+        merged = DNIParser.merge_sides(front, back)
+        assert merged.nombre == "JOAQUÍN"
+        assert merged.numero_documento == "77612097T"
+        assert merged.fecha_caducidad == "2028-08-28"
+        assert merged.domicilio == "C. ARTAIL 9"
+        assert merged.mrz is not None
+
+    def test_consistent_sides_no_items(self):
+        front, _ = DNIParser.parse(FRONT_TEXT)
+        back, _ = DNIParser.parse(BACK_TEXT)
+        assert DNIParser.cross_check_sides(front, back) == []
+
+    def test_number_mismatch_is_critical(self):
+        front = DNIDatos(numero_documento="12345678Z")
+        back = DNIDatos(numero_documento="77612097T")
+        result = DNIParser.validate_and_build_response(
+            DNIParser.merge_sides(front, back), None, "google_vision", 95.0,
+            extra_items=DNIParser.cross_check_sides(front, back),
+        )
+        codes = [e.code for e in result.errores_detectados]
+        assert "DNI_SIDES_NUMBER_MISMATCH" in codes
+        assert result.valido is False
+
+    def test_date_and_name_mismatch(self):
+        front = DNIDatos(apellidos="GARCIA LOPEZ", fecha_nacimiento="1973-01-24")
+        back = DNIDatos(apellidos="COLL CEREZO", fecha_nacimiento="1973-01-25")
+        codes = {i.code: i.severity for i in DNIParser.cross_check_sides(front, back)}
+        assert codes == {"DNI_SIDES_DATE_MISMATCH": "error", "DNI_SIDES_NAME_MISMATCH": "warning"}
+
+    def test_truncated_mrz_name_is_not_mismatch(self):
+        front = DNIDatos(apellidos="FERNÁNDEZ DE LA TORRE GARCÍA")
+        back = DNIDatos(apellidos="FERNANDEZ DE LA TORRE GAR")
+        assert DNIParser.cross_check_sides(front, back) == []
+
+    def test_swapped_sides_alert(self):
+        front, _ = DNIParser.parse(BACK_TEXT)
+        back, _ = DNIParser.parse(FRONT_TEXT)
+        codes = [i.code for i in DNIParser.cross_check_sides(front, back)]
+        assert "DNI_SIDES_SWAPPED" in codes
@@ -0,0 +1,95 @@
+"""
+Tests de la lectura d'uploads en streaming (magic bytes, mida, hash)
+"""
+import asyncio
+import hashlib
+import io
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from app.services import document_pipeline
+from app.services.document_pipeline import MAX_FILE_SIZE, read_upload
+
+JPEG_HEAD = b"\xff\xd8\xff\xe0"
+
+
+def _jpeg() -> bytes:
+    return cv2.imencode(".jpg", np.full((200, 300, 3), 255, np.uint8))[1].tobytes()
+
+
+class _CountingFile(io.BytesIO):
+    """BytesIO que compta els bytes llegits."""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _upload(data: bytes, content_type: str = "image/jpeg", size=None) -> UploadFile:
+    return UploadFile(file=_CountingFile(data), size=size, filename="a.jpg",
+                      headers=Headers({"content-type": content_type}))
+
+
+def _read(upload: UploadFile):
+    return asyncio.run(read_upload(upload))
+
+
+class TestReadUpload:
+    def test_returns_content_and_hash(self):
+        data = _jpeg() + b"\0" * 200_000
+        content, digest = _read(_upload(data))
+        assert content == data
+        assert digest == hashlib.sha256(data).hexdigest()
+
+    def test_bad_magic_rejected_after_first_chunk(self):
+        upload = _upload(b"GIF89a" + b"x" * 1_000_000)
+        with pytest.raises(HTTPException) as e:
+            _read(upload)
+        assert e.value.status_code == 400
+        assert upload.file.bytes_read == document_pipeline.UPLOAD_CHUNK_SIZE
+
+    def test_oversized_stops_reading(self):
+        upload = _upload(JPEG_HEAD + b"x" * (2 * MAX_FILE_SIZE))
+        with pytest.raises(HTTPException) as e:
+            _read(upload)
+        assert e.value.status_code == 413
+        assert upload.file.bytes_read <= MAX_FILE_SIZE + document_pipeline.UPLOAD_CHUNK_SIZE
+
+    def test_known_size_rejected_without_reading(self):
+        upload = _upload(JPEG_HEAD, size=MAX_FILE_SIZE + 1)
+        with pytest.raises(HTTPException) as e:
+            _read(upload)
+        assert e.value.status_code == 413
+        assert upload.file.bytes_read == 0
+
+    def test_tiny_file(self):
+        with pytest.raises(HTTPException) as e:
+            _read(_upload(b"\xff"))
+        assert e.value.status_code == 400
+
+    def test_mime_rejected(self):
+        with pytest.raises(HTTPException) as e:
+            _read(_upload(JPEG_HEAD, content_type="application/pdf"))
+        assert e.value.status_code == 400
+
+    def test_magic_without_header_rejected(self):
+        with pytest.raises(HTTPException) as e:
+            _read(_upload(JPEG_HEAD + b"x" * 200_000))
+        assert e.value.status_code == 400
+
+    def test_decompression_bomb_413(self):
+        buf = io.BytesIO()
+        Image.new("L", (10000, 10000)).save(buf, "PNG")
+        assert len(buf.getvalue()) < MAX_FILE_SIZE
+        with pytest.raises(HTTPException) as e:
+            _read(_upload(buf.getvalue(), content_type="image/png"))
+        assert e.value.status_code == 413
+        assert "10000x10000" in e.value.detail
@@ -0,0 +1,131 @@
+"""
+Tests de les utilitats d'imatge en memòria (sense fitxers temporals)
+"""
+import io
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from app.utils.image_io import (
+    ImageTooLarge, check_pixels, image_content, image_size, encode_image, decode_image, to_pil,
+)
+
+
+def _image() -> np.ndarray:
+    img = np.full((60, 80, 3), 255, np.uint8)
+    img[10:30, 10:70] = (0, 0, 255)  # franja vermella (BGR)
+    return img
+
+
+class TestImageContent:
+    def test_bytes_returned_as_is(self):
+        data = b"\xff\xd8\xffabc"
+        assert image_content(data) is data
+
+    def test_memoryview_and_bytearray(self):
+        data = b"\x89PNGxyz"
+        assert image_content(memoryview(data)) == data
+        assert image_content(bytearray(data)) == data
+
+    def test_ndarray_encoded_as_jpeg(self):
+        content = image_content(_image())
+        assert content[:3] == b"\xff\xd8\xff"
+
+    def test_path_still_supported(self, tmp_path):
+        path = tmp_path / "img.jpg"
+        path.write_bytes(encode_image(_image()))
+        assert image_content(str(path))[:3] == b"\xff\xd8\xff"
+
+    def test_pil_encoded_as_png(self):
+        content = image_content(to_pil(_image()))
+        assert content[:4] == b"\x89PNG"
+        assert np.array_equal(decode_image(to_pil(_image())), _image())
+
+    def test_unsupported_type(self):
+        with pytest.raises(TypeError):
+            image_content(123)
+
+
+class TestDecodeEncode:
+    def test_roundtrip_png_lossless(self):
+        img = _image()
+        decoded = decode_image(encode_image(img, ext=".png"))
+        assert decoded.shape == img.shape
+        assert np.array_equal(decoded, img)
+
+    def test_decode_memoryview(self):
+        decoded = decode_image(memoryview(encode_image(_image())))
+        assert decoded.shape == (60, 80, 3)
+
+    def test_decode_invalid_raises(self):
+        with pytest.raises(ValueError):
+            decode_image(b"no es una imatge")
+
+
+def _bomb(width: int = 20000, height: int = 20000) -> bytes:
+    """PNG d'un sol color: pocs KB que declaren width x height píxels."""
+    buf = io.BytesIO()
+    Image.new("L", (width, height)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class TestPixelBudget:
+    def test_size_from_header(self):
+        assert image_size(encode_image(_image())) == (80, 60)
+        assert image_size(encode_image(_image(), ext=".png")) == (80, 60)
+
+    def test_bomb_rejected_before_decoding(self):
+        bomb = _bomb()
+        assert len(bomb) < 1024 * 1024
+        with pytest.raises(ImageTooLarge):
+            decode_image(bomb, max_pixels=64_000_000)
+
+    def test_budget(self):
+        data = encode_image(_image())
+        assert check_pixels(data, 80 * 60) == (80, 60)
+        with pytest.raises(ImageTooLarge):
+            check_pixels(data, 80 * 60 - 1)
+
+    def test_unreadable_header(self):
+        with pytest.raises(ValueError):
+            check_pixels(b"\xff\xd8\xff" + b"x" * 100, 64_000_000)
+
+
+class TestReducedDecode:
+    def test_jpeg_reduced_to_target_width(self):
+        data = encode_image(np.full((1500, 4000, 3), 128, np.uint8))
+        assert decode_image(data, min_width=2000).shape == (750, 2000, 3)
+        assert decode_image(data, min_width=1000).shape == (375, 1000, 3)
+        assert decode_image(data, min_width=400).shape == (188, 500, 3)
+
+    def test_jpeg_below_twice_target_full_size(self):
+        data = encode_image(np.full((1000, 3000, 3), 128, np.uint8))
+        assert decode_image(data, min_width=2000).shape == (1000, 3000, 3)
+
+    def test_exif_rotation_keeps_target_width(self):
+        buf = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # gir de 90°: 2400x800 emmagatzemada, 800x2400 en pantalla
+        Image.new("RGB", (2400, 800), (128, 128, 128)).save(buf, "JPEG", exif=exif)
+        assert decode_image(buf.getvalue(), min_width=400).shape == (1200, 400, 3)
+
+    def test_png_not_reduced(self):
+        data = encode_image(np.full((100, 4000, 3), 128, np.uint8), ext=".png")
+        assert decode_image(data, min_width=1000).shape == (100, 4000, 3)
+
+    def test_reduced_close_to_resize(self):
+        img = cv2.resize(_image(), (4000, 3000), interpolation=cv2.INTER_NEAREST)
+        reduced = decode_image(encode_image(img), min_width=2000)
+        expected = cv2.resize(img, (2000, 1500), interpolation=cv2.INTER_AREA)
+        assert np.abs(reduced.astype(np.int16) - expected).mean() < 3
+
+
+class TestToPil:
+    def test_ndarray_bgr_to_rgb(self):
+        pil = to_pil(_image())
+        assert isinstance(pil, Image.Image)
+        assert pil.getpixel((20, 20)) == (255, 0, 0)
+
+    def test_bytes(self):
+        pil = to_pil(encode_image(_image(), ext=".png"))
+        assert pil.size == (80, 60)
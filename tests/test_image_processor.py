@@ -0,0 +1,148 @@
+"""
+Tests de la detecció d'orientació local (0 crèdits Vision)
+"""
+import cv2
+import numpy as np
+import pytest
+from app.config import settings
+from app.services.google_vision_service import google_vision_service
+from app.services.image_processor import ImageProcessor, _rotation90
+from app.services.tesseract_service import tesseract_service
+
+LINES = [
+    "apellidos garcia lopez", "nombre maria del carmen", "nacionalidad esp sexo f",
+    "fecha de nacimiento 01 01 1980", "domicilio calle mayor 12", "lugar de nacimiento barcelona",
+    "hijo de jose y maria", "equipo 08019 barcelona",
+]
+
+
+def _document(lines=LINES) -> np.ndarray:
+    img = np.full((640, 1000, 3), 255, np.uint8)
+    for i, text in enumerate(lines):
+        cv2.putText(img, text, (30, 60 + i * 70), cv2.FONT_HERSHEY_SIMPLEX, 1.3, (0, 0, 0), 2)
+    return img
+
+
+@pytest.fixture
+def no_osd(monkeypatch):
+    monkeypatch.setattr(tesseract_service, "detect_orientation", lambda image: None)
+
+
+@pytest.fixture
+def no_vision(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("la detecció local no ha de cridar Vision")
+
+    monkeypatch.setattr(google_vision_service, "detect_text", fail)
+
+
+class TestGeometry:
+    @pytest.mark.parametrize("degrees", [0, 90, 180, 270])
+    def test_detects_rotation(self, degrees):
+        rotated = ImageProcessor.rotate(_document(), (360 - degrees) % 360)
+        assert ImageProcessor.detect_orientation_geometry(rotated) == degrees
+
+    def test_uppercase_not_flipped(self):
+        upper = _document([line.upper() for line in LINES])
+        assert ImageProcessor.detect_orientation_geometry(upper) == 0
+
+
+class TestDetectAndFix:
+    def test_local_mode_no_vision_calls(self, no_osd, no_vision, monkeypatch):
+        monkeypatch.setattr(settings, "preprocess_orientation", "local")
+        doc = _document()
+        fixed = ImageProcessor.detect_and_fix_orientation(ImageProcessor.rotate(doc, 90))
+        assert fixed.shape == doc.shape
+        assert np.array_equal(fixed, doc)
+
+    def test_osd_preferred_when_confident(self, no_vision, monkeypatch):
+        monkeypatch.setattr(tesseract_service, "detect_orientation", lambda image: (270, 8.5))
+        assert ImageProcessor.detect_orientation(_document()) == (270, "tesseract_osd")
+
+    def test_low_osd_confidence_uses_geometry(self, no_vision, monkeypatch):
+        monkeypatch.setattr(tesseract_service, "detect_orientation", lambda image: (180, 0.4))
+        assert ImageProcessor.detect_orientation(_document()) == (0, "geometry")
+
+    def test_off_mode(self, no_vision, monkeypatch):
+        monkeypatch.setattr(settings, "preprocess_orientation", "off")
+        rotated = ImageProcessor.rotate(_document(), 90)
+        assert ImageProcessor.detect_and_fix_orientation(rotated) is rotated
+
+
+class TestDenoiseLite:
+    def _noisy(self):
+        clean = (_document() * 0.8 + 20).astype(np.uint8)  # sense retallar el soroll a 0/255
+        rng = np.random.default_rng(0)
+        noisy = np.clip(clean.astype(np.int16) + rng.normal(0, 25, clean.shape), 0, 255).astype(np.uint8)
+        return clean, noisy
+
+    def test_removes_most_noise(self):
+        clean, noisy = self._noisy()
+        out = ImageProcessor.denoise_lite(noisy)
+        assert out.shape == noisy.shape and out.dtype == np.uint8
+        before = np.abs(noisy.astype(float) - clean).mean()
+        after = np.abs(out.astype(float) - clean).mean()
+        assert after < before * 0.5
+
+    def test_grayscale(self):
+        _, noisy = self._noisy()
+        gray = cv2.cvtColor(noisy, cv2.COLOR_BGR2GRAY)
+        assert ImageProcessor.denoise_lite(gray).shape == gray.shape
+
+
+class TestComposedGeometry:
+    def _photo(self, width=3000, angle=1.0, card=False):
+        doc = cv2.resize(_document(), (width, int(width * 0.64)))
+        if card:
+            # Document sobre fons fosc, amb marge
+            h, w = doc.shape[:2]
+            canvas = np.full((int(h * 1.3), int(w * 1.3), 3), 40, np.uint8)
+            canvas[int(h * 0.15):int(h * 0.15) + h, int(w * 0.15):int(w * 0.15) + w] = doc
+            doc = canvas
+        h, w = doc.shape[:2]
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1)
+        return cv2.warpAffine(doc, M, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+    @pytest.mark.parametrize("degrees", [90, 180, 270])
+    def test_rotation90_matches_cv2(self, degrees):
+        image = np.arange(5 * 7 * 3, dtype=np.uint8).reshape(5, 7, 3)
+        R, size = _rotation90(degrees, (7, 5))
+        warped = cv2.warpPerspective(image, R, size, flags=cv2.INTER_NEAREST)
+        assert np.array_equal(warped, ImageProcessor.rotate(image, degrees))
+
+    def test_identity_not_resampled(self, no_osd):
+        image = _document()
+        M, size, info = ImageProcessor.plan_geometry(image)
+        assert info == {"boundaries": False, "orientation": 0, "skew": 0.0}
+        assert ImageProcessor.warp_geometry(image, M, size) is image
+
+    def test_resize_orientation_skew_in_one_warp(self, no_osd, no_vision, monkeypatch):
+        # Foto vertical de 2560x4000: redimensionar a 2000 d'amplada i girar → 3125x2000
+        photo = ImageProcessor.rotate(self._photo(width=4000), 90)
+        M, size, info = ImageProcessor.plan_geometry(photo)
+        assert info["orientation"] == 270
+        assert abs(info["skew"] + 1.0) < 0.5
+        assert size == (3125, 2000)
+
+        calls = []
+        real = cv2.warpPerspective
+        monkeypatch.setattr(cv2, "warpPerspective", lambda *a, **k: calls.append(a[0].shape) or real(*a, **k))
+        out = ImageProcessor.warp_geometry(photo, M, size)
+        assert calls == [photo.shape]
+        assert out.shape[:2] == (2000, 3125)
+
+        # Mateix resultat (llevat de la interpolació) que la cadena seqüencial
+        sequential = ImageProcessor.resize_if_needed(photo)
+        sequential = ImageProcessor.detect_and_fix_orientation(sequential)
+        sequential = ImageProcessor.detect_and_fix_rotation(sequential)
+        assert sequential.shape == out.shape
+        assert np.abs(sequential.astype(float) - out).mean() < 12
+
+    def test_document_boundaries_from_thumbnail(self, no_osd):
+        photo = self._photo(width=2400, angle=0, card=True)
+        M, size, info = ImageProcessor.plan_geometry(photo, find_boundaries=True)
+        assert info["boundaries"]
+        # El document fa 2400 px d'amplada dins d'un llenç de 3120
+        assert 1900 <= size[0] <= 2000
+        out = ImageProcessor.warp_geometry(photo, M, size)
+        assert out[5:-5, 5:-5].mean() > 200  # sense el fons fosc
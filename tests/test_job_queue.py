@@ -0,0 +1,213 @@
+"""
+Tests de la cua de treballs OCR (persistència, reintents, workers)
+"""
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.services.job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(path=str(tmp_path / "jobs.sqlite3"), workers=2, max_pending=3, poll_seconds=0.05)
+
+
+class TestPersistence:
+    def test_submit_and_get(self, queue):
+        job_id = queue.submit("dni", b"img", client="ui")
+        job = queue.get(job_id)
+        assert job["status"] == "queued"
+        assert job["doc_type"] == "dni"
+        assert job["client"] == "ui"
+        assert queue.get("nope") is None
+
+    def test_claim_oldest_first(self, queue):
+        first = queue.submit("dni", b"a")
+        queue.submit("nif", b"b")
+        job = queue._claim()
+        assert job["job_id"] == first
+        assert job["content"] == b"a"
+        assert queue.get(first)["status"] == "running"
+
+    def test_finish_drops_image(self, queue):
+        job_id = queue.submit("dni", b"a")
+        job = queue._claim()
+        queue._finish(job_id, 200, '{"x": 1}', None, job["attempts"])
+        assert queue.get(job_id)["status"] == "done"
+        assert queue.get(job_id)["result"] == {"x": 1}
+        assert queue._conn.execute("SELECT image FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] is None
+
+    def test_transient_error_requeued(self, queue):
+        job_id = queue.submit("dni", b"a")
+        job = queue._claim()
+        queue._finish(job_id, 503, None, "Motor OCR no disponible", job["attempts"])
+        assert queue.get(job_id)["status"] == "queued"
+        assert queue._claim() is None  # encara dins del retard de reintent
+
+    def test_gives_up_after_max_attempts(self, queue):
+        job_id = queue.submit("dni", b"a")
+        queue._finish(job_id, 504, None, "Timeout", attempts=3)
+        job = queue.get(job_id)
+        assert job["status"] == "failed"
+        assert job["status_code"] == 504
+
+    def test_survives_restart(self, tmp_path):
+        path = str(tmp_path / "jobs.sqlite3")
+        queue = JobQueue(path=path)
+        job_id = queue.submit("dni", b"a")
+        queue._claim()  # en curs quan "cau" el procés
+
+        restarted = JobQueue(path=path)
+        assert restarted.requeue_running() == 1
+        assert restarted._claim()["job_id"] == job_id
+
+    def test_queue_full(self, queue):
+        for _ in range(3):
+            queue.submit("dni", b"a")
+        with pytest.raises(HTTPException) as e:
+            queue.submit("dni", b"a")
+        assert e.value.status_code == 503
+
+    def test_encrypted_image(self, tmp_path):
+        from cryptography.fernet import Fernet
+        queue = JobQueue(path=str(tmp_path / "jobs.sqlite3"), encryption_key=Fernet.generate_key().decode())
+        queue.submit("dni", b"secret-image")
+        stored = queue._conn.execute("SELECT image FROM jobs").fetchone()[0]
+        assert b"secret-image" not in stored
+        assert queue._claim()["content"] == b"secret-image"
+
+    def test_invalid_key_fails_loudly(self, tmp_path):
+        with pytest.raises(RuntimeError, match="JOBS_ENCRYPTION_KEY"):
+            JobQueue(path=str(tmp_path / "jobs.sqlite3"), encryption_key="not-a-fernet-key")
+
+    def test_wrong_key_fails_job(self, tmp_path):
+        from cryptography.fernet import Fernet
+        path = str(tmp_path / "jobs.sqlite3")
+        job_id = JobQueue(path=path, encryption_key=Fernet.generate_key().decode()).submit("dni", b"secret")
+
+        rotated = JobQueue(path=path, encryption_key=Fernet.generate_key().decode())
+        next_id = rotated.submit("dni", b"new")
+        assert rotated._claim()["job_id"] == next_id
+        job = rotated.get(job_id)
+        assert job["status"] == "failed"
+        assert job["status_code"] == 500
+
+    def test_restart_gives_up_after_max_attempts(self, tmp_path):
+        path = str(tmp_path / "jobs.sqlite3")
+        queue = JobQueue(path=path)
+        job_id = queue.submit("dni", b"a")
+        queue._claim()
+        queue._conn.execute("UPDATE jobs SET attempts = 3")
+        queue._conn.commit()
+
+        restarted = JobQueue(path=path)
+        assert restarted.requeue_running() == 0
+        assert restarted.get(job_id)["status"] == "failed"
+        assert restarted._claim() is None
+
+    def test_purge_expired(self, queue):
+        job_id = queue.submit("dni", b"a")
+        queue._finish(job_id, 200, "{}", None, 1)
+        queue._conn.execute("UPDATE jobs SET finished_at = 0")
+        assert queue.purge_expired() == 1
+        assert queue.get(job_id) is None
+
+    def test_disabled(self, tmp_path):
+        queue = JobQueue(path=str(tmp_path / "jobs.sqlite3"), enabled=False)
+        with pytest.raises(HTTPException):
+            queue.submit("dni", b"a")
+        assert queue.stats() == {"enabled": False}
+
+
+class TestWorkers:
+    def test_workers_drain_queue(self, queue, monkeypatch):
+        from app.services import document_pipeline
+
+        async def fake_process(doc_type, content, *args):
+            if content == b"bad":
+                raise HTTPException(status_code=400, detail="El fitxer no és una imatge vàlida.")
+
+            class _Result:
+                def model_dump_json(self):
+                    return '{"tipo_documento": "dni"}'
+            return _Result()
+
+        monkeypatch.setattr(document_pipeline, "process_document", fake_process)
+
+        async def scenario():
+            await queue.start()
+            ok = queue.submit("dni", b"good")
+            bad = queue.submit("dni", b"bad")
+            for _ in range(100):
+                if queue.stats()["queued"] == 0 and queue.stats()["running"] == 0:
+                    break
+                await asyncio.sleep(0.02)
+            await queue.stop()
+            return ok, bad
+
+        ok, bad = asyncio.run(scenario())
+        assert queue.get(ok)["status"] == "done"
+        assert queue.get(bad)["status"] == "failed"
+        assert queue.get(bad)["status_code"] == 400
+
+    def test_worker_survives_claim_error(self, queue, monkeypatch):
+        from app.services import document_pipeline
+
+        async def fake_process(*args):
+            class _Result:
+                def model_dump_json(self):
+                    return "{}"
+            return _Result()
+
+        monkeypatch.setattr(document_pipeline, "process_document", fake_process)
+        claim = queue._claim
+        failures = []
+
+        def flaky_claim():
+            if not failures:
+                failures.append(1)
+                raise RuntimeError("database is locked")
+            return claim()
+
+        monkeypatch.setattr(queue, "_claim", flaky_claim)
+        queue.workers = 1
+
+        async def scenario():
+            await queue.start()
+            job_id = queue.submit("dni", b"good")
+            for _ in range(100):
+                if queue.get(job_id)["status"] == "done":
+                    break
+                await asyncio.sleep(0.02)
+            await queue.stop()
+            return job_id
+
+        assert queue.get(asyncio.run(scenario()))["status"] == "done"
+        assert failures == [1]
+
+    def test_submit_from_thread_wakes_worker(self, tmp_path, monkeypatch):
+        from fastapi.concurrency import run_in_threadpool
+        from app.services import document_pipeline
+
+        async def fake_process(*args):
+            class _Result:
+                def model_dump_json(self):
+                    return "{}"
+            return _Result()
+
+        monkeypatch.setattr(document_pipeline, "process_document", fake_process)
+        # Poll llarg: només el wakeup pot fer que el treball es processi a temps
+        queue = JobQueue(path=str(tmp_path / "jobs.sqlite3"), workers=1, poll_seconds=30)
+
+        async def scenario():
+            await queue.start()
+            await asyncio.sleep(0.05)  # el worker ja espera el wakeup
+            job_id = await run_in_threadpool(queue.submit, "dni", b"good")
+            for _ in range(100):
+                if queue.get(job_id)["status"] == "done":
+                    break
+                await asyncio.sleep(0.02)
+            await queue.stop()
+            return job_id
+
+        assert queue.get(asyncio.run(scenario()))["status"] == "done"
@@ -0,0 +1,88 @@
+"""
+Tests del magatzem persistent de text OCR i del re-parseig en bloc
+"""
+import sqlite3
+import time
+import pytest
+from cryptography.fernet import Fernet
+from app.services.ocr_store import OCRStore
+from app.reparse import reparse
+
+MRZ_TEXT = (
+    "IDESPBHV122738077612097T<<<<<<\n"
+    "7301245M2808288ESP<<<<<<<<<<<4\n"
+    "COLL<CEREZO<<JOAQUIN<<<<<<<<<<"
+)
+
+RESULT = {
+    "text": MRZ_TEXT,
+    "confidence": 95.0,
+    "annotations": [{"text": "COLL", "vertices": [[0, 0], [10, 0], [10, 5], [0, 5]], "confidence": 99.0}],
+}
+
+
+def _store(tmp_path, **kwargs) -> OCRStore:
+    return OCRStore(path=str(tmp_path / "store.sqlite3"), **kwargs)
+
+
+class TestOCRStore:
+    def test_put_and_get(self, tmp_path):
+        store = _store(tmp_path)
+        store.put("h1", "dni", "google_vision", "none", RESULT)
+        record = store.get("h1", "google_vision", "none")
+        assert record["text"] == MRZ_TEXT
+        assert record["doc_type"] == "dni"
+        assert record["annotations"][0]["text"] == "COLL"
+        assert store.get("h1", "google_vision", "standard") is None
+
+    def test_same_key_replaced(self, tmp_path):
+        store = _store(tmp_path)
+        store.put("h1", "dni", "google_vision", "none", RESULT)
+        store.put("h1", "dni", "google_vision", "none", {**RESULT, "text": "nou"})
+        assert store.count() == 1
+        assert store.get("h1", "google_vision", "none")["text"] == "nou"
+
+    def test_encrypted_payload_not_plain(self, tmp_path):
+        key = Fernet.generate_key().decode()
+        store = _store(tmp_path, encryption_key=key)
+        store.put("h1", "dni", "google_vision", "none", RESULT)
+
+        raw = sqlite3.connect(store.path).execute("SELECT payload FROM ocr_text").fetchone()[0]
+        assert b"JOAQUIN" not in raw
+        assert store.get("h1", "google_vision", "none")["text"] == MRZ_TEXT
+
+    def test_invalid_key_fails_loudly(self, tmp_path):
+        with pytest.raises(RuntimeError, match="OCR_STORE_ENCRYPTION_KEY"):
+            _store(tmp_path, encryption_key="not-a-fernet-key")
+
+    def test_retention_purge(self, tmp_path):
+        store = _store(tmp_path, retention_days=1)
+        store.put("old", "dni", "google_vision", "none", RESULT)
+        store.put("new", "dni", "google_vision", "none", RESULT)
+        store._conn.execute("UPDATE ocr_text SET created_at = ? WHERE image_hash = 'old'",
+                            (time.time() - 3 * 86400,))
+        assert store.purge_expired() == 1
+        assert store.count() == 1
+
+    def test_disabled_store_is_noop(self, tmp_path):
+        store = _store(tmp_path, enabled=False)
+        store.put("h1", "dni", "google_vision", "none", RESULT)
+        assert store.get("h1", "google_vision", "none") is None
+        assert list(store.iter_records()) == []
+
+    def test_mode_key(self):
+        assert OCRStore.mode_key(False, "standard") == "none"
+        assert OCRStore.mode_key(True, "aggressive") == "aggressive"
+
+
+class TestReparse:
+    def test_reparse_filters_by_doc_type(self, tmp_path):
+        store = _store(tmp_path)
+        store.put("h1", "dni", "google_vision", "none", RESULT)
+        store.put("h2", "permis", "google_vision", "none", {"text": "", "confidence": 0.0})
+
+        items = list(reparse(store, doc_type="dni"))
+        assert len(items) == 1
+        assert items[0]["image_hash"] == "h1"
+        assert items[0]["response"]["datos"]["numero_documento"] == "77612097T"
+        assert items[0]["response"]["tipo_documento"] == "dni"
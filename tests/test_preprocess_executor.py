@@ -0,0 +1,98 @@
+"""
+Tests del pool de pre-processament (fora de l'event loop, cua i temps)
+"""
+import asyncio
+import time
+import pytest
+from app.services.admission import Overloaded
+from app.services.preprocess_executor import PreprocessExecutor
+
+
+def _sleep(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+class TestPreprocessExecutor:
+    def test_event_loop_not_blocked(self):
+        executor = PreprocessExecutor("thread", workers=1)
+
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.create_task(ticker())
+            await executor.run(_sleep, 0.2)
+            task.cancel()
+            return ticks
+
+        assert asyncio.run(scenario()) >= 5
+        executor.close()
+
+    def test_queue_wait_reported_separately(self):
+        executor = PreprocessExecutor("thread", workers=1)
+
+        async def scenario():
+            return await asyncio.gather(executor.run(_sleep, 0.1), executor.run(_sleep, 0.1))
+
+        (_, wait_a, run_a), (_, wait_b, run_b) = asyncio.run(scenario())
+        assert min(wait_a, wait_b) < 50
+        assert max(wait_a, wait_b) >= 80
+        assert run_a >= 90 and run_b >= 90
+        assert executor.stats() == {
+            "kind": "thread", "workers": 1, "max_pending": 0, "in_flight": 0, "completed": 2, "rejected": 0,
+        }
+        executor.close()
+
+    def test_pending_cap_rejects_fast(self):
+        executor = PreprocessExecutor("thread", workers=1, max_pending=2)
+
+        async def scenario():
+            running = [asyncio.ensure_future(executor.run(_sleep, 0.2)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            with pytest.raises(Overloaded) as e:
+                await executor.run(_sleep, 0)
+            await asyncio.gather(*running)
+            return e.value
+
+        error = asyncio.run(scenario())
+        assert error.status_code == 503 and error.retry_after >= 1
+        assert executor.stats()["rejected"] == 1
+        executor.close()
+
+    def test_timed_out_tasks_still_count_and_queued_ones_dropped(self):
+        executor = PreprocessExecutor("thread", workers=1, max_pending=4)
+        ran = []
+
+        def work(name):
+            ran.append(name)
+            time.sleep(0.2)
+
+        async def scenario():
+            for name in ("a", "b"):
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(executor.run(work, name), timeout=0.05)
+            pending = executor.in_flight
+            await asyncio.sleep(0.3)
+            return pending
+
+        assert asyncio.run(scenario()) == 1  # "a" segueix ocupant el worker; "b" ha sortit de la cua
+        assert ran == ["a"]
+        assert executor.in_flight == 0
+        executor.close()
+
+    def test_process_pool(self):
+        executor = PreprocessExecutor("process", workers=1)
+        result, wait_ms, run_ms = asyncio.run(executor.run(sum, [1, 2, 3]))
+        assert result == 6
+        assert wait_ms >= 0 and run_ms >= 0
+        executor.close()
+
+    def test_unknown_kind_falls_back_to_threads(self):
+        assert PreprocessExecutor("gpu").kind == "thread"
+
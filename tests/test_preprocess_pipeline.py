@@ -0,0 +1,145 @@
+"""
+Tests del pipeline de pre-processament per etapes
+"""
+import cv2
+import numpy as np
+import pytest
+from app.config import settings
+from app.services.image_processor import ImageProcessor
+from app.services import preprocess_pipeline
+from app.services.preprocess_pipeline import (
+    DECODE_WIDTH, DECODE_WIDTH_BOUNDARIES, MODES, PreprocessPipeline, Stage, auto_mode, decode_width, pipeline_for,
+)
+
+
+def _image() -> np.ndarray:
+    img = np.full((300, 500, 3), 255, np.uint8)
+    cv2.putText(img, "DOCUMENTO", (20, 150), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 0), 4)
+    return img
+
+
+def _page() -> np.ndarray:
+    img = np.full((1280, 2000, 3), 255, np.uint8)
+    for i in range(8):
+        cv2.putText(img, "apellidos garcia lopez 01 01 1980", (60, 120 + i * 140),
+                    cv2.FONT_HERSHEY_SIMPLEX, 2.6, (0, 0, 0), 4)
+    return img
+
+
+@pytest.fixture(autouse=True)
+def no_orientation(monkeypatch):
+    monkeypatch.setattr(settings, "preprocess_orientation", "off")
+
+
+class TestModes:
+    def test_standard_matches_manual_chain(self):
+        image = _image()
+        expected = ImageProcessor.enhance_contrast(
+            ImageProcessor.detect_and_fix_rotation(ImageProcessor.resize_if_needed(image))
+        )
+        assert np.array_equal(pipeline_for("standard").run(image).image, expected)
+
+    @pytest.mark.parametrize("mode", sorted(MODES))
+    def test_timings_per_stage(self, mode):
+        result = pipeline_for(mode).run(_image())
+        assert list(result.timings) == list(MODES[mode])
+        assert all(ms >= 0 for ms in result.timings.values())
+        assert result.report()["pipeline"] == mode
+        assert result.report()["total_ms"] == result.total_ms
+
+    def test_unknown_mode_geometry_only(self):
+        assert pipeline_for("whatever").stage_names == ["geometry"]
+
+
+class TestCustomPipelines:
+    def test_doc_type_override(self, monkeypatch):
+        monkeypatch.setattr(settings, "preprocess_pipelines", {
+            "permis": ["resize", "clahe"],
+            "dni:aggressive": ["resize", "denoise"],
+        })
+        assert pipeline_for("standard", "permis").stage_names == ["resize", "clahe"]
+        assert pipeline_for("aggressive", "dni").stage_names == ["resize", "denoise"]
+        assert pipeline_for("standard", "dni").stage_names == list(MODES["standard"])
+        assert pipeline_for("standard", "permis").name == "permis"
+
+    def test_unknown_stage_rejected(self):
+        with pytest.raises(ValueError):
+            PreprocessPipeline(["resize", "magic"])
+
+    def test_custom_stage_object(self):
+        seen = []
+        pipeline = PreprocessPipeline(["binarize", Stage("spy", lambda ctx: seen.append(ctx.image.ndim))])
+        result = pipeline.run(_image())
+        assert seen == [2]
+        assert result.image.ndim == 2
+        assert list(result.timings) == ["binarize", "spy"]
+
+    @pytest.mark.parametrize("setting, called", [("lite", "denoise_lite"), ("full", "denoise")])
+    def test_denoise_stage_follows_setting(self, setting, called, monkeypatch):
+        calls = []
+        monkeypatch.setattr(settings, "preprocess_denoise", setting)
+        for name in ("denoise", "denoise_lite"):
+            monkeypatch.setattr(ImageProcessor, name, staticmethod(lambda image, name=name: calls.append(name) or image))
+        PreprocessPipeline(["denoise"]).run(_image())
+        assert calls == [called]
+
+    def test_boundaries_feed_perspective(self):
+        img = np.zeros((400, 600, 3), np.uint8)
+        cv2.rectangle(img, (100, 80), (500, 320), (255, 255, 255), -1)
+        result = PreprocessPipeline(["boundaries", "perspective"]).run(img)
+        assert result.image.shape[0] < 400 and result.image.shape[1] < 600
+
+
+class TestDecodeWidth:
+    def test_per_mode(self):
+        assert decode_width("standard") == DECODE_WIDTH
+        assert decode_width("auto") == DECODE_WIDTH
+        assert decode_width("document") == DECODE_WIDTH_BOUNDARIES
+
+    def test_pipeline_without_resize_full_resolution(self, monkeypatch):
+        monkeypatch.setattr(settings, "preprocess_pipelines", {"permis": ["clahe"]})
+        assert decode_width("standard", "permis") is None
+        assert decode_width("auto", "permis") is None
+
+
+class TestAuto:
+    def test_good_scan_skips_preprocessing(self):
+        page = _page()
+        assert auto_mode(ImageProcessor.quality_metrics(page)) is None
+        result = preprocess_pipeline.run(page, "auto")
+        assert result.image is page
+        assert result.name == "auto:none"
+        assert list(result.timings) == ["quality"]
+        assert result.report()["quality"]["sharpness"] > 0
+
+    def test_blurred_photo_aggressive(self):
+        blurred = cv2.GaussianBlur(_page(), (0, 0), 4)
+        assert auto_mode(ImageProcessor.quality_metrics(blurred)) == "aggressive"
+
+    def test_low_contrast_standard(self):
+        faded = (_page() * 0.25 + 150).astype(np.uint8)
+        assert ImageProcessor.quality_metrics(faded)["contrast"] < 30
+        result = preprocess_pipeline.run(faded, "auto")
+        assert result.name == "auto:standard"
+        assert list(result.timings) == ["quality", *MODES["standard"]]
+
+    def test_skew_standard(self):
+        page = _page()
+        matrix = cv2.getRotationMatrix2D((1000, 640), 4, 1)
+        skewed = cv2.warpAffine(page, matrix, (2000, 1280), borderValue=(255, 255, 255))
+        metrics = ImageProcessor.quality_metrics(skewed)
+        assert abs(metrics["skew"]) > 3
+        assert auto_mode(metrics) == "standard"
+
+    def test_glare_on_card_standard(self):
+        card = (_page() * 0.5 + 60).astype(np.uint8)
+        assert auto_mode(ImageProcessor.quality_metrics(card)) is None
+        cv2.circle(card, (1000, 600), 350, (255, 255, 255), -1)
+        metrics = ImageProcessor.quality_metrics(card)
+        assert metrics["glare"] > 0.02
+        assert auto_mode(metrics) == "standard"
+
+    def test_white_scan_is_not_glare(self):
+        metrics = ImageProcessor.quality_metrics(_page())
+        assert metrics["glare"] > 0.5
+        assert auto_mode(metrics) is None
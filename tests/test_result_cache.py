@@ -0,0 +1,83 @@
+"""
+Tests del cache de resultats per hash de contingut (LRU + TTL)
+"""
+from app.services.result_cache import ResultCache, content_hash
+from app.models.base_response import RawOCR, MetaInfo
+from app.models.dni_response import DNIDatos, DNIValidationResponse
+
+
+def _response(numero="77612097T") -> DNIValidationResponse:
+    return DNIValidationResponse(
+        valido=True,
+        confianza_global=95,
+        datos=DNIDatos(numero_documento=numero),
+        raw=RawOCR(ocr_engine="google_vision", ocr_confidence=95.0),
+        meta=MetaInfo(success=True, message="ok"),
+    )
+
+
+class TestKey:
+    def test_hash_is_sha256(self):
+        assert content_hash(b"abc") == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+
+    def test_endpoint_and_options_change_key(self):
+        d = content_hash(b"img")
+        assert ResultCache.make_key(d, "dni") != ResultCache.make_key(d, "permis")
+        assert ResultCache.make_key(d, "dni", True, "standard") != ResultCache.make_key(d, "dni", True, "aggressive")
+
+    def test_mode_ignored_without_preprocess(self):
+        d = content_hash(b"img")
+        assert ResultCache.make_key(d, "dni", False, "standard") == ResultCache.make_key(d, "dni", False, "aggressive")
+
+
+class TestResultCache:
+    def test_miss_then_hit_flags_meta(self):
+        cache = ResultCache()
+        assert cache.get("k") is None
+        cache.set("k", _response())
+        hit = cache.get("k")
+        assert hit is not None
+        assert hit.meta.cached is True
+        assert hit.datos.numero_documento == "77612097T"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_stored_copy_is_isolated(self):
+        cache = ResultCache()
+        original = _response()
+        cache.set("k", original)
+        original.datos.numero_documento = "CHANGED"
+        assert cache.get("k").datos.numero_documento == "77612097T"
+        cache.get("k").datos.numero_documento = "CHANGED"
+        assert cache.get("k").datos.numero_documento == "77612097T"
+
+    def test_original_meta_not_flagged(self):
+        cache = ResultCache()
+        original = _response()
+        cache.set("k", original)
+        cache.get("k")
+        assert original.meta.cached is False
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        cache.set("a", _response("A"))
+        cache.set("b", _response("B"))
+        cache.get("a")                      # "a" passa a ser el més recent
+        cache.set("c", _response("C"))      # expulsa "b"
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        cache = ResultCache(ttl_seconds=0)
+        cache.set("k", _response())
+        cache._entries["k"] = (cache._entries["k"][0] - 1, cache._entries["k"][1])
+        assert cache.get("k") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_disabled_cache_is_noop(self):
+        cache = ResultCache(enabled=False)
+        cache.set("k", _response())
+        assert cache.get("k") is None
+        assert cache.stats()["misses"] == 0
@@ -0,0 +1,106 @@
+"""
+Tests de l'arrencada: imports lleugers i inicialització concurrent
+"""
+import asyncio
+import subprocess
+import sys
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.google_vision_service import GoogleVisionService, google_vision_service
+from app.services.startup import Startup, startup
+from app.services.vision_fake import FakeImageAnnotatorClient
+from app.services.warmup import warm_image_processing, warm_parsers
+
+
+class TestImportPath:
+    def test_app_import_skips_heavy_modules(self):
+        code = (
+            "import sys, app.main\n"
+            "heavy = ['cv2', 'numpy', 'pytesseract', 'google.cloud.vision']\n"
+            "print('loaded:' + ','.join(m for m in heavy if m in sys.modules))\n"
+        )
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        assert out.stdout.strip().splitlines()[-1] == "loaded:"
+
+
+class TestStartup:
+    def test_steps_run_concurrently_with_timings(self):
+        boot = Startup()
+        steps = {"a": lambda: time.sleep(0.2), "b": lambda: time.sleep(0.2)}
+        asyncio.run(boot.run(steps))
+
+        stats = boot.stats()
+        assert stats["ready"]
+        assert set(stats["steps"]) == {"a", "b"}
+        assert all(step["status"] == "ok" for step in stats["steps"].values())
+        assert stats["init_ms"] < 350
+
+    def test_failed_step_reported(self):
+        def boom():
+            raise RuntimeError("sense credencials")
+
+        boot = Startup()
+        asyncio.run(boot.run({"google_vision": boom}))
+        assert boot.steps["google_vision"]["status"] == "error: sense credencials"
+
+    def test_ready_only_after_warmup(self):
+        boot = Startup()
+        seen = {}
+
+        async def warm():
+            seen["ready_during_warmup"] = boot.ready
+
+        asyncio.run(boot.run({"init": lambda: None}, warmup={"channel": warm}))
+        assert seen == {"ready_during_warmup": False}
+        assert boot.ready
+        assert boot.warmup["channel"]["status"] == "ok"
+
+
+class TestWarmup:
+    def test_parsers_and_opencv(self):
+        warm_parsers()
+        warm_image_processing()
+
+    def test_vision_channel_with_fake_client(self):
+        service = GoogleVisionService()
+        service.client = FakeImageAnnotatorClient()
+        asyncio.run(service.warm_up())
+
+    def test_vision_unavailable_raises(self):
+        service = GoogleVisionService()
+        service.client = None
+        with pytest.raises(RuntimeError):
+            asyncio.run(service.warm_up())
+
+
+class TestReadyEndpoint:
+    def test_starting_then_ready(self, monkeypatch):
+        client = TestClient(app)
+        monkeypatch.setattr(startup, "ready", False)
+        r = client.get("/ready")
+        assert r.status_code == 503
+        assert r.json()["status"] == "starting"
+
+        monkeypatch.setattr(startup, "ready", True)
+        monkeypatch.setattr(google_vision_service, "client", FakeImageAnnotatorClient())
+        r = client.get("/ready")
+        assert r.status_code == 200
+        assert r.json()["status"] == "ready"
+
+    def test_probes_do_not_initialize_engines(self, monkeypatch):
+        from app.services.tesseract_service import tesseract_service
+
+        def boom():
+            raise AssertionError("initialize() cridat des de l'event loop")
+
+        monkeypatch.setattr(tesseract_service, "_installed", None)
+        monkeypatch.setattr(tesseract_service, "initialize", boom)
+        monkeypatch.setattr(google_vision_service, "_initialized", False)
+        monkeypatch.setattr(google_vision_service, "initialize", boom)
+        monkeypatch.setattr(startup, "ready", True)
+        client = TestClient(app)
+
+        assert client.get("/health").json()["services"] == {"tesseract": False, "google_vision": False}
+        assert client.get("/ready").json()["status"] == "unavailable"
@@ -0,0 +1,141 @@
+"""
+Tests del servei Tesseract: pool de handles i OCR d'una sola passada
+"""
+import threading
+import time
+import cv2
+import numpy as np
+import pytesseract
+import pytest
+from PIL import Image
+from app.services.tesseract_service import TesseractEnginePool, TesseractService, _words_from_data
+
+# Sortida d'image_to_data (nivell 5 = paraula) per a dues línies i un segon paràgraf
+DATA = {
+    "level":     [1, 2, 3, 4, 5, 5, 4, 5, 3, 4, 5],
+    "block_num": [0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+    "par_num":   [0, 0, 1, 1, 1, 1, 1, 1, 2, 2, 2],
+    "line_num":  [0, 0, 0, 1, 1, 1, 2, 2, 0, 1, 1],
+    "text":      ["", "", "", "", "DOCUMENTO", "NACIONAL", "", "77612097T", "", "", "ESP"],
+    "conf":      ["-1", "-1", "-1", "-1", "96.5", "91", "-1", "88", "-1", "-1", "0"],
+    "left":      [0, 0, 0, 0, 10, 120, 0, 10, 0, 0, 10],
+    "top":       [0, 0, 0, 0, 5, 5, 0, 40, 0, 0, 80],
+    "width":     [0, 0, 0, 0, 100, 90, 0, 120, 0, 0, 30],
+    "height":    [0, 0, 0, 0, 20, 20, 0, 20, 0, 0, 20],
+}
+
+
+class TestWordsFromData:
+    def test_text_lines_and_paragraphs(self):
+        text, words = _words_from_data(DATA)
+        assert text == "DOCUMENTO NACIONAL\n77612097T\n\nESP\n"
+        assert [w["text"] for w in words] == ["DOCUMENTO", "NACIONAL", "77612097T", "ESP"]
+        assert words[0]["vertices"] == [(10, 5), (110, 5), (110, 25), (10, 25)]
+        assert words[0]["confidence"] == 96.5
+
+    def test_empty(self):
+        assert _words_from_data({k: [] for k in DATA}) == ("", [])
+
+
+class TestSinglePass:
+    def test_one_tesseract_call_per_image(self, monkeypatch):
+        calls = []
+
+        def image_to_data(image, **kwargs):
+            calls.append(kwargs)
+            return DATA
+
+        monkeypatch.setattr(pytesseract, "image_to_data", image_to_data)
+        service = TesseractService()
+        service._installed, service.backend = True, "pytesseract"
+
+        result = service.detect_text(Image.new("RGB", (50, 20), "white"))
+        assert len(calls) == 1
+        assert result["text"].startswith("DOCUMENTO NACIONAL")
+        assert result["confidence"] == round((96.5 + 91 + 88) / 3, 2)
+        assert len(result["annotations"]) == 4
+
+    def test_availability_cached(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(pytesseract, "get_tesseract_version", lambda: calls.append(1) or "5.3.0")
+        service = TesseractService()
+        for _ in range(5):
+            assert service.is_available()
+        assert len(calls) <= 1
+
+
+class _Handle:
+    def __init__(self):
+        self.ended = False
+
+    def End(self):
+        self.ended = True
+
+
+class TestEnginePool:
+    def test_reuses_handles(self):
+        created = []
+        pool = TesseractEnginePool(lambda: created.append(_Handle()) or created[-1], size=2)
+        for _ in range(5):
+            with pool.acquire():
+                pass
+        assert len(created) == 1
+
+    def test_bounded_under_concurrency(self):
+        created = []
+        pool = TesseractEnginePool(lambda: created.append(_Handle()) or created[-1], size=2)
+        in_use, peak = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with pool.acquire():
+                with lock:
+                    in_use[0] += 1
+                    peak[0] = max(peak[0], in_use[0])
+                time.sleep(0.02)
+                with lock:
+                    in_use[0] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(created) == 2
+        assert peak[0] == 2
+
+    def test_close_ends_handles(self):
+        handle = _Handle()
+        pool = TesseractEnginePool(lambda: handle, size=1)
+        with pool.acquire():
+            pass
+        pool.close()
+        assert handle.ended
+        assert pool.stats()["created"] == 0
+
+
+class TestTesserocrBackend:
+    """Camí real del pool (només si tesserocr i les dades d'idioma hi són)."""
+
+    def test_pool_path(self, monkeypatch):
+        pytest.importorskip("tesserocr")
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "tesseract_enabled", True)
+        service = TesseractService()
+        service.initialize()
+        if service.backend != "tesserocr":
+            pytest.skip("tesserocr sense dades d'idioma utilitzables")
+
+        img = np.full((120, 700, 3), 255, np.uint8)
+        cv2.putText(img, "DOCUMENTO NACIONAL", (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.6, (0, 0, 0), 3)
+        content = cv2.imencode(".png", img)[1].tobytes()
+        try:
+            first = service.detect_text(content)
+            service.detect_text(content)
+            assert "DOCUMENTO" in first["text"].upper()
+            assert first["annotations"]
+            assert service.pool.stats()["created"] == 1  # el handle es reutilitza
+        finally:
+            service.close()
+
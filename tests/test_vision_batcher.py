@@ -0,0 +1,183 @@
+"""
+Tests del micro-batching de Vision (coalescència de peticions concurrents)
+"""
+import asyncio
+from app.services.vision_batcher import VisionBatcher
+from app.services.google_vision_service import GoogleVisionService
+from app.services.vision_resilience import CircuitBreaker, Hedger
+from app.services.vision_fake import FakeImageAnnotatorClient, FakeImageAnnotatorAsyncClient
+from app.config import settings
+
+
+class _Recorder:
+    """annotate() fals: retorna el contingut com a text i registra la mida de cada lot."""
+
+    def __init__(self, fail_on: bytes = b""):
+        self.batches: list[int] = []
+        self.fail_on = fail_on
+
+    def __call__(self, contents: list[bytes]) -> list:
+        self.batches.append(len(contents))
+        return [ValueError("error imatge") if c == self.fail_on else {"text": c.decode()}
+                for c in contents]
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class TestVisionBatcher:
+    def test_concurrent_requests_coalesced(self):
+        rec = _Recorder()
+        batcher = VisionBatcher(rec, window_ms=20)
+
+        async def main():
+            return await asyncio.gather(*(batcher.submit(f"img{i}".encode()) for i in range(5)))
+
+        results = _run(main())
+        assert rec.batches == [5]
+        assert [r["text"] for r in results] == [f"img{i}" for i in range(5)]
+
+    def test_split_at_max_size(self):
+        rec = _Recorder()
+        batcher = VisionBatcher(rec, window_ms=20, max_size=16)
+
+        async def main():
+            return await asyncio.gather(*(batcher.submit(f"{i}".encode()) for i in range(20)))
+
+        results = _run(main())
+        assert sorted(rec.batches) == [4, 16]
+        assert [r["text"] for r in results] == [str(i) for i in range(20)]
+
+    def test_max_size_capped_at_vision_limit(self):
+        assert VisionBatcher(_Recorder(), max_size=100).max_size == 16
+
+    def test_split_at_max_bytes(self):
+        rec = _Recorder()
+        batcher = VisionBatcher(rec, window_ms=20, max_bytes=10)
+
+        async def main():
+            return await asyncio.gather(*(batcher.submit(b"123456") for _ in range(3)))
+
+        _run(main())
+        assert rec.batches == [1, 1, 1]
+
+    def test_per_item_error_routed(self):
+        rec = _Recorder(fail_on=b"bad")
+        batcher = VisionBatcher(rec, window_ms=20)
+
+        async def main():
+            return await asyncio.gather(batcher.submit(b"ok"), batcher.submit(b"bad"),
+                                        return_exceptions=True)
+
+        ok, bad = _run(main())
+        assert ok == {"text": "ok"}
+        assert isinstance(bad, ValueError)
+
+    def test_whole_batch_failure(self):
+        def boom(contents):
+            raise RuntimeError("rpc caiguda")
+
+        batcher = VisionBatcher(boom, window_ms=5)
+
+        async def main():
+            return await asyncio.gather(batcher.submit(b"a"), batcher.submit(b"b"),
+                                        return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in _run(main()))
+        assert batcher.stats()["batches"] == 1
+
+
+def _service(client) -> GoogleVisionService:
+    """Servei sense inicialitzar credencials, amb el client donat."""
+    service = GoogleVisionService.__new__(GoogleVisionService)
+    service.client = client
+    service.batcher = None
+    service._credentials = None
+    service._async_client = None
+    service._async_owner = (None, None)
+    service.hedger = Hedger(enabled=False)
+    service.breaker = CircuitBreaker(enabled=False)
+    return service
+
+
+class TestServiceBatch:
+    def test_batch_document_text_uses_one_rpc(self):
+        client = FakeImageAnnotatorClient(responder=lambda c: c.decode().upper())
+        results = _service(client).batch_document_text([b"abc", b"def"])
+        assert [r["text"] for r in results] == ["ABC", "DEF"]
+        assert client.calls["batch_annotate_images"] == 1
+        assert client.batch_sizes == [2]
+
+    def test_batch_error_per_image(self):
+        client = FakeImageAnnotatorClient(
+            responder=lambda c: RuntimeError("mala") if c == b"x" else "ok")
+        ok, err = _service(client).batch_document_text([b"y", b"x"])
+        assert ok["text"] == "ok"
+        assert isinstance(err, Exception)
+
+    def test_async_path_through_batcher(self):
+        client = FakeImageAnnotatorClient(responder=lambda c: c.decode())
+        service = _service(client)
+        service.batcher = VisionBatcher(service.batch_document_text, window_ms=20)
+
+        async def main():
+            return await asyncio.gather(*(service.detect_document_text_async(f"t{i}".encode())
+                                          for i in range(3)))
+
+        results = _run(main())
+        assert [r["text"] for r in results] == ["t0", "t1", "t2"]
+        assert client.batch_sizes == [3]
+        assert client.calls["document_text_detection"] == 0
+
+
+class TestAsyncClient:
+    def test_async_client_used_without_threads(self, monkeypatch):
+        monkeypatch.setattr(settings, "vision_async_enabled", True)
+        client = FakeImageAnnotatorClient(text="hola")
+        service = _service(client)
+
+        async def main():
+            result = await service.detect_document_text_async(b"img")
+            return result, service._get_async_client()
+
+        result, async_client = _run(main())
+        assert result["text"] == "hola"
+        assert isinstance(async_client, FakeImageAnnotatorAsyncClient)
+        assert client.calls["document_text_detection"] == 1
+
+    def test_async_client_recreated_per_loop(self, monkeypatch):
+        monkeypatch.setattr(settings, "vision_async_enabled", True)
+        service = _service(FakeImageAnnotatorClient())
+
+        async def get():
+            return service._get_async_client()
+
+        first = _run(get())
+        second = _run(get())
+        assert first is not second
+
+    def test_disabled_falls_back_to_threadpool(self, monkeypatch):
+        monkeypatch.setattr(settings, "vision_async_enabled", False)
+        client = FakeImageAnnotatorClient(text="sync")
+        service = _service(client)
+
+        async def main():
+            return service._get_async_client(), await service.detect_document_text_async(b"x")
+
+        async_client, result = _run(main())
+        assert async_client is None
+        assert result["text"] == "sync"
+
+    def test_batch_async(self, monkeypatch):
+        monkeypatch.setattr(settings, "vision_async_enabled", True)
+        client = FakeImageAnnotatorClient(responder=lambda c: c.decode())
+        service = _service(client)
+        service.batcher = VisionBatcher(service.batch_document_text_async, window_ms=20)
+
+        async def main():
+            return await asyncio.gather(*(service.detect_document_text_async(f"a{i}".encode())
+                                          for i in range(4)))
+
+        assert [r["text"] for r in _run(main())] == ["a0", "a1", "a2", "a3"]
+        assert client.batch_sizes == [4]
@@ -0,0 +1,267 @@
+"""
+Tests del hedging i del circuit breaker de Google Vision
+"""
+import asyncio
+import logging
+import pytest
+from fastapi import HTTPException
+from app.services import document_pipeline
+from app.services.vision_resilience import CircuitBreaker, CircuitOpenError, HedgeBudget, Hedger
+
+
+class TestCircuitBreaker:
+    def test_opens_over_failure_rate(self):
+        breaker = CircuitBreaker(failure_rate=0.5, min_requests=4, open_seconds=30)
+        for failed in (False, True, False, True):
+            assert breaker.allow()
+            breaker.record(failed)
+        assert breaker.state == "open"
+        assert not breaker.allow()
+        assert breaker.retry_after() >= 1
+
+    def test_needs_min_requests(self):
+        breaker = CircuitBreaker(failure_rate=0.5, min_requests=10)
+        for _ in range(5):
+            breaker.record(True)
+        assert breaker.state == "closed"
+
+    def test_half_open_single_probe_then_closes(self):
+        breaker = CircuitBreaker(failure_rate=0.5, min_requests=2, open_seconds=0)
+        breaker.record(True)
+        breaker.record(True)
+        assert breaker.state == "open"
+
+        assert breaker.allow()           # crida de prova
+        assert breaker.state == "half_open"
+        assert not breaker.allow()       # només una alhora
+        breaker.record(False)
+        assert breaker.state == "closed"
+        assert breaker.allow()
+
+    def test_half_open_failure_reopens(self):
+        breaker = CircuitBreaker(failure_rate=0.5, min_requests=2, open_seconds=0)
+        breaker.record(True)
+        breaker.record(True)
+        assert breaker.allow()
+        breaker.record(True)
+        assert breaker.state == "open"
+        assert breaker.opened_total == 2
+
+    def test_disabled_always_allows(self):
+        breaker = CircuitBreaker(min_requests=1, enabled=False)
+        breaker.record(True)
+        assert breaker.allow()
+        assert breaker.state == "closed"
+
+
+    def test_cancelled_call_not_counted(self):
+        breaker = CircuitBreaker(failure_rate=0.5, min_requests=2, open_seconds=0)
+        breaker.release()
+        assert breaker.stats()["error_rate"] == 0.0
+        breaker.record(True)
+        breaker.record(True)
+        assert breaker.allow()           # prova half-open
+        breaker.release()                # la prova es cancel·la
+        assert breaker.state == "half_open"
+        assert breaker.allow()           # una altra crida pot fer de prova
+
+
+class TestHedgeBudget:
+    def test_limits_extra_calls(self):
+        budget = HedgeBudget(ratio=0.1, burst=5)
+        spent = 0
+        for _ in range(100):
+            budget.on_request()
+            spent += budget.try_spend()
+        assert 9 <= spent <= 10
+
+    def test_burst_cap(self):
+        budget = HedgeBudget(ratio=1.0, burst=2)
+        for _ in range(10):
+            budget.on_request()
+        assert budget.try_spend() and budget.try_spend()
+        assert not budget.try_spend()
+
+
+def _warm(hedger: Hedger, seconds: float = 0.01, samples: int = 20) -> None:
+    for _ in range(samples):
+        hedger.latency.observe(seconds)
+
+
+class TestHedger:
+    def test_no_hedge_without_samples(self):
+        hedger = Hedger(enabled=True, min_samples=20)
+        assert hedger.delay() is None
+
+    def test_delay_clamped(self):
+        hedger = Hedger(enabled=True, min_delay_ms=50, max_delay_ms=100)
+        _warm(hedger, 0.001)
+        assert hedger.delay() == pytest.approx(0.05)
+        _warm(hedger, 10.0, samples=200)
+        assert hedger.delay() == pytest.approx(0.1)
+
+    def test_slow_primary_hedge_wins(self):
+        hedger = Hedger(enabled=True, min_delay_ms=10, max_delay_ms=10, budget_ratio=1.0)
+        _warm(hedger)
+        calls = []
+
+        async def call():
+            calls.append(len(calls))
+            await asyncio.sleep(1.0 if len(calls) == 1 else 0)
+            return f"call-{len(calls)}"
+
+        result = asyncio.run(hedger.run(call))
+        assert result == "call-2"
+        assert hedger.hedges == 1 and hedger.hedge_wins == 1
+
+    def test_on_hedge_called_once(self):
+        hedger = Hedger(enabled=True, min_delay_ms=10, max_delay_ms=10, budget_ratio=1.0)
+        _warm(hedger)
+        charged = []
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        assert asyncio.run(hedger.run(call, on_hedge=lambda: charged.append(1))) == "ok"
+        assert charged == [1]
+
+    def test_fast_primary_no_hedge(self):
+        hedger = Hedger(enabled=True, min_delay_ms=200, max_delay_ms=200, budget_ratio=1.0)
+        _warm(hedger)
+
+        async def call():
+            return "ok"
+
+        assert asyncio.run(hedger.run(call)) == "ok"
+        assert hedger.hedges == 0
+
+    def test_no_budget_waits_primary(self):
+        hedger = Hedger(enabled=True, min_delay_ms=10, max_delay_ms=10, budget_ratio=0.0)
+        _warm(hedger)
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "primary"
+
+        assert asyncio.run(hedger.run(call)) == "primary"
+        assert hedger.hedges == 0
+
+    def test_failed_primary_uses_hedge(self):
+        hedger = Hedger(enabled=True, min_delay_ms=10, max_delay_ms=10, budget_ratio=1.0)
+        _warm(hedger)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.sleep(0.05)
+                raise RuntimeError("primary failed")
+            await asyncio.sleep(0.1)
+            return "hedge"
+
+        assert asyncio.run(hedger.run(call)) == "hedge"
+
+
+class TestCircuitOpenFallback:
+    """Pipeline amb el circuit obert: Tesseract o 503 + Retry-After."""
+
+    @pytest.fixture
+    def circuit_open(self, monkeypatch):
+        async def raise_open(content, **kwargs):
+            raise CircuitOpenError(retry_after=12)
+
+        monkeypatch.setattr(document_pipeline.google_vision_service, "detect_document_text_async", raise_open)
+        monkeypatch.setattr(document_pipeline.google_vision_service, "is_available", lambda: True)
+
+    def _ocr(self):
+        return asyncio.run(document_pipeline._ocr_image(
+            None, b"img", None, False, "standard", logging.getLogger("ocr.test"),
+        ))
+
+    def test_503_without_fallback(self, circuit_open, monkeypatch):
+        monkeypatch.setattr(document_pipeline.settings, "vision_breaker_fallback_tesseract", False)
+        with pytest.raises(HTTPException) as e:
+            self._ocr()
+        assert e.value.status_code == 503
+        assert e.value.headers["Retry-After"] == "12"
+
+    def test_tesseract_fallback(self, circuit_open, monkeypatch):
+        from app.services.tesseract_service import tesseract_service
+
+        monkeypatch.setattr(document_pipeline.settings, "vision_breaker_fallback_tesseract", True)
+        monkeypatch.setattr(tesseract_service, "is_available", lambda: True)
+        monkeypatch.setattr(tesseract_service, "detect_text", lambda content: {"text": "T", "confidence": 70.0})
+        result, _ = self._ocr()
+        assert result["engine"] == "tesseract"
+        assert result["text"] == "T"
+
+
+class TestVisionTimeouts:
+    @pytest.fixture
+    def hanging(self, monkeypatch):
+        from app.services.google_vision_service import google_vision_service
+
+        async def hang(content):
+            await asyncio.sleep(10)
+
+        monkeypatch.setattr(google_vision_service, "is_available", lambda: True)
+        monkeypatch.setattr(google_vision_service, "_document_text_once", hang)
+        breaker = CircuitBreaker(failure_rate=0.5, min_requests=2)
+        monkeypatch.setattr(google_vision_service, "breaker", breaker)
+        return google_vision_service, breaker
+
+    def test_timeout_opens_breaker(self, hanging):
+        service, breaker = hanging
+
+        async def scenario():
+            for _ in range(2):
+                with pytest.raises(asyncio.TimeoutError):
+                    await service.detect_document_text_async(b"x", timeout=0.01)
+
+        asyncio.run(scenario())
+        assert breaker.state == "open"
+
+    def test_outside_cancel_not_counted(self, hanging):
+        service, breaker = hanging
+
+        async def scenario():
+            for _ in range(4):
+                task = asyncio.ensure_future(service.detect_document_text_async(b"x", timeout=5))
+                await asyncio.sleep(0.01)
+                task.cancel()  # p.ex. l'altra cara del DNI ha fallat
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+
+        asyncio.run(scenario())
+        assert breaker.state == "closed"
+        assert breaker.stats()["error_rate"] == 0.0
+
+    def test_no_time_left_not_counted(self, hanging):
+        service, breaker = hanging
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(service.detect_document_text_async(b"x", timeout=0))
+        assert breaker.stats()["error_rate"] == 0.0
+
+
+class TestHedgeCharge:
+    def test_hedge_charged_to_api_key(self, monkeypatch):
+        from app.services.api_keys import ApiClient, current_api_client
+        from app.services.google_vision_service import google_vision_service
+
+        async def hedged(content, on_hedge=None, timeout=None):
+            on_hedge()
+            return {"text": "T", "confidence": 90.0}
+
+        monkeypatch.setattr(document_pipeline.settings, "ocr_tesseract_first", False)
+        monkeypatch.setattr(google_vision_service, "is_available", lambda: True)
+        monkeypatch.setattr(google_vision_service, "detect_document_text_async", hedged)
+        client = ApiClient("ui", daily_vision_quota=10)
+        token = current_api_client.set(client)
+        try:
+            asyncio.run(document_pipeline._ocr_image(
+                None, b"img", None, False, "standard", logging.getLogger("ocr.test"),
+            ))
+        finally:
+            current_api_client.reset(token)
+        assert client.vision_credits == 2  # reserva + hedge